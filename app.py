@@ -1,15 +1,26 @@
 import os
 import re
+import csv
+import io
+import json
+import importlib
 import base64
 import uuid
-from io import BytesIO
-from datetime import datetime, timedelta, date
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import partial
+from datetime import datetime, timedelta, date, timezone
 
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, flash
+from flask import (Flask, Response, has_request_context, render_template, request, redirect, url_for, jsonify,
+                   send_file, flash, stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import BadRequest, ServiceUnavailable
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
 from config import Config
-import qrcode
 
 # optional libs
 try:
@@ -17,12 +28,26 @@ try:
 except Exception:
     np = None
 
+# FACE_BACKEND swaps in a module with the same face_locations / face_encodings API
+# (benchmarks/standin_face.py); face_compute's pool workers import the same one.
 try:
-    import face_recognition
+    face_recognition = importlib.import_module(os.getenv("FACE_BACKEND", "face_recognition"))
 except Exception:
     face_recognition = None
 
 from flask_migrate import Migrate
+from flask.cli import AppGroup
+import click
+from face_compute import (FacePool, FaceBusy, FaceTimeout, decode_image, load_image,
+                          locate_and_encode, locate_and_encode_many, average_hash, hamming)
+from embedding_store import EmbeddingStore, is_store_ref, store_ref, STORE_REF_PREFIX
+from cooldown import make_cooldown
+from event_feed import EventBroker
+from db_writer import SingleWriter
+from write_behind import WriteBehindBuffer, Backlogged
+import qr_cache
+from search import SearchSpec, make_search_index
+from qr_sheet import SheetLayout, PdfWriter, render_pages, pdf_stream
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -31,12 +56,67 @@ app.config.from_object(Config)
 app.config.setdefault("FACE_FOLDER", os.path.join(os.getcwd(), "face_data"))
 app.config.setdefault("OPERATOR_PASSWORD", "admin123")
 app.config.setdefault("QR_FOLDER", os.path.join(os.getcwd(), "qrcodes"))
+app.config.setdefault("QR_CACHE_MAX_AGE", 30 * 24 * 3600)  # seconds browsers/printers keep a QR before revalidating
+app.config.setdefault("SEARCH_BACKEND", os.getenv("SEARCH_BACKEND", "auto"))  # auto | fts5 | mysql | trigram
+app.config.setdefault("QR_SHEET_DPI", int(os.getenv("QR_SHEET_DPI", "300")))
+app.config.setdefault("FACE_MATCH_TOLERANCE", 0.5)  # max euclidean distance for a match
+app.config.setdefault("FACE_REF_CACHE_SIZE", 1024)  # reference encodings kept in memory
+app.config.setdefault("FACE_POOL_WORKERS", int(os.getenv("FACE_POOL_WORKERS", "2")))  # 0 = run inline
+app.config.setdefault("FACE_POOL_QUEUE", 8)       # jobs allowed to wait beyond the busy workers
+app.config.setdefault("FACE_JOB_TIMEOUT", 10.0)   # seconds per face job
+app.config.setdefault("FACE_VERIFY_BATCH_MAX", 64)  # items per /api/face/verify-batch request
+# Probe preprocessing before HOG detection (benchmarks/detect_scales.py helps pick these)
+app.config.setdefault("FACE_DETECT_MAX_DIM", 640)     # longest side detection runs on; 0 = full size
+app.config.setdefault("FACE_DETECT_GRAYSCALE", False)
+app.config.setdefault("FACE_DETECT_ROI", None)        # (x0, y0, x1, y1) fractions, e.g. (0.2, 0, 0.8, 1)
+# Kiosks resend near-identical frames; reuse the last result for the same kiosk/sid
+app.config.setdefault("FACE_PROBE_DEDUP_SECONDS", 5.0)  # 0 disables
+app.config.setdefault("FACE_PROBE_DEDUP_BITS", 4)       # max average-hash distance (of 64 bits)
+app.config.setdefault("FACE_ENROLL_ASYNC", True)  # encode enrolment frames in the background
+app.config.setdefault("FACE_ENROLL_THREADS", 2)   # concurrent background enrolment jobs
+app.config.setdefault("FACE_GALLERY_PRELOAD", os.getenv("FACE_GALLERY_PRELOAD", "1") == "1")  # at app start
+app.config.setdefault("COOLDOWN_BACKEND", os.getenv(
+    "COOLDOWN_BACKEND", "sqlite:///" + os.path.join(app.instance_path, "cooldowns.db")))  # or "memory"
+app.config.setdefault("HOT_CACHE_TTL", 5.0)  # seconds a cached OPEN/CLOSED session state is trusted
+app.config.setdefault("DASHBOARD_TTL", 10.0)  # seconds between home page counter rebuilds
+# Live activity feed (/api/events)
+app.config.setdefault("EVENTS_BUFFER", 500)            # recent events kept for Last-Event-ID resume
+app.config.setdefault("EVENTS_POLL_SECONDS", 1.0)      # how soon other workers' rows show up
+app.config.setdefault("EVENTS_HEARTBEAT_SECONDS", 15.0)
+app.config.setdefault("EVENTS_MAX_SECONDS", 300.0)     # stream length before the browser reconnects
+# ids re-read below the newest on each poll, for rows whose ids commit out of order
+# (InnoDB auto-increment); SQLite serialises writers, so it needs none
+app.config.setdefault("EVENTS_LOOKBACK_IDS", int(os.getenv(
+    "EVENTS_LOOKBACK_IDS", "0" if app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite") else "100")))
+# Write-behind scan ingestion: ack once journaled, commit in batches (write_behind.py)
+app.config.setdefault("SCAN_WRITE_BEHIND", os.getenv("SCAN_WRITE_BEHIND", "0") == "1")
+app.config.setdefault("SCAN_JOURNAL_DIR", os.getenv("SCAN_JOURNAL_DIR", os.path.join(app.instance_path, "scan_journal")))
+app.config.setdefault("SCAN_JOURNAL_FSYNC", os.getenv("SCAN_JOURNAL_FSYNC", "1") == "1")  # 0: survives a worker crash, not a power cut
+app.config.setdefault("SCAN_FLUSH_MS", 50)
+app.config.setdefault("SCAN_FLUSH_ROWS", 500)
 
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
 
+def _migrate_include_name(name, type_, parent_names):
+    # the full-text search tables (books_fts, ... and FTS5's shadow tables) belong to search.py
+    return not (type_ == "table" and "_fts" in (name or ""))
+
+migrate = Migrate(app, db, include_name=_migrate_include_name)
+
+from sqlalchemy import event
 from sqlalchemy.sql import func
 
+def _sqlite_pragmas(dbapi_conn, _record):
+    # config.engine_profile: WAL, busy_timeout, synchronous, mmap for this profile
+    cur = dbapi_conn.cursor()
+    for name, value in app.config["SQLITE_PRAGMAS"].items():
+        cur.execute(f"PRAGMA {name}={value}")
+    cur.close()
+
+with app.app_context():
+    if db.engine.dialect.name == "sqlite" and app.config.get("SQLITE_PRAGMAS"):
+        event.listen(db.engine, "connect", _sqlite_pragmas)
+
 ts = db.Column(db.DateTime, server_default=func.now())
 
 
@@ -74,6 +154,22 @@ class Borrow(db.Model):
     due_dt = db.Column(db.DateTime, nullable=False)
     return_dt = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(16), default="BORROWED")  # BORROWED / RETURNED
+    __table_args__ = (
+        db.Index("ix_borrows_book_status_dt", "book_bid", "status", "borrow_dt"),  # api_return
+        db.Index("ix_borrows_student_dt", "student_sid", "borrow_dt"),             # api_history
+    )
+
+class FaceEnrollJob(db.Model):
+    __tablename__ = "face_enroll_jobs"
+    id = db.Column(db.String(32), primary_key=True)  # uuid hex, returned to the client
+    student_sid = db.Column(db.String(32), db.ForeignKey("students.sid"), nullable=False)
+    prefix = db.Column(db.String(50), nullable=False)
+    frame_count = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(16), default="PENDING")  # PENDING / RUNNING / DONE / FAILED
+    message = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
 
 # Classes / attendance
 class ClassRoom(db.Model):
@@ -93,6 +189,7 @@ class AttendanceSession(db.Model):
     end_time = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(16), default="OPEN")  # OPEN / CLOSED
     classroom = db.relationship("ClassRoom")
+    __table_args__ = (db.Index("ix_attendance_sessions_class_date_status", "class_id", "date_", "status"),)
 
 class AttendanceRecord(db.Model):
     __tablename__ = "attendance_records"
@@ -118,8 +215,20 @@ class LabLog(db.Model):
     lab_id = db.Column(db.Integer, db.ForeignKey("labs.id"), nullable=False)
     student_sid = db.Column(db.String(32), db.ForeignKey("students.sid"), nullable=False)
     action = db.Column(db.String(8), nullable=False)  # ENTRY or EXIT
-    ts = db.Column(db.DateTime, server_default=func.now(), nullable=False, index=True)
+    # set in Python (with microseconds) so it sorts and compares like the keyset cursor
+    ts = db.Column(db.DateTime, default=datetime.utcnow, server_default=func.now(), nullable=False, index=True)
     lab = db.relationship("Lab")
+    __table_args__ = (db.Index("ix_lab_logs_lab_student_ts", "lab_id", "student_sid", "ts"),)
+
+class LabPresence(db.Model):
+    """Current in/out state per (lab, student), written in the same transaction as each LabLog."""
+    __tablename__ = "lab_presence"
+    lab_id = db.Column(db.Integer, db.ForeignKey("labs.id"), primary_key=True)
+    student_sid = db.Column(db.String(32), db.ForeignKey("students.sid"), primary_key=True)
+    inside = db.Column(db.Boolean, nullable=False, default=False)
+    last_log_id = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (db.Index("ix_lab_presence_lab_inside", "lab_id", "inside"),)  # occupancy count
 
 # Hostel
 class HostelLog(db.Model):
@@ -128,7 +237,7 @@ class HostelLog(db.Model):
     gate = db.Column(db.String(80), default="Main Gate")
     student_sid = db.Column(db.String(32), db.ForeignKey("students.sid"), nullable=False)
     action = db.Column(db.String(8), nullable=False)  # ENTRY or EXIT
-    ts = db.Column(db.DateTime, server_default=func.now(), nullable=False, index=True)
+    ts = db.Column(db.DateTime, default=datetime.utcnow, server_default=func.now(), nullable=False, index=True)
 
 
 # =========================
@@ -139,12 +248,26 @@ def ensure_dirs():
     os.makedirs(app.config["QR_FOLDER"], exist_ok=True)
     os.makedirs(app.config["FACE_FOLDER"], exist_ok=True)
 
-def save_qr(filename, data):
-    ensure_dirs()
-    path = os.path.join(app.config["QR_FOLDER"], filename)
-    img = qrcode.make(data)
-    img.save(path)
-    return path
+@app.errorhandler(BadRequest)
+def _api_bad_request(e):
+    # API callers get the usual {"ok": False, "error": ...} body, not an HTML page
+    if request.path.startswith("/api/"):
+        return jsonify({"ok": False, "error": e.description}), 400
+    return e
+
+# QR codes are rendered on first request into a content-addressed cache (qr_cache.py)
+_QR_NAME = re.compile(r"^(student|book)_(.+)\.png$")
+
+def qr_payload(filename):
+    """"student_<sid>.png" / "book_<bid>.png" => (kind, id, payload), else None."""
+    m = _QR_NAME.match(filename)
+    if not m:
+        return None
+    kind, ident = m.groups()
+    return kind, ident, f"{kind.upper()}:{ident}"
+
+def qr_cache_path(key):
+    return qr_cache.cache_path(app.config["QR_FOLDER"], key)
 
 def _b64_to_bytes(data_url):
     # accepts "data:image/png;base64,...."
@@ -159,94 +282,172 @@ def _b64_to_bytes(data_url):
             return None
     return base64.b64decode(m.group(2))
 
-def save_face_images_and_encoding(sid, images_dataurls):
+# binary upload content types => file extension used in FACE_FOLDER
+_FACE_UPLOAD_TYPES = {"image/jpeg": "jpg", "image/webp": "webp", "image/png": "png",
+                      "application/octet-stream": "bin"}
+
+def _face_frame_path(prefix, i, ext="png"):
+    return os.path.join(app.config["FACE_FOLDER"], f"{prefix}_{i}.{ext}")
+
+def _face_frame_paths(prefix):
+    """Saved frames of an enrolment prefix, in capture order."""
+    folder = app.config["FACE_FOLDER"]
+    frames = []
+    for name in os.listdir(folder) if os.path.isdir(folder) else []:
+        if not name.startswith(prefix + "_"):
+            continue
+        idx, _, _ext = name[len(prefix) + 1:].partition(".")
+        if idx.isdigit():
+            frames.append((int(idx), os.path.join(folder, name)))
+    return [p for _, p in sorted(frames)]
+
+def save_face_frames(sid, frames):
     """
-    images_dataurls: list of data URLs (base64). Save raw images and attempt to compute face encoding.
-    Returns (ok, message, encoding_path_or_none, prefix)
+    Writes each frame to FACE_FOLDER as {prefix}_{i}.{ext} and fsyncs it. A frame is
+    either a base64 data URL or an uploaded FileStorage (multipart part / raw body),
+    which is streamed straight to disk without a base64 round-trip.
+    Returns (prefix, saved_paths).
     """
     ensure_dirs()
     prefix = f"{sid}_{uuid.uuid4().hex}"
     saved_paths = []
-    for i, d in enumerate(images_dataurls):
-        b = _b64_to_bytes(d)
-        if not b:
-            continue
-        fname = f"{prefix}_{i}.png"
-        fpath = os.path.join(app.config["FACE_FOLDER"], fname)
-        with open(fpath, "wb") as f:
-            f.write(b)
+    for d in frames:
+        if isinstance(d, FileStorage):
+            ext = _FACE_UPLOAD_TYPES.get(d.mimetype, "bin")
+            fpath = _face_frame_path(prefix, len(saved_paths), ext)
+            with open(fpath, "wb") as f:
+                d.save(f)
+                if not f.tell():
+                    f.close()
+                    os.remove(fpath)
+                    continue
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            b = _b64_to_bytes(d)
+            if not b:
+                continue
+            fpath = _face_frame_path(prefix, len(saved_paths))
+            with open(fpath, "wb") as f:
+                f.write(b)
+                f.flush()
+                os.fsync(f.fileno())
         saved_paths.append(fpath)
+    return prefix, saved_paths
 
+def encode_face_frames(prefix, saved_paths, wait=0):
+    """
+    Averages the first face encoding found in each saved frame and appends it to the
+    embedding store under the prefix. Returns (message, encoding_ref_or_none,
+    encoding_or_none).
+    """
+    if not (face_recognition and np):
+        # face_recognition missing — just save images and mark enrolled
+        return "Saved images (face_recognition not available)", None, None
+
+    # take first face found from each image (if any) and average them
+    imgs = []
+    for p in saved_paths:
+        try:
+            imgs.append(load_image(p))
+        except Exception:
+            continue
+    results = face_pool.run(
+        partial(locate_and_encode_many, **_detect_opts()), imgs,
+        timeout=app.config["FACE_JOB_TIMEOUT"] * max(len(imgs), 1), wait=wait
+    ) if imgs else []
+    encs = [e[0] for _, e in results if len(e)]
+    if not encs:
+        # no encodings found but images saved — still mark enrolled but warn
+        return "Saved images but no face encoding found (face_recognition couldn't detect)", None, None
+
+    # average encodings
+    avg = np.array(encs).mean(axis=0)
+    sid = prefix.rsplit("_", 1)[0]
+    enc_path = get_embedding_store().append(sid, prefix, avg)
+    return "Saved images and encoding", enc_path, avg
+
+def save_face_images_and_encoding(sid, images_dataurls):
+    """
+    images_dataurls: list of data URLs (base64). Save raw images and attempt to compute face encoding.
+    Returns (ok, message, encoding_path_or_none, prefix)
+    """
+    prefix, saved_paths = save_face_frames(sid, images_dataurls)
     if not saved_paths:
         return False, "No valid images received", None, None
+    msg, enc_path, _enc = encode_face_frames(prefix, saved_paths)
+    return True, msg, enc_path, prefix
 
-    # attempt to compute encoding using face_recognition
-    if face_recognition and np:
-        # take first face found from each image (if any) and average them
-        encs = []
-        for p in saved_paths:
-            try:
-                img = face_recognition.load_image_file(p)
-                fcoords = face_recognition.face_locations(img, model="hog")
-                if not fcoords:
-                    continue
-                e = face_recognition.face_encodings(img, known_face_locations=fcoords)
-                if e:
-                    encs.append(e[0])
-            except Exception:
-                continue
-        if encs:
-            # average encodings
-            arr = np.array(encs)
-            avg = arr.mean(axis=0)
-            enc_path = os.path.join(app.config["FACE_FOLDER"], f"{prefix}_enc.npy")
-            np.save(enc_path, avg)
-            return True, "Saved images and encoding", enc_path, prefix
-        else:
-            # no encodings found but images saved — still mark enrolled but warn
-            return True, "Saved images but no face encoding found (face_recognition couldn't detect)", None, prefix
-    else:
-        # face_recognition missing — just save images and mark enrolled
-        return True, "Saved images (face_recognition not available)", None, prefix
+_embedding_store = None
+
+def get_embedding_store():
+    """The consolidated embedding store under FACE_FOLDER (see embedding_store.py)."""
+    global _embedding_store
+    if _embedding_store is None or _embedding_store.folder != app.config["FACE_FOLDER"]:
+        _embedding_store = EmbeddingStore(app.config["FACE_FOLDER"])
+    return _embedding_store
 
 def load_encoding(enc_path):
+    """enc_path is either a store ref ("store:<prefix>") or a legacy per-enrolment .npy path."""
     if not enc_path or not np:
         return None
     try:
+        if is_store_ref(enc_path):
+            return get_embedding_store().get(enc_path[len(STORE_REF_PREFIX):])
         return np.load(enc_path)
     except Exception:
         return None
 
-def compare_face_encoding(enc_path, image_dataurl, tolerance=0.6):
+def _detect_opts():
+    return {
+        "max_dim": app.config["FACE_DETECT_MAX_DIM"],
+        "grayscale": app.config["FACE_DETECT_GRAYSCALE"],
+        "roi": app.config["FACE_DETECT_ROI"],
+    }
+
+def _locate_and_encode(img, wait=0):
+    """Detection + encoding of one decoded image on the face pool, with the configured preprocessing."""
+    return face_pool.run(partial(locate_and_encode, **_detect_opts()), img, wait=wait)
+
+def _probe_encoding(b, sid=None):
     """
-    Returns (bool, info). enc_path is path to saved .npy encoding.
+    Returns (encoding, None) for the first face found in encoded probe image bytes,
+    or (None, error). Detection runs on the face pool, so FaceBusy / FaceTimeout
+    propagate to the caller.
     """
-    if not face_recognition or not np:
-        return False, "Face library not available"
-
-    b = _b64_to_bytes(image_dataurl)
     if not b:
-        return False, "Invalid image"
+        return None, "Invalid image"
 
     try:
-        buf = BytesIO(b)
-        img = face_recognition.load_image_file(buf)
+        img = decode_image(b)
     except Exception:
-        try:
-            img = face_recognition.load_image_file(BytesIO(b))
-        except Exception:
-            return False, "Cannot read image for verification"
+        return None, "Cannot read image for verification"
 
-    fcoords = face_recognition.face_locations(img, model="hog")
-    if not fcoords:
-        return False, "No face detected in provided image"
     try:
-        encs = face_recognition.face_encodings(img, known_face_locations=fcoords)
-        if not encs:
-            return False, "No face encodings found"
-        probe = encs[0]
+        fcoords, encs = _probe_locate_and_encode(img, sid)
+    except (FaceBusy, FaceTimeout):
+        raise
     except Exception:
-        return False, "Failed to compute encoding"
+        return None, "Failed to compute encoding"
+    if not fcoords:
+        return None, "No face detected in provided image"
+    if not encs:
+        return None, "No face encodings found"
+    return encs[0], None
+
+def compare_face_encoding(enc_path, image_dataurl, tolerance=0.6):
+    """
+    Returns (bool, info). enc_path is path to saved .npy encoding.
+    """
+    if not face_recognition or not np:
+        return False, "Face library not available"
+
+    try:
+        probe, err = _probe_encoding(_b64_to_bytes(image_dataurl))
+    except (FaceBusy, FaceTimeout) as e:
+        return False, str(e)
+    if probe is None:
+        return False, err
 
     ref = load_encoding(enc_path)
     if ref is None:
@@ -254,6 +455,344 @@ def compare_face_encoding(enc_path, image_dataurl, tolerance=0.6):
     dist = np.linalg.norm(ref - probe)
     return (dist <= tolerance), f"distance={float(dist):.4f}"
 
+face_pool = FacePool(
+    workers=app.config["FACE_POOL_WORKERS"],
+    max_queue=app.config["FACE_POOL_QUEUE"],
+    timeout=app.config["FACE_JOB_TIMEOUT"],
+)
+
+def _face_pool_error(e):
+    """JSON response for a job the face pool refused (busy) or gave up on (timeout)."""
+    if isinstance(e, FaceBusy):
+        return jsonify({"ok": False, "busy": True, "error": str(e)}), 503
+    return jsonify({"ok": False, "error": str(e)}), 504
+
+# =========================
+# Face gallery (1:N identification)
+# =========================
+
+class FaceGallery:
+    """
+    Every enrolled encoding held as one contiguous float32 matrix, so a probe is
+    matched against the whole roster with a single vectorized distance computation.
+    Rows are keyed by Student.face_encoding_path; re-enrolling a student overwrites
+    their existing row in place. `stamp` is the embedding store state it was built
+    from, so get_face_gallery() can tell when another worker has enrolled someone.
+    """
+
+    def __init__(self, dim=128):
+        self.dim = dim
+        self.loaded = False
+        self.stamp = None
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._size = 0
+        self._sids = []
+        self._paths = []
+        self._row_by_path = {}
+        self._row_by_sid = {}
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, enc_path):
+        return enc_path in self._row_by_path
+
+    def load(self, store, legacy=(), stamp=None):
+        """
+        Replaces the whole gallery: the latest encoding of every sid in the embedding
+        store (one copy of its mapped matrix, no per-student reads), plus `legacy`
+        (sid, .npy path) rows for students whose encoding is not in the store yet.
+        """
+        sids, versions, matrix = store.latest()
+        paths = [store_ref(v) for v in versions]
+        in_store, vecs = set(sids), []
+        for sid, enc_path in legacy:
+            enc = load_encoding(enc_path) if sid not in in_store else None
+            if enc is None or enc.size != self.dim:
+                continue
+            sids.append(sid)
+            paths.append(enc_path)
+            vecs.append(enc.astype(np.float32).reshape(1, self.dim))
+        if vecs:
+            matrix = np.vstack([matrix] + vecs)
+        with self._lock:
+            self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+            self._size = len(sids)
+            self._sids = sids
+            self._paths = paths
+            self._row_by_path = {p: i for i, p in enumerate(paths)}
+            self._row_by_sid = {sid: i for i, sid in enumerate(sids)}
+            self.stamp = stamp
+            self.loaded = True
+
+    def upsert(self, sid, enc_path, encoding):
+        vec = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            row = self._row_by_sid.get(sid)
+            if row is None:
+                row = self._size
+                if self._matrix is None or row == len(self._matrix):
+                    # grow geometrically so repeated enrolments stay amortised O(1)
+                    grown = np.zeros((max(16, 2 * row), self.dim), dtype=np.float32)
+                    if row:
+                        grown[:row] = self._matrix[:row]
+                    self._matrix = grown
+                self._size += 1
+                self._sids.append(sid)
+                self._paths.append(enc_path)
+            else:
+                self._row_by_path.pop(self._paths[row], None)
+                self._paths[row] = enc_path
+            self._matrix[row] = vec
+            self._row_by_sid[sid] = row
+            self._row_by_path[enc_path] = row
+
+    def nearest(self, probe):
+        """Returns (sid, distance) of the closest enrolled face, or (None, None) if empty."""
+        probe = np.asarray(probe, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            if not self._size:
+                return None, None
+            diffs = self._matrix[:self._size] - probe
+            dists = np.sqrt(np.einsum("ij,ij->i", diffs, diffs))
+            i = int(np.argmin(dists))
+            return self._sids[i], float(dists[i])
+
+face_gallery = FaceGallery()
+
+class ReferenceEncodingCache:
+    """
+    Bounded LRU of reference encodings, one entry per sid. An entry is only served
+    while the student's encoding path and its file mtime still match, so a re-enrol
+    or an overwritten .npy is picked up without an explicit flush.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # sid => (enc_path, mtime, encoding)
+
+    def get(self, sid, enc_path):
+        try:
+            # store rows are immutable per version, so only legacy .npy files need an mtime
+            mtime = 0 if is_store_ref(enc_path) else os.path.getmtime(enc_path)
+        except (OSError, TypeError):
+            return None
+        with self._lock:
+            hit = self._items.get(sid)
+            if hit and hit[0] == enc_path and hit[1] == mtime:
+                self._items.move_to_end(sid)
+                return hit[2]
+        enc = load_encoding(enc_path)
+        if enc is None:
+            return None
+        with self._lock:
+            self._items[sid] = (enc_path, mtime, enc)
+            self._items.move_to_end(sid)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return enc
+
+    def invalidate(self, sid):
+        with self._lock:
+            self._items.pop(sid, None)
+
+ref_cache = ReferenceEncodingCache(app.config["FACE_REF_CACHE_SIZE"])
+
+class ProbeDedupCache:
+    """
+    Remembers the last probe seen per (kiosk, sid) with its average hash and its
+    detection + encoding result. A new probe from the same kiosk/sid within `window`
+    seconds whose hash is at most `max_bits` away reuses that result instead of
+    running HOG detection and the encoder again.
+    """
+
+    def __init__(self, window, max_bits, maxsize=4096):
+        self.window = window
+        self.max_bits = max_bits
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # (kiosk, sid) => (ahash, expires_at, result)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, ahash):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._items.get(key)
+            if hit and hit[1] > now and hamming(hit[0], ahash) <= self.max_bits:
+                self.hits += 1
+                return hit[2]
+            self.misses += 1
+            return None
+
+    def put(self, key, ahash, result):
+        with self._lock:
+            self._items[key] = (ahash, time.monotonic() + self.window, result)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "window": self.window,
+                "max_bits": self.max_bits,
+                "entries": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+probe_dedup = ProbeDedupCache(app.config["FACE_PROBE_DEDUP_SECONDS"], app.config["FACE_PROBE_DEDUP_BITS"])
+
+def _kiosk_id():
+    if not has_request_context():
+        return "-"
+    return request.headers.get("X-Kiosk-Id") or request.remote_addr or "-"
+
+def _probe_locate_and_encode(img, sid=None, wait=0):
+    """
+    _locate_and_encode for a live probe, short-circuited through probe_dedup when the
+    same kiosk just sent a near-identical frame for the same sid. Failed detections
+    are reused too; a resend of the same empty frame would fail the same way.
+    Identify probes (no sid) are never deduplicated: the next person at the kiosk
+    looks much the same to an average hash and would get the previous identity.
+    """
+    if not probe_dedup.window or not sid:
+        return _locate_and_encode(img, wait=wait)
+    key = (_kiosk_id(), sid)
+    ahash = average_hash(img)
+    result = probe_dedup.get(key, ahash)
+    if result is None:
+        result = _locate_and_encode(img, wait=wait)
+        probe_dedup.put(key, ahash, result)
+    return result
+
+def _reference_encoding(s):
+    """
+    Returns (encoding, None) for a student's enrolled face, or (None, error).
+    When only the enrolled image exists, its encoding is computed once and saved to
+    the embedding store so later verifications never re-run detection on it.
+    """
+    enc = ref_cache.get(s.sid, s.face_encoding_path)
+    if enc is not None:
+        return enc, None
+
+    ref_img = load_image(s.face_image)
+    ref_locs, ref_encs = _locate_and_encode(ref_img)
+    if not ref_locs:
+        return None, "No face detected in enrolled image"
+    if not ref_encs:
+        return None, "No face encoding in enrolled image"
+
+    prefix = s.face_images_prefix or f"{s.sid}_{uuid.uuid4().hex}"
+    enc_path = get_embedding_store().append(s.sid, prefix, ref_encs[0])
+    s.face_encoding_path = enc_path
+    db.session.commit()
+    if face_gallery.loaded:
+        face_gallery.upsert(s.sid, enc_path, ref_encs[0])
+    return ref_encs[0], None
+
+_gallery_load_lock = threading.Lock()
+
+def get_face_gallery():
+    """
+    The identify gallery, rebuilt whenever the embedding store has changed since it
+    was loaded, by an enrolment in this or any other worker (a stat of the store's
+    index per call). Enrolments in this process are also upserted right away.
+    """
+    store = get_embedding_store()
+    store.refresh()
+    if face_gallery.loaded and face_gallery.stamp == (store.folder, store.stamp):
+        return face_gallery
+    with _gallery_load_lock:
+        stamp = (store.folder, store.stamp)   # taken before reading, so a later append still triggers a reload
+        if not face_gallery.loaded or face_gallery.stamp != stamp:
+            legacy = (db.session.query(Student.sid, Student.face_encoding_path)
+                      .filter(Student.face_encoding_path.isnot(None),
+                              Student.face_encoding_path.notlike(STORE_REF_PREFIX + "%"))
+                      .all())
+            face_gallery.load(store, legacy, stamp=stamp)
+    return face_gallery
+
+def _preload_face_gallery():
+    # gunicorn imports the app once per worker, so every worker starts with it in memory
+    if np is None or not app.config["FACE_GALLERY_PRELOAD"]:
+        return
+    with app.app_context():
+        try:
+            get_face_gallery()
+        except SQLAlchemyError:
+            pass  # no schema yet (before `flask db upgrade`); loaded by the first identify
+
+_preload_face_gallery()
+
+# =========================
+# Background face enrolment
+# =========================
+
+_enroll_executor = ThreadPoolExecutor(
+    max_workers=app.config["FACE_ENROLL_THREADS"], thread_name_prefix="face-enroll"
+)
+ENROLL_JOB_STALE_SECONDS = 60
+ENROLL_JOB_RUNNING_SECONDS = 600  # a RUNNING job untouched this long lost its worker
+
+def _apply_face_enrollment(s, prefix, enc_path):
+    """Points the student row at a freshly saved prefix (caller commits)."""
+    frames = _face_frame_paths(prefix)
+    if frames:
+        s.face_image = frames[0]
+    if enc_path:
+        s.face_encoding_path = enc_path
+    s.face_images_prefix = prefix
+
+def _run_enroll_job(job_id):
+    with app.app_context():
+        # claim the job; a no-op if another thread/worker already picked it up
+        claimed = FaceEnrollJob.query.filter_by(id=job_id, status="PENDING").update(
+            {"status": "RUNNING", "updated_at": datetime.utcnow()})
+        db.session.commit()
+        if not claimed:
+            return
+        job = db.session.get(FaceEnrollJob, job_id)
+        paths = _face_frame_paths(job.prefix)
+        try:
+            msg, enc_path, enc = encode_face_frames(job.prefix, paths, wait=app.config["FACE_JOB_TIMEOUT"])
+        except Exception as e:
+            db.session.rollback()
+            job.status = "FAILED"
+            job.message = f"Encoding failed: {e}"[:200]
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return
+
+        s = Student.query.filter_by(sid=job.student_sid).first()
+        if s:
+            _apply_face_enrollment(s, job.prefix, enc_path)
+        job.status = "DONE"
+        job.message = msg
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        ref_cache.invalidate(job.student_sid)
+        if enc_path and face_gallery.loaded:
+            face_gallery.upsert(job.student_sid, enc_path, enc)
+
+def _requeue_stuck_enroll_job(job_id):
+    """
+    Puts a job back to PENDING if it has been RUNNING for ENROLL_JOB_RUNNING_SECONDS
+    without an update (its worker crashed or was killed). True if this call did it.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=ENROLL_JOB_RUNNING_SECONDS)
+    requeued = FaceEnrollJob.query.filter(
+        FaceEnrollJob.id == job_id, FaceEnrollJob.status == "RUNNING",
+        func.coalesce(FaceEnrollJob.updated_at, FaceEnrollJob.created_at) < cutoff,
+    ).update({"status": "PENDING", "message": "Requeued after its worker stopped"}, synchronize_session=False)
+    db.session.commit()
+    return bool(requeued)
+
 # =========================
 # Demo seed
 # =========================
@@ -287,35 +826,169 @@ def seed_demo():
         ])
     db.session.commit()    
 
+# =========================
+# Hot queries (shared with `flask check-query-plans`)
+# =========================
+
+def _lab_occupancy_q(lab_id):
+    return LabPresence.query.filter_by(lab_id=lab_id, inside=True)
+
+def _active_borrow_q(bid):
+    return Borrow.query.filter_by(book_bid=bid, status="BORROWED").order_by(Borrow.borrow_dt.desc())
+
+def _student_borrows_q(sid):
+    return Borrow.query.filter_by(student_sid=sid).order_by(Borrow.borrow_dt.desc())
+
+def _open_session_q(class_id, day):
+    return AttendanceSession.query.filter_by(class_id=class_id, date_=day, status="OPEN")
+
+# =========================
+# Dashboard counters
+# =========================
+
+def _dashboard_counts(today):
+    """
+    Rebuilds every home page counter in one round trip (scalar subqueries). "Today"
+    is a half-open ts range rather than date(ts) == today, so the ts indexes apply.
+    """
+    start = datetime.combine(today, datetime.min.time())
+    end = start + timedelta(days=1)
+
+    def count(model, *where):
+        return db.select(func.count(model.id)).where(*where).scalar_subquery()
+
+    row = db.session.execute(db.select(
+        count(Book).label("total_books"),
+        count(Book, Book.available.is_(True)).label("available"),
+        count(Student).label("total_students"),
+        count(Borrow, Borrow.status == "BORROWED").label("borrowed"),
+        count(AttendanceSession, AttendanceSession.status == "OPEN").label("open_sessions"),
+        count(AttendanceSession, AttendanceSession.date_ == today).label("sessions_today"),
+        count(LabLog, LabLog.ts >= start, LabLog.ts < end, LabLog.action == "ENTRY").label("lab_entries_today"),
+        count(HostelLog, HostelLog.ts >= start, HostelLog.ts < end, HostelLog.action == "ENTRY").label("hostel_entries_today"),
+    )).one()
+    return dict(row._mapping)
+
+class DashboardStats:
+    """
+    Home page counters kept in memory and bumped by the writes in this process.
+    Every `ttl` seconds (and on a new day) they are rebuilt from the database, which
+    also folds in what other workers wrote meanwhile.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counts = None
+        self._day = None
+        self._expires = 0.0
+
+    def get(self):
+        today = date.today()
+        with self._lock:
+            if self._counts is not None and self._day == today and time.monotonic() < self._expires:
+                return dict(self._counts)
+        counts = _dashboard_counts(today)
+        with self._lock:
+            self._counts, self._day = counts, today
+            self._expires = time.monotonic() + self.ttl
+        return dict(counts)
+
+    def bump(self, **deltas):
+        with self._lock:
+            if self._counts is not None:
+                for key, delta in deltas.items():
+                    self._counts[key] += delta
+
+    def invalidate(self):
+        with self._lock:
+            self._counts = None
+
+dashboard_stats = DashboardStats(app.config["DASHBOARD_TTL"])
+
+# =========================
+# Search (books / students)
+# =========================
+# Indexed and ranked (see search.py). The list pages, the type-ahead endpoint
+# and `flask search` all go through search_ids().
+SEARCH_PAGE_SIZE = 50
+TYPEAHEAD_LIMIT = 8
+TYPEAHEAD_MIN_CHARS = 3   # shorter terms cannot use the trigram index
+
+SEARCH_SPECS = {
+    # weights: an ID hit counts most, then the name/title
+    "books": SearchSpec("books", "bid", ("title", "author", "bid"), (10.0, 4.0, 20.0)),
+    "students": SearchSpec("students", "sid", ("name", "sid"), (10.0, 20.0)),
+}
+SEARCH_MODELS = {"books": Book, "students": Student}
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+def get_search_index():
+    global _search_index
+    if _search_index is None:
+        with _search_index_lock:
+            if _search_index is None:
+                _search_index = make_search_index(db.session.connection(), SEARCH_SPECS,
+                                                  app.config["SEARCH_BACKEND"])
+    return _search_index
+
+def search_ids(kind, q, limit, offset=0):
+    """(total matches, [id, ...] best first) for one page of results."""
+    index = get_search_index()
+    if index.ensure(db.session.connection(), kind):   # created on first use when neither migration nor CLI did
+        db.session.commit()
+    return index.search(db.session.connection(), kind, q, limit, offset)
+
+def search_page(kind, q, page, per_page=SEARCH_PAGE_SIZE):
+    """
+    (total, rows) for a list page: ranked search results when q is given, else
+    the newest rows first; one page either way.
+    """
+    model = SEARCH_MODELS[kind]
+    offset = (page - 1) * per_page
+    if not q:
+        total = db.session.execute(db.select(func.count()).select_from(model)).scalar()
+        rows = model.query.order_by(model.created_at.desc(), model.id.desc()).offset(offset).limit(per_page).all()
+        return total, rows
+    total, ids = search_ids(kind, q, per_page, offset)
+    by_id = {r.id: r for r in model.query.filter(model.id.in_(ids))} if ids else {}
+    return total, [by_id[i] for i in ids if i in by_id]
+
+def _page_arg():
+    return max(1, request.args.get("page", 1, type=int))
+
+@app.route("/api/search/<kind>")
+def api_search(kind):
+    """
+    Type-ahead for the scan/borrow page: ?q=...&limit=N, ranked, IDs and labels
+    only. Answers nothing until some term has TYPEAHEAD_MIN_CHARS characters.
+    """
+    if kind not in SEARCH_SPECS:
+        return jsonify({"ok": False, "error": f"Unknown search kind: {kind}"}), 404
+    q = request.args.get("q", "").strip()
+    limit = min(max(1, request.args.get("limit", TYPEAHEAD_LIMIT, type=int)), SEARCH_PAGE_SIZE)
+    if max((len(t) for t in q.split()), default=0) < TYPEAHEAD_MIN_CHARS:
+        return jsonify({"ok": True, "total": 0, "results": []})
+    total, ids = search_ids(kind, q, limit)
+    if kind == "books":
+        cols = (Book.id, Book.bid, Book.title, Book.author, Book.available)
+    else:
+        cols = (Student.id, Student.sid, Student.name)
+    rows = {r.id: r for r in db.session.execute(db.select(*cols).where(cols[0].in_(ids)))} if ids else {}
+    results = [{k: v for k, v in rows[i]._asdict().items() if k != "id"} for i in ids if i in rows]
+    return jsonify({"ok": True, "total": total, "results": results})
+
 # =========================
 # Pages
 # =========================
 
 @app.route("/")
 def home():
-    total_books = Book.query.count()
-    available = Book.query.filter_by(available=True).count()
-    total_students = Student.query.count()
-    borrowed = Borrow.query.filter_by(status="BORROWED").count()
-
-    # New stats for dashboard
-    today = date.today()
-    open_sessions = AttendanceSession.query.filter_by(status="OPEN").count()
-    sessions_today = AttendanceSession.query.filter_by(date_=today).count()
-    lab_entries_today = LabLog.query.filter(db.func.date(LabLog.ts) == today, LabLog.action == "ENTRY").count()
-    hostel_entries_today = HostelLog.query.filter(db.func.date(HostelLog.ts) == today, HostelLog.action == "ENTRY").count()
-
-    return render_template(
-        "index.html",
-        total_books=total_books,
-        available=available,
-        total_students=total_students,
-        borrowed=borrowed,
-        open_sessions=open_sessions,
-        sessions_today=sessions_today,
-        lab_entries_today=lab_entries_today,
-        hostel_entries_today=hostel_entries_today
-    )
+    # total_books, available, total_students, borrowed, open_sessions, sessions_today,
+    # lab_entries_today, hostel_entries_today
+    return render_template("index.html", **dashboard_stats.get())
 
 @app.route("/admin")
 def admin():
@@ -324,22 +997,18 @@ def admin():
 @app.route("/books")
 def books():
     q = request.args.get("q", "").strip()
-    qry = Book.query
-    if q:
-        like = f"%{q}%"
-        qry = qry.filter(db.or_(Book.title.ilike(like), Book.author.ilike(like), Book.bid.ilike(like)))
-    items = qry.order_by(Book.created_at.desc()).all()
-    return render_template("books.html", books=items, q=q)
+    page = _page_arg()
+    total, items = search_page("books", q, page)
+    return render_template("books.html", books=items, q=q, page=page, total=total,
+                           pages=max(1, -(-total // SEARCH_PAGE_SIZE)))
 
 @app.route("/students")
 def students():
     q = request.args.get("q", "").strip()
-    qry = Student.query
-    if q:
-        like = f"%{q}%"
-        qry = qry.filter(db.or_(Student.name.ilike(like), Student.sid.ilike(like)))
-    items = qry.order_by(Student.created_at.desc()).all()
-    return render_template("students.html", students=items, q=q)
+    page = _page_arg()
+    total, items = search_page("students", q, page)
+    return render_template("students.html", students=items, q=q, page=page, total=total,
+                           pages=max(1, -(-total // SEARCH_PAGE_SIZE)))
 
 @app.route("/scan")
 def scan():
@@ -359,18 +1028,21 @@ def classes():
 def attendance():
     classes = ClassRoom.query.order_by(ClassRoom.name.asc()).all()
     recent = AttendanceSession.query.order_by(AttendanceSession.start_time.desc()).limit(20).all()
-    return render_template("attendance.html", classes=classes, recent=recent)
+    return render_template("attendance.html", classes=classes, recent=recent,
+                           event_cursor=event_broker.format_cursor(_event_head()))
 
 @app.route("/labs")
 def labs_page():
     labs = Lab.query.order_by(Lab.name.asc()).all()
     recent = LabLog.query.order_by(LabLog.ts.desc()).limit(50).all()
-    return render_template("labs.html", labs=labs, recent=recent)
+    return render_template("labs.html", labs=labs, recent=recent,
+                           event_cursor=event_broker.format_cursor(_event_head()))
 
 @app.route("/hostel")
 def hostel_page():
     recent = HostelLog.query.order_by(HostelLog.ts.desc()).limit(10).all()
-    return render_template("hostel.html", recent=recent)
+    return render_template("hostel.html", recent=recent,
+                           event_cursor=event_broker.format_cursor(_event_head()))
 
 @app.route("/labdetail")
 def labdetail():
@@ -386,6 +1058,8 @@ def labdetail():
 def initdb():
     db.create_all()
     seed_demo()
+    hot_cache.clear()
+    dashboard_stats.invalidate()
     flash("Database initialized and demo data added.", "success")
     return redirect(url_for("admin"))
 
@@ -403,8 +1077,8 @@ def add_book():
     book = Book(bid=bid, title=title, author=author, available=True)
     db.session.add(book)
     db.session.commit()
-    save_qr(f"book_{bid}.png", f"BOOK:{bid}")
-    flash(f"Book '{title}' added. QR generated.", "success")
+    dashboard_stats.bump(total_books=1, available=1)
+    flash(f"Book '{title}' added. Its QR code is drawn the first time it is opened.", "success")
     return redirect(url_for("books"))
 
 @app.route("/admin/add-student", methods=["POST"])
@@ -423,9 +1097,10 @@ def add_student():
     student = Student(sid=sid, name=name, email=email, face_image=None, face_encoding_path=None, face_images_prefix=None)
     db.session.add(student)
     db.session.commit()
+    hot_cache.add_student(sid)
+    dashboard_stats.bump(total_students=1)
 
-    save_qr(f"student_{sid}.png", f"STUDENT:{sid}")
-    flash(f"Student '{name}' added ✅ (QR generated). Enroll face separately.", "success")
+    flash(f"Student '{name}' added ✅ (QR code is drawn on first view). Enroll face separately.", "success")
     return redirect(url_for("students"))
 
 @app.route("/admin/add-class", methods=["POST"])
@@ -455,14 +1130,260 @@ def add_lab():
     if Lab.query.filter_by(code=code).first():
         flash("Lab code already exists.", "danger")
         return redirect(url_for("labs_page"))
-    db.session.add(Lab(code=code, name=name, room=room))
+    lab = Lab(code=code, name=name, room=room)
+    db.session.add(lab)
     db.session.commit()
+    hot_cache.add_lab(lab.id)
     flash("Lab added.", "success")
     return redirect(url_for("labs_page"))
 
 @app.route("/qrcodes/<path:filename>")
 def qrcodes(filename):
-    return send_from_directory(app.config["QR_FOLDER"], filename)
+    """
+    QR PNG for student_<sid>.png / book_<bid>.png, rendered into the cache on first
+    request. Long-lived and revalidated by ETag, so kiosks and printers get 304s.
+    """
+    parsed = qr_payload(filename)
+    if parsed is None:
+        return jsonify({"ok": False, "error": "Unknown QR code"}), 404
+    kind, ident, payload = parsed
+    key = qr_cache.qr_key(payload)
+    if request.if_none_match.contains(key):
+        resp = Response(status=304)
+    else:
+        path = qr_cache_path(key)
+        if not os.path.exists(path):
+            known = hot_cache.student_exists(ident) if kind == "student" else \
+                db.session.query(Book.id).filter_by(bid=ident).first() is not None
+            if not known:
+                return jsonify({"ok": False, "error": f"{kind.title()} not found"}), 404
+            qr_cache.ensure(app.config["QR_FOLDER"], payload, key)
+        resp = send_file(path, mimetype="image/png", conditional=False, etag=False,
+                         max_age=app.config["QR_CACHE_MAX_AGE"])
+    resp.set_etag(key)
+    resp.cache_control.no_cache = None
+    resp.cache_control.public = True
+    resp.cache_control.max_age = app.config["QR_CACHE_MAX_AGE"]
+    return resp
+
+# =========================
+# Bulk import (students / books)
+# =========================
+IMPORT_CHUNK = 500        # rows per transaction
+IMPORT_ERRORS_MAX = 1000  # per-row errors listed in a report (all are counted)
+
+IMPORT_SPECS = {
+    # columns => max length (None: optional, stored as NULL when blank)
+    "students": {"model": Student, "key": "sid", "qr": "STUDENT",
+                 "columns": {"sid": 20, "name": 100, "email": 100}, "required": ("sid", "name")},
+    "books": {"model": Book, "key": "bid", "qr": "BOOK",
+              "columns": {"bid": 32, "title": 200, "author": 200}, "required": ("bid", "title")},
+}
+
+def _insert_import_chunk(model, rows):
+    """Inserts [(line, row), ...] in one transaction; [(line, error)] for rows that failed."""
+    try:
+        db.session.execute(db.insert(model), [r for _line, r in rows])
+        db.session.commit()
+        return []
+    except IntegrityError:
+        db.session.rollback()
+    # something in the chunk broke a constraint (e.g. a concurrent insert): row by row
+    failed = []
+    for line, r in rows:
+        try:
+            db.session.execute(db.insert(model), [r])
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            failed.append((line, str(e.orig)))
+    return failed
+
+def import_csv(kind, lines, chunk_size=IMPORT_CHUNK, render_qr=True, qr_workers=None):
+    """
+    Streams CSV rows (header naming the columns; order free, extra columns ignored)
+    into students or books. Each chunk is checked against the table with one IN
+    query and inserted with one executemany in its own transaction; rows with a
+    missing/oversized field or a duplicate key are reported by line and skipped
+    without aborting the rest. QR codes of the new rows are then rendered into the
+    cache over a process pool. Raises ValueError if a required column is missing.
+    """
+    spec = IMPORT_SPECS[kind]
+    model, key = spec["model"], spec["key"]
+    key_col = getattr(model, key)
+    reader = csv.DictReader(lines)
+    missing = [c for c in spec["required"] if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV header has no {', '.join(missing)} column")
+
+    report = {"kind": kind, "rows": 0, "inserted": 0, "error_count": 0, "errors": []}
+    inserted = []
+    seen = set()
+    started = time.perf_counter()
+
+    def error(line, msg):
+        report["error_count"] += 1
+        if len(report["errors"]) < IMPORT_ERRORS_MAX:
+            report["errors"].append({"line": line, "error": msg})
+
+    def flush(chunk):
+        existing = {k for (k,) in db.session.query(key_col).filter(key_col.in_([r[key] for _l, r in chunk]))}
+        rows = []
+        for line, r in chunk:
+            if r[key] in existing:
+                error(line, f"{key} {r[key]} already exists")
+            else:
+                rows.append((line, r))
+        if rows:
+            failed = dict(_insert_import_chunk(model, rows))
+            for line, r in rows:
+                if line in failed:
+                    error(line, failed[line])
+                else:
+                    inserted.append(r[key])
+
+    chunk = []
+    for line, raw in enumerate(reader, start=2):
+        report["rows"] += 1
+        row = {c: (raw.get(c) or "").strip() or None for c in spec["columns"]}
+        blank = [c for c in spec["required"] if not row[c]]
+        too_long = [c for c, n in spec["columns"].items() if row[c] and len(row[c]) > n]
+        if blank or too_long:
+            error(line, "; ".join([f"{c} is required" for c in blank] +
+                                  [f"{c} longer than {spec['columns'][c]}" for c in too_long]))
+            continue
+        if row[key] in seen:
+            error(line, f"{key} {row[key]} repeated in the file")
+            continue
+        seen.add(row[key])
+        chunk.append((line, row))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    report["errors"].sort(key=lambda e: e["line"])
+    report["inserted"] = len(inserted)
+    report["insert_seconds"] = round(time.perf_counter() - started, 3)
+
+    if inserted:
+        hot_cache.clear()
+        dashboard_stats.invalidate()
+    report["qr_rendered"] = 0
+    if render_qr and inserted:
+        qr_started = time.perf_counter()
+        report["qr_rendered"] = qr_cache.render_many(
+            app.config["QR_FOLDER"], [f"{spec['qr']}:{k}" for k in inserted], workers=qr_workers)
+        report["qr_seconds"] = round(time.perf_counter() - qr_started, 3)
+    elapsed = time.perf_counter() - started
+    report["seconds"] = round(elapsed, 3)
+    report["rows_per_s"] = round(report["rows"] / elapsed, 1) if elapsed else None
+    return report
+
+@app.route("/admin/import/<kind>", methods=["POST"])
+def admin_import(kind):
+    """
+    Bulk import: a CSV upload (multipart field "file") or a text/csv body, streamed.
+    ?qr=0 skips pre-rendering QR codes (they are still rendered on first view).
+    """
+    if kind not in IMPORT_SPECS:
+        return jsonify({"ok": False, "error": f"Unknown import kind: {kind}"}), 404
+    upload = request.files.get("file")
+    raw = upload.stream if upload else request.stream
+    lines = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+    try:
+        report = import_csv(kind, lines, render_qr=request.args.get("qr", "1") != "0")
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    return jsonify({"ok": True, **report})
+
+# =========================
+# QR label sheets
+# =========================
+SHEET_BATCH = 500   # rows fetched per round trip while a sheet streams
+
+def _search_all_ids(kind, q):
+    """Every id search_ids() matches for q, not just the first page."""
+    total, ids = search_ids(kind, q, SHEET_BATCH)
+    if total > len(ids):
+        ids += search_ids(kind, q, total - len(ids), len(ids))[1]
+    return ids
+
+def sheet_query(kind, match=None, prefix=None, ids=None, available=None):
+    """Rows for a label sheet, ordered by ID; the filters are the list pages' search plus an ID prefix/list."""
+    spec = IMPORT_SPECS[kind]
+    model = spec["model"]
+    key = getattr(model, spec["key"])
+    cols = (Student.sid, Student.name) if kind == "students" else (Book.bid, Book.title)
+    qry = db.select(*cols)
+    if match:
+        qry = qry.where(model.id.in_(_search_all_ids(kind, match)))
+    if prefix:
+        qry = qry.where(key.startswith(prefix, autoescape=True))
+    if ids:
+        qry = qry.where(key.in_(ids))
+    if available is not None and kind == "books":
+        qry = qry.where(Book.available == available)
+    return qry.order_by(key)
+
+def sheet_cards(kind, qry):
+    """(payload, caption, caption) per row, fetched in batches as the sheet is drawn."""
+    prefix = IMPORT_SPECS[kind]["qr"]
+    result = db.session.execute(qry.execution_options(yield_per=SHEET_BATCH))
+    for rows in result.partitions():
+        for ident, label in rows:
+            yield f"{prefix}:{ident}", label, ident
+
+def _sheet_args(args):
+    ids = [i.strip() for i in args.get("ids", "").split(",") if i.strip()]
+    available = args.get("available")
+    filters = {
+        "match": args.get("q", "").strip() or None,
+        "prefix": args.get("prefix", "").strip() or None,
+        "ids": ids or None,
+        "available": None if available in (None, "") else available == "1",
+    }
+    layout = SheetLayout(page=args.get("paper", "A4"), cols=args.get("cols", 3, type=int),
+                         rows=args.get("rows", 4, type=int), dpi=app.config["QR_SHEET_DPI"])
+    return filters, layout
+
+@app.route("/admin/qr-sheet/<kind>")
+def qr_sheet(kind):
+    """
+    Print-ready QR labels with name/ID captions. format=pdf (default) streams every
+    page as it is drawn; format=png returns one page (?page=N, X-Sheet-Pages has the
+    total). Filters: q (as on the list page), prefix (ID prefix), ids (comma list),
+    available=1/0 (books). Layout: cols, rows, paper=A4|Letter.
+    """
+    if kind not in IMPORT_SPECS:
+        return jsonify({"ok": False, "error": f"Unknown sheet kind: {kind}"}), 404
+    try:
+        filters, layout = _sheet_args(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    qry = sheet_query(kind, **filters)
+    total = db.session.execute(db.select(func.count()).select_from(qry.order_by(None).subquery())).scalar()
+    if not total:
+        return jsonify({"ok": False, "error": f"No {kind} match"}), 404
+    pages = -(-total // layout.per_page)
+    folder = app.config["QR_FOLDER"]
+
+    if request.args.get("format", "pdf") == "png":
+        n = request.args.get("page", 1, type=int)
+        if not 1 <= n <= pages:
+            return jsonify({"ok": False, "error": f"page must be 1-{pages}"}), 400
+        one = qry.offset((n - 1) * layout.per_page).limit(layout.per_page)
+        page = next(render_pages(sheet_cards(kind, one), folder, layout))
+        buf = io.BytesIO()
+        page.save(buf, "PNG", dpi=(layout.dpi, layout.dpi))
+        return Response(buf.getvalue(), mimetype="image/png",
+                        headers={"X-Sheet-Pages": str(pages),
+                                 "Content-Disposition": f'inline; filename="{kind}-qr-{n}.png"'})
+
+    stream = pdf_stream(render_pages(sheet_cards(kind, qry), folder, layout), layout.dpi)
+    return Response(stream_with_context(stream), mimetype="application/pdf",
+                    headers={"X-Sheet-Pages": str(pages),
+                             "Content-Disposition": f'inline; filename="{kind}-qr.pdf"'})
 
 # =========================
 # JSON APIs (library unchanged, fixed minor bugs)
@@ -489,45 +1410,71 @@ def api_book(bid):
         return jsonify({"ok": False, "error": "Book not found"}), 404
     return jsonify({"ok": True, "book": {"bid": b.bid, "title": b.title, "author": b.author, "available": b.available}})
 
+# Borrow and return are compare-and-set: the UPDATE only matches while the book
+# (or the borrow record) is still in the state the request expects, and its
+# rowcount says whether this request won. Two kiosks borrowing the same copy
+# can no longer both read "available" and both succeed; no lock is held
+# between a read and a write. A return closes exactly one loan: the borrow_id
+# it got from /api/borrow, or else the book's open loan as read at the start,
+# so a retried or duplicated return cannot close the next borrower's.
+
 @app.route("/api/borrow", methods=["POST"])
 def api_borrow():
     data = request.get_json(force=True)
     sid = data.get("sid")
     bid = data.get("bid")
-
-    s = Student.query.filter_by(sid=sid).first()
-    b = Book.query.filter_by(bid=bid).first()
-    if not s or not b:
+    if not sid or not bid or not hot_cache.student_exists(sid):
         return jsonify({"ok": False, "error": "Invalid student or book"}), 400
-    if not b.available:
-        return jsonify({"ok": False, "error": "Book already borrowed"}), 409
-
     due = datetime.utcnow() + timedelta(days=int(data.get("days", 14)))
-    rec = Borrow(student_sid=s.sid, book_bid=b.bid, due_dt=due, status="BORROWED")
-    b.available = False
-    db.session.add(rec)
-    db.session.commit()
-    return jsonify({"ok": True, "message": "Borrowed", "due_dt": due.isoformat()})
+
+    def borrow(conn):
+        taken = conn.execute(db.update(Book).where(Book.bid == bid, Book.available.is_(True))
+                             .values(available=False)).rowcount
+        if not taken:
+            return None
+        return conn.execute(db.insert(Borrow).values(student_sid=sid, book_bid=bid, due_dt=due,
+                                                     status="BORROWED")).inserted_primary_key[0]
+
+    borrow_id = _write(borrow)
+    if borrow_id is None:
+        if not db.session.query(Book.query.filter_by(bid=bid).exists()).scalar():
+            return jsonify({"ok": False, "error": "Invalid student or book"}), 400
+        return jsonify({"ok": False, "error": "Book already borrowed"}), 409
+    dashboard_stats.bump(available=-1, borrowed=1)
+    return jsonify({"ok": True, "message": "Borrowed", "due_dt": due.isoformat(), "borrow_id": borrow_id})
 
 @app.route("/api/return", methods=["POST"])
 def api_return():
     data = request.get_json(force=True)
     bid = data.get("bid")
-    b = Book.query.filter_by(bid=bid).first()
-    if not b:
-        return jsonify({"ok": False, "error": "Book not found"}), 404
-    rec = Borrow.query.filter_by(book_bid=bid, status="BORROWED").order_by(Borrow.borrow_dt.desc()).first()
-    if not rec:
+    borrow_id = data.get("borrow_id")  # optional: only this loan
+    now = datetime.utcnow()
+
+    def give_back(conn):
+        loan = borrow_id
+        if loan is None:
+            # the open loan as read now; if another return closes it first, this one loses
+            loan = conn.execute(db.select(Borrow.id).where(Borrow.book_bid == bid, Borrow.status == "BORROWED")
+                                .order_by(Borrow.id.desc()).limit(1)).scalar()
+            if loan is None:
+                return 0
+        closed = conn.execute(db.update(Borrow).where(
+            Borrow.id == loan, Borrow.book_bid == bid, Borrow.status == "BORROWED",
+        ).values(status="RETURNED", return_dt=now)).rowcount
+        if closed:
+            conn.execute(db.update(Book).where(Book.bid == bid).values(available=True))
+        return closed
+
+    if not _write(give_back):
+        if not db.session.query(Book.query.filter_by(bid=bid).exists()).scalar():
+            return jsonify({"ok": False, "error": "Book not found"}), 404
         return jsonify({"ok": False, "error": "No active borrow for this book"}), 409
-    rec.status = "RETURNED"
-    rec.return_dt = datetime.utcnow()
-    b.available = True
-    db.session.commit()
-    return jsonify({"ok": True, "message": "Returned", "return_dt": rec.return_dt.isoformat()})
+    dashboard_stats.bump(available=1, borrowed=-1)
+    return jsonify({"ok": True, "message": "Returned", "return_dt": now.isoformat()})
 
 @app.route("/api/history/<sid>")
 def api_history(sid):
-    rows = Borrow.query.filter_by(student_sid=sid).order_by(Borrow.borrow_dt.desc()).all()
+    rows = _student_borrows_q(sid).all()
     payload = []
     for r in rows:
         payload.append({
@@ -543,44 +1490,133 @@ def api_history(sid):
 # Face enrolment / verification / operator-stop (modified)
 # =========================
 
+_upload_stats_lock = threading.Lock()
+_upload_stats = {}  # "endpoint:mode" => {"requests", "bytes", "parse_ms"}
+
+def _face_upload_mode():
+    if request.mimetype == "multipart/form-data":
+        return "multipart"
+    if request.mimetype in _FACE_UPLOAD_TYPES:
+        return "raw"
+    return "dataurl"
+
+def _record_upload(endpoint, mode, started):
+    """Tallies payload size and the time spent getting images out of the request."""
+    key = f"{endpoint}:{mode}"
+    with _upload_stats_lock:
+        st = _upload_stats.setdefault(key, {"requests": 0, "bytes": 0, "parse_ms": 0.0})
+        st["requests"] += 1
+        st["bytes"] += request.content_length or 0
+        st["parse_ms"] += (time.perf_counter() - started) * 1000.0
+
+def _request_face_frames():
+    """
+    Enrolment frames from any of the accepted encodings:
+      JSON       { sid, frames: [data URL, ...] }
+      multipart  sid field + one or more "frames" file parts (JPEG/WebP/PNG)
+      raw body   a single image, Content-Type image/jpeg|webp|png, ?sid=... in the query
+    Returns (mode, fields, frames).
+    """
+    mode = _face_upload_mode()
+    if mode == "multipart":
+        return mode, request.form, request.files.getlist("frames")
+    if mode == "raw":
+        return mode, request.args, [FileStorage(stream=request.stream, content_type=request.mimetype)]
+    data = request.get_json(force=True)
+    return mode, data, data.get("frames") or []  # <-- changed from "images" to "frames"
+
+def _request_face_image():
+    """
+    A single probe image, as JSON { sid, image: data URL }, multipart (sid + "image"
+    file part) or a raw image body with ?sid=... Returns (fields, image_bytes_or_none).
+    """
+    started = time.perf_counter()
+    mode = _face_upload_mode()
+    if mode == "multipart":
+        fields = request.form
+        part = request.files.get("image")
+        b = part.read() if part else None
+    elif mode == "raw":
+        fields = request.args
+        b = request.get_data(cache=False) or None
+    else:
+        fields = request.get_json(force=True)
+        b = _b64_to_bytes(fields.get("image"))
+    _record_upload(request.endpoint, mode, started)
+    return fields, b
+
 @app.route("/api/face/enroll", methods=["POST"])
 def api_face_enroll():
     if not app.config.get("FACE_ENABLED_GLOBAL", True):
         return jsonify({"ok": False, "error": "Face recognition globally disabled"}), 403
 
-    data = request.get_json(force=True)
-    sid = data.get("sid")
-    frames = data.get("frames") or []  # <-- changed from "images" to "frames"
+    started = time.perf_counter()
+    mode, fields, frames = _request_face_frames()
+    sid = fields.get("sid")
 
     s = Student.query.filter_by(sid=sid).first()
     if not s:
         return jsonify({"ok": False, "error": "Student not found"}), 404
 
-    ok, msg, enc_path, prefix = save_face_images_and_encoding(sid, frames)  # <-- use frames
-    if not ok:
-        return jsonify({"ok": False, "error": msg}), 400
+    prefix, saved_paths = save_face_frames(sid, frames)
+    _record_upload(request.endpoint, mode, started)
+    if not saved_paths:
+        return jsonify({"ok": False, "error": "No valid images received"}), 400
 
-    if prefix:
-        primary_img = os.path.join(app.config["FACE_FOLDER"], f"{prefix}_0.png")
-        if os.path.exists(primary_img):
-            s.face_image = primary_img
-    if enc_path:
-        s.face_encoding_path = enc_path
-    if prefix:
-        s.face_images_prefix = prefix
+    if app.config["FACE_ENROLL_ASYNC"] and face_recognition and np:
+        # ack as soon as the frames are on disk; encoding happens in the background
+        job = FaceEnrollJob(id=uuid.uuid4().hex, student_sid=sid, prefix=prefix,
+                            frame_count=len(saved_paths), status="PENDING")
+        db.session.add(job)
+        db.session.commit()
+        _enroll_executor.submit(_run_enroll_job, job.id)
+        return jsonify({"ok": True, "job_id": job.id, "status": job.status,
+                        "msg": "Frames saved; encoding in progress"}), 202
 
+    try:
+        msg, enc_path, enc = encode_face_frames(prefix, saved_paths)
+    except (FaceBusy, FaceTimeout) as e:
+        return _face_pool_error(e)
+
+    _apply_face_enrollment(s, prefix, enc_path)
     db.session.commit()
+    ref_cache.invalidate(sid)
+    if enc_path and face_gallery.loaded:
+        face_gallery.upsert(sid, enc_path, enc)
     return jsonify({"ok": True, "msg": msg})
 
 
+@app.route("/api/face/enroll/<job_id>")
+def api_face_enroll_status(job_id):
+    job = db.session.get(FaceEnrollJob, job_id)
+    if not job:
+        return jsonify({"ok": False, "error": "Job not found"}), 404
+    if job.status == "PENDING" and (datetime.utcnow() - job.created_at).total_seconds() > ENROLL_JOB_STALE_SECONDS:
+        # the worker that accepted it went away before starting; pick it up here
+        _enroll_executor.submit(_run_enroll_job, job.id)
+    elif job.status == "RUNNING" and _requeue_stuck_enroll_job(job.id):
+        # ... or died while encoding; the frames are still on disk, so run it again
+        _enroll_executor.submit(_run_enroll_job, job.id)
+    return jsonify({
+        "ok": True,
+        "job": {
+            "id": job.id,
+            "sid": job.student_sid,
+            "status": job.status,
+            "msg": job.message,
+            "created_at": job.created_at.isoformat(),
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+    })
+
+
 @app.route("/api/face/verify", methods=["POST"])
 def api_face_verify():
     if not app.config.get("FACE_ENABLED_GLOBAL", True):
         return jsonify({"ok": True, "msg": "Face recognition globally disabled; verification skipped"})
 
-    data = request.get_json(force=True)
-    sid = data.get("sid")
-    image = data.get("image")
+    fields, image = _request_face_image()
+    sid = fields.get("sid")
 
     s = Student.query.filter_by(sid=sid).first()
     if not s:
@@ -591,43 +1627,201 @@ def api_face_verify():
         return jsonify({"ok": False, "error": "No image provided for verification"}), 400
 
     try:
-        # Load reference encoding (from file if available)
-        if s.face_encoding_path and os.path.exists(s.face_encoding_path):
-            ref_enc = np.load(s.face_encoding_path)
-        else:
-            ref_img = face_recognition.load_image_file(s.face_image)
-            ref_locs = face_recognition.face_locations(ref_img, model="hog")
-            if not ref_locs:
-                return jsonify({"ok": False, "error": "No face detected in enrolled image"}), 400
-            ref_encs = face_recognition.face_encodings(ref_img, known_face_locations=ref_locs)
-            if not ref_encs:
-                return jsonify({"ok": False, "error": "No face encoding in enrolled image"}), 400
-            ref_enc = ref_encs[0]
+        # Load reference encoding (cached; derived from the enrolled image only once)
+        ref_enc, err = _reference_encoding(s)
+        if ref_enc is None:
+            return jsonify({"ok": False, "error": err}), 400
 
         # Process live/probe image
-        b = _b64_to_bytes(image)
-        buf = BytesIO(b)
-        probe_img = face_recognition.load_image_file(buf)
-        probe_locs = face_recognition.face_locations(probe_img, model="hog")
+        probe_img = decode_image(image)
+        probe_locs, probe_encs = _probe_locate_and_encode(probe_img, sid)
         if not probe_locs:
             return jsonify({"ok": False, "error": "No face detected in provided image"}), 400
-        probe_encs = face_recognition.face_encodings(probe_img, known_face_locations=probe_locs)
         if not probe_encs:
             return jsonify({"ok": False, "error": "No encoding in provided image"}), 400
         probe_enc = probe_encs[0]
 
         # 🔒 Strict matching for ONLY this student
         dist = np.linalg.norm(ref_enc - probe_enc)
-        tol = 0.5  # stricter tolerance to reduce false positives
+        tol = app.config["FACE_MATCH_TOLERANCE"]  # stricter tolerance to reduce false positives
         if dist <= tol:
             return jsonify({"ok": True, "msg": f"Face matched (distance={float(dist):.4f})"})
         else:
             return jsonify({"ok": False, "error": f"Face mismatch (distance={float(dist):.4f})"}), 400
 
+    except (FaceBusy, FaceTimeout) as e:
+        return _face_pool_error(e)
     except Exception as e:
         return jsonify({"ok": False, "error": f"Verification failed: {str(e)}"}), 500
 
 
+def _request_face_batch():
+    """
+    (sid, image_bytes_or_none) pairs for a batch verification, from either
+      JSON       { items: [{ sid, image: data URL }, ...] }
+      multipart  repeated "sid" fields and "image" file parts, paired in order
+    """
+    started = time.perf_counter()
+    mode = _face_upload_mode()
+    if mode == "multipart":
+        sids = request.form.getlist("sid")
+        parts = request.files.getlist("image")
+        pairs = [(sid, parts[i].read() if i < len(parts) else None) for i, sid in enumerate(sids)]
+    else:
+        data = request.get_json(force=True) or {}
+        pairs = [(it.get("sid"), _b64_to_bytes(it.get("image"))) for it in data.get("items") or []]
+    _record_upload(request.endpoint, mode, started)
+    return pairs
+
+def _locate_and_encode_batch(imgs):
+    """
+    Detection + encoding of many probes, split into one job per pool worker so they
+    run in parallel while holding only that many pool slots.
+    """
+    n = max(face_pool.workers, 1)
+    chunks = [imgs[i::n] for i in range(n) if imgs[i::n]]
+    fn = partial(locate_and_encode_many, **_detect_opts())
+    timeout = app.config["FACE_JOB_TIMEOUT"] * max(len(c) for c in chunks)
+    futures = [face_pool.submit(fn, chunk) for chunk in chunks]
+    results = [None] * len(imgs)
+    try:
+        for i, fut in enumerate(futures):
+            results[i::n] = fut.result(timeout=timeout)
+    except FutureTimeout:
+        raise FaceTimeout("Face processing timed out")
+    return results
+
+@app.route("/api/face/verify-batch", methods=["POST"])
+def api_face_verify_batch():
+    """
+    Verifies a burst of (sid, probe image) pairs in one request: one Student query,
+    cached reference encodings, probes encoded across the face pool and all distances
+    computed in a single vectorized step. Each item gets the same result /verify
+    would give; the response is 200 unless the whole batch could not be processed.
+    """
+    if not app.config.get("FACE_ENABLED_GLOBAL", True):
+        return jsonify({"ok": True, "msg": "Face recognition globally disabled; verification skipped"})
+    if not face_recognition or not np:
+        return jsonify({"ok": False, "error": "Face library not available"}), 503
+
+    pairs = _request_face_batch()
+    if not pairs:
+        return jsonify({"ok": False, "error": "No items provided"}), 400
+    if len(pairs) > app.config["FACE_VERIFY_BATCH_MAX"]:
+        return jsonify({"ok": False, "error": f"At most {app.config['FACE_VERIFY_BATCH_MAX']} items per batch"}), 413
+
+    students = {s.sid: s for s in Student.query.filter(Student.sid.in_({sid for sid, _ in pairs if sid})).all()}
+    results = [{"sid": sid} for sid, _ in pairs]
+    pending = []  # (index, reference encoding, decoded probe)
+    try:
+        for i, (sid, image) in enumerate(pairs):
+            s = students.get(sid)
+            if not s:
+                results[i].update(ok=False, error="Student not found")
+            elif not s.face_image:
+                results[i].update(ok=False, error="Student has no enrolled face")
+            elif not image:
+                results[i].update(ok=False, error="No image provided for verification")
+            else:
+                try:
+                    ref_enc, err = _reference_encoding(s)
+                except (FaceBusy, FaceTimeout):
+                    raise
+                except Exception as e:
+                    # e.g. a missing or unreadable enrolled image: only this item fails
+                    db.session.rollback()
+                    ref_enc, err = None, f"Reference encoding failed: {e}"
+                if ref_enc is None:
+                    results[i].update(ok=False, error=err)
+                    continue
+                try:
+                    pending.append((i, ref_enc, decode_image(image)))
+                except Exception:
+                    results[i].update(ok=False, error="Cannot read image for verification")
+
+        # near-duplicates of a frame this kiosk just sent skip the pool entirely
+        encoded, misses = [None] * len(pending), []
+        for j, (i, _, img) in enumerate(pending):
+            ahash = average_hash(img) if probe_dedup.window else None
+            key = (_kiosk_id(), pairs[i][0])
+            encoded[j] = probe_dedup.get(key, ahash) if ahash is not None else None
+            if encoded[j] is None:
+                misses.append((j, key, ahash))
+        if misses:
+            fresh = _locate_and_encode_batch([pending[j][2] for j, _, _ in misses])
+            for (j, key, ahash), result in zip(misses, fresh):
+                encoded[j] = result
+                if ahash is not None:
+                    probe_dedup.put(key, ahash, result)
+    except (FaceBusy, FaceTimeout) as e:
+        return _face_pool_error(e)
+
+    matched = []  # (index, reference encoding, probe encoding)
+    for (i, ref_enc, _), (locs, encs) in zip(pending, encoded):
+        if not locs:
+            results[i].update(ok=False, error="No face detected in provided image")
+        elif not len(encs):
+            results[i].update(ok=False, error="No encoding in provided image")
+        else:
+            matched.append((i, ref_enc, encs[0]))
+
+    if matched:
+        refs = np.stack([np.asarray(r, dtype=np.float64).reshape(-1) for _, r, _ in matched])
+        probes = np.stack([np.asarray(p, dtype=np.float64).reshape(-1) for _, _, p in matched])
+        dists = np.linalg.norm(refs - probes, axis=1)
+        tol = app.config["FACE_MATCH_TOLERANCE"]
+        for (i, _, _), dist in zip(matched, dists):
+            dist = float(dist)
+            results[i]["distance"] = dist
+            if dist <= tol:
+                results[i].update(ok=True, msg=f"Face matched (distance={dist:.4f})")
+            else:
+                results[i].update(ok=False, error=f"Face mismatch (distance={dist:.4f})")
+
+    return jsonify({
+        "ok": True,
+        "matched": sum(1 for r in results if r.get("ok")),
+        "results": results,
+    })
+
+
+@app.route("/api/face/identify", methods=["POST"])
+def api_face_identify():
+    """
+    1:N match: finds the nearest enrolled student for a probe image, no QR scan needed.
+    Expects JSON: { image: "data:image/png;base64,..." }, or the image as a multipart
+    "image" part / raw JPEG|WebP|PNG body.
+    """
+    if not app.config.get("FACE_ENABLED_GLOBAL", True):
+        return jsonify({"ok": False, "error": "Face recognition globally disabled"}), 403
+    if not face_recognition or not np:
+        return jsonify({"ok": False, "error": "Face library not available"}), 503
+
+    _, image = _request_face_image()
+    if not image:
+        return jsonify({"ok": False, "error": "No image provided for identification"}), 400
+
+    try:
+        probe, err = _probe_encoding(image)
+    except (FaceBusy, FaceTimeout) as e:
+        return _face_pool_error(e)
+    if probe is None:
+        return jsonify({"ok": False, "error": err}), 400
+
+    sid, dist = get_face_gallery().nearest(probe)
+    if sid is None:
+        return jsonify({"ok": False, "error": "No enrolled faces"}), 404
+    if dist > app.config["FACE_MATCH_TOLERANCE"]:
+        return jsonify({"ok": False, "error": f"No matching student (distance={dist:.4f})"}), 404
+
+    s = Student.query.filter_by(sid=sid).first()
+    return jsonify({
+        "ok": True,
+        "msg": f"Face matched (distance={dist:.4f})",
+        "distance": dist,
+        "student": {"sid": sid, "name": s.name if s else None},
+    })
+
 
 @app.route("/api/face/stop", methods=["POST"])
 def api_face_stop():
@@ -646,32 +1840,210 @@ def api_face_stop():
 # Cooldown trackers (in-memory)
 # =========================
 COOLDOWN_SECONDS = 30
-_attendance_cooldowns = {}   # key: session_id|sid  => timestamp (ms)
-_lab_cooldowns = {}          # key: lab_id|sid => timestamp
-_hostel_cooldowns = {}       # key: sid => timestamp
+# shared by all gunicorn workers unless COOLDOWN_BACKEND=memory (see cooldown.py)
+cooldowns = make_cooldown(app.config["COOLDOWN_BACKEND"], COOLDOWN_SECONDS)
+_attendance_cooldowns = cooldowns.scope("attendance")   # key: session_id|sid
+_lab_cooldowns = cooldowns.scope("lab")                 # key: lab_id|sid
+_hostel_cooldowns = cooldowns.scope("hostel")           # key: sid
+
+def _is_cooled(scope, key):
+    """True (and the key is armed) if key may pass; False while it is still cooling."""
+    return scope.hit(key)
+
+# =========================
+# Hot-path lookups (per process)
+# =========================
+
+class HotPathCache:
+    """
+    Memo of the existence checks every scan repeats: which attendance sessions are
+    OPEN, which student sids and lab ids exist. Writes in this process update it
+    directly; changes made by other workers are picked up when a sid/lab misses
+    (looked up once, then remembered) or when a session's state expires after `ttl`
+    seconds. Students and labs are never deleted, so positive entries never go stale.
+    """
 
-def _is_cooled(last_dict, key):
-    now = datetime.utcnow().timestamp()
-    ts = last_dict.get(key)
-    if ts and (now - ts) < COOLDOWN_SECONDS:
-        return False  # not allowed (still cooling)
-    last_dict[key] = now
-    return True
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions = {}     # session_id => (is_open, expires_at)
+        self._students = None   # set of sids, loaded on first use
+        self._labs = None       # set of lab ids, loaded on first use
+
+    def session_open(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._sessions.get(session_id)
+        if hit and hit[1] > now:
+            return hit[0]
+        status = db.session.query(AttendanceSession.status).filter_by(id=session_id).scalar()
+        self.set_session(session_id, status == "OPEN")
+        return status == "OPEN"
+
+    def set_session(self, session_id, is_open):
+        with self._lock:
+            self._sessions[session_id] = (is_open, time.monotonic() + self.ttl)
+
+    # clear() may reset the sets at any time, so each check works on the reference
+    # it took under the lock (or the set it just loaded), never on the attribute
+
+    def student_exists(self, sid):
+        with self._lock:
+            students = self._students
+        if students is None:
+            students = {s for (s,) in db.session.query(Student.sid)}
+            with self._lock:
+                self._students = students
+        if sid in students:
+            return True
+        if db.session.query(Student.id).filter_by(sid=sid).first():
+            self.add_student(sid)
+            return True
+        return False
+
+    def lab_exists(self, lab_id):
+        with self._lock:
+            labs = self._labs
+        if labs is None:
+            labs = {i for (i,) in db.session.query(Lab.id)}
+            with self._lock:
+                self._labs = labs
+        if lab_id in labs:
+            return True
+        if db.session.get(Lab, lab_id):
+            self.add_lab(lab_id)
+            return True
+        return False
+
+    def add_student(self, sid):
+        with self._lock:
+            if self._students is not None:
+                self._students.add(sid)
+
+    def add_lab(self, lab_id):
+        with self._lock:
+            if self._labs is not None:
+                self._labs.add(lab_id)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._students = None
+            self._labs = None
+
+hot_cache = HotPathCache(app.config["HOT_CACHE_TTL"])
+
+# =========================
+# Scan writes
+# =========================
+# With SQLITE_SINGLE_WRITER the scan inserts (attendance, labs, hostel) go through
+# one connection on a writer thread, which commits whatever queued up together,
+# instead of every request thread contending for SQLite's write lock.
+DB_WRITE_TIMEOUT = 10.0  # seconds a request waits for its queued write
+
+db_writer = None
+with app.app_context():
+    if app.config["SQLITE_SINGLE_WRITER"] and db.engine.dialect.name == "sqlite":
+        db_writer = SingleWriter(lambda: db.engine.connect(), context=app.app_context)
+
+def _write(fn):
+    """
+    Runs fn(conn) in a committed transaction and returns its result: on the writer
+    thread when enabled, else on this request's session. fn may run twice (see
+    db_writer.py), so it should only issue the statements of one write.
+    """
+    if db_writer is None:
+        result = fn(db.session.connection())
+        db.session.commit()
+        return result
+    # end this request's own (read) transaction so it holds no lock the writer needs
+    db.session.commit()
+    try:
+        return db_writer.submit(fn).result(timeout=DB_WRITE_TIMEOUT)
+    except FutureTimeout:
+        raise ServiceUnavailable("Database write queue is backed up")
+
+# With SCAN_WRITE_BEHIND the same scans are only journaled by the request (which
+# can ack right away) and committed by scan_buffer's flusher thread every
+# SCAN_FLUSH_MS, one executemany per table. Rows carry their own scan time.
+
+def _scan_ts(row):
+    return dict(row, ts=datetime.fromisoformat(row["ts"]))
+
+def _already_logged(model, rows):
+    """(sid, ts) of rows already in `model`, for replaying a journal after a crash."""
+    if not rows:
+        return set()
+    q = db.session.query(model.student_sid, model.ts).filter(
+        model.student_sid.in_({r["student_sid"] for r in rows}),
+        model.ts >= min(r["ts"] for r in rows), model.ts <= max(r["ts"] for r in rows))
+    return set(q)
+
+def _apply_scans(rows, replay=False):
+    """Writes buffered scan rows in one transaction. Runs on the flusher thread."""
+    batch = {"hostel": [], "lab": [], "attendance": []}
+    for kind, row in rows:
+        batch[kind].append(_scan_ts(row))
+    if replay:
+        # the segment may have been (partly) committed before its process died;
+        # attendance rows are covered by uq_session_student
+        for kind, model in (("hostel", HostelLog), ("lab", LabLog)):
+            seen = _already_logged(model, batch[kind])
+            batch[kind] = [r for r in batch[kind] if (r["student_sid"], r["ts"]) not in seen]
+        db.session.rollback()
+
+    with db.engine.begin() as conn:
+        if batch["hostel"]:
+            conn.execute(db.insert(HostelLog), batch["hostel"])
+        if batch["lab"]:
+            conn.execute(db.insert(LabLog), batch["lab"])
+            latest = {(r["lab_id"], r["student_sid"]): r for r in batch["lab"]}
+            last_log_id = db.select(func.max(LabLog.id)).where(
+                LabLog.lab_id == db.bindparam("p_lab"), LabLog.student_sid == db.bindparam("p_sid")).scalar_subquery()
+            conn.execute(_upsert(
+                LabPresence.__table__,
+                {"lab_id": db.bindparam("p_lab"), "student_sid": db.bindparam("p_sid"),
+                 "inside": db.bindparam("p_inside"), "last_log_id": last_log_id,
+                 "updated_at": db.bindparam("p_at")},
+                keys=["lab_id", "student_sid"], update=["inside", "last_log_id", "updated_at"],
+            ), [{"p_lab": lab_id, "p_sid": sid, "p_inside": r["action"] == "ENTRY", "p_at": r["ts"]}
+                for (lab_id, sid), r in latest.items()])
+        if batch["attendance"]:
+            conn.execute(_insert_ignore(AttendanceRecord.__table__), batch["attendance"])
+    event_broker.notify()
+
+def _enqueue_scans(kind, rows):
+    try:
+        scan_buffer.enqueue_many(kind, rows)
+    except Backlogged as e:
+        raise ServiceUnavailable(str(e))
+
+scan_buffer = None
+if app.config["SCAN_WRITE_BEHIND"]:
+    scan_buffer = WriteBehindBuffer(
+        app.config["SCAN_JOURNAL_DIR"], _apply_scans,
+        flush_ms=app.config["SCAN_FLUSH_MS"], flush_rows=app.config["SCAN_FLUSH_ROWS"],
+        fsync=app.config["SCAN_JOURNAL_FSYNC"], context=app.app_context,
+        reject_errors=(IntegrityError, DataError, KeyError, TypeError, ValueError))
+    scan_buffer.start()  # replays journal segments left by a crashed worker
 
 # =========================
 # Attendance APIs (class)
 # =========================
+ATTENDANCE_BATCH_MAX = 500  # scans per /api/attendance/mark-batch request
 
 @app.route("/api/attendance/start", methods=["POST"])
 def api_attendance_start():
     data = request.get_json(force=True)
     class_id = int(data.get("class_id"))
-    open_existing = AttendanceSession.query.filter_by(class_id=class_id, date_=date.today(), status="OPEN").first()
+    open_existing = _open_session_q(class_id, date.today()).first()
     if open_existing:
         return jsonify({"ok": True, "session_id": open_existing.id, "message": "Session already open"})
     ses = AttendanceSession(class_id=class_id, date_=date.today(), status="OPEN")
     db.session.add(ses)
     db.session.commit()
+    hot_cache.set_session(ses.id, True)
+    dashboard_stats.bump(open_sessions=1, sessions_today=1)
     return jsonify({"ok": True, "session_id": ses.id})
 
 @app.route("/api/attendance/stop", methods=["POST"])
@@ -681,9 +2053,13 @@ def api_attendance_stop():
     ses = AttendanceSession.query.get(session_id)
     if not ses:
         return jsonify({"ok": False, "error": "Session not found"}), 404
+    was_open = ses.status == "OPEN"
     ses.status = "CLOSED"
     ses.end_time = datetime.utcnow()
     db.session.commit()
+    hot_cache.set_session(session_id, False)
+    if was_open:
+        dashboard_stats.bump(open_sessions=-1)
     return jsonify({"ok": True})
 
 @app.route("/api/attendance/mark", methods=["POST"])
@@ -692,11 +2068,10 @@ def api_attendance_mark():
     session_id = int(data.get("session_id"))
     sid = data.get("sid")
 
-    ses = AttendanceSession.query.get(session_id)
-    s = Student.query.filter_by(sid=sid).first()
-    if not ses or ses.status != "OPEN":
+    # both usually answered from hot_cache, leaving the INSERT as the only query
+    if not hot_cache.session_open(session_id):
         return jsonify({"ok": False, "error": "Session closed or missing"}), 400
-    if not s:
+    if not hot_cache.student_exists(sid):
         return jsonify({"ok": False, "error": "Student not found"}), 404
 
     # cooldown key per session+sid
@@ -704,15 +2079,134 @@ def api_attendance_mark():
     if not _is_cooled(_attendance_cooldowns, key):
         return jsonify({"ok": True, "marked": False, "msg": "Ignored (cooldown)"})
 
-    rec = AttendanceRecord.query.filter_by(session_id=session_id, student_sid=sid).first()
-    if not rec:
-        rec = AttendanceRecord(session_id=session_id, student_sid=sid, present=True)
-        db.session.add(rec)
-        db.session.commit()
+    if scan_buffer is not None:
+        # acked once journaled; a duplicate still queued is dropped by uq_session_student
+        if db.session.query(AttendanceRecord.id).filter_by(session_id=session_id, student_sid=sid).first():
+            return jsonify({"ok": True, "marked": False, "msg": "Already marked"})
+        _enqueue_scans("attendance", [{"session_id": session_id, "student_sid": sid, "present": True,
+                                       "ts": datetime.utcnow().isoformat()}])
+        return jsonify({"ok": True, "marked": True, "msg": "Present marked"})
+
+    # uq_session_student decides "already marked"; no SELECT beforehand
+    stmt = _insert_ignore(AttendanceRecord.__table__).values(session_id=session_id, student_sid=sid, present=True)
+    if _write(lambda conn: conn.execute(stmt).rowcount):
+        event_broker.notify()
         return jsonify({"ok": True, "marked": True, "msg": "Present marked" })
     else:
         return jsonify({"ok": True, "marked": False, "msg": "Already marked"})
 
+def _insert_ignore(table):
+    """INSERT that silently skips rows hitting a unique constraint, per dialect."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect in ("mysql", "mariadb"):
+        return table.insert().prefix_with("IGNORE")
+    raise RuntimeError(f"No INSERT ... IGNORE support for {dialect}")
+
+def _upsert(table, values, keys, update):
+    """INSERT of one row that updates the `update` columns when `keys` already exist, per dialect."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(**values)
+        return stmt.on_conflict_do_update(index_elements=keys, set_={c: stmt.excluded[c] for c in update})
+    if dialect in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(**values)
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update})
+    raise RuntimeError(f"No upsert support for {dialect}")
+
+def _client_ts(value, earliest, now):
+    """
+    Scan time sent by a kiosk that buffered it: epoch milliseconds or an ISO string
+    (UTC). Clamped to [earliest, now]; anything unreadable becomes now.
+    """
+    try:
+        if isinstance(value, (int, float)):
+            ts = datetime.utcfromtimestamp(value / 1000.0)
+        elif isinstance(value, str) and value:
+            ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if ts.tzinfo:
+                ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+        else:
+            return now
+    except (ValueError, OverflowError, OSError):
+        return now
+    if earliest and ts < earliest:
+        return earliest
+    return min(ts, now)
+
+@app.route("/api/attendance/mark-batch", methods=["POST"])
+def api_attendance_mark_batch():
+    """
+    Marks a burst of buffered scans in one transaction.
+    Expects JSON: { session_id, items: [{ sid, ts }, ...] } (ts = client scan time,
+    epoch ms or ISO; optional). Students are validated with one IN query and rows
+    are inserted with INSERT ... ON CONFLICT DO NOTHING / INSERT IGNORE, so the
+    uq_session_student constraint decides what is already marked.
+    """
+    data = request.get_json(force=True)
+    session_id = int(data.get("session_id"))
+    items = data.get("items") or [{"sid": sid} for sid in data.get("sids") or []]
+    if not isinstance(items, list):
+        return jsonify({"ok": False, "error": "items must be a list"}), 400
+    if not items:
+        return jsonify({"ok": False, "error": "No scans provided"}), 400
+    if len(items) > ATTENDANCE_BATCH_MAX:
+        return jsonify({"ok": False, "error": f"At most {ATTENDANCE_BATCH_MAX} scans per batch"}), 413
+
+    ses = db.session.get(AttendanceSession, session_id)
+    if not ses or ses.status != "OPEN":
+        hot_cache.set_session(session_id, False)
+        return jsonify({"ok": False, "error": "Session closed or missing"}), 400
+
+    # one row per sid, keeping the earliest scan time
+    now = datetime.utcnow()
+    scans = {}
+    invalid = []   # items without a usable sid, reported by position
+    for i, it in enumerate(items):
+        sid = it.get("sid") if isinstance(it, dict) else None
+        if not isinstance(sid, str) or not sid.strip():
+            invalid.append({"index": i, "marked": False, "error": "Invalid scan: expected {\"sid\": \"...\"}"})
+            continue
+        sid = sid.strip()
+        ts = _client_ts(it.get("ts"), ses.start_time, now)
+        scans[sid] = min(ts, scans.get(sid, ts))
+
+    known = {sid for (sid,) in db.session.query(Student.sid).filter(Student.sid.in_(scans))}
+    existing = {sid for (sid,) in db.session.query(AttendanceRecord.student_sid).filter(
+        AttendanceRecord.session_id == session_id, AttendanceRecord.student_sid.in_(known))}
+    new_rows = [{"session_id": session_id, "student_sid": sid, "present": True, "ts": scans[sid]}
+                for sid in scans if sid in known and sid not in existing]
+    if new_rows and scan_buffer is not None:
+        _enqueue_scans("attendance", [dict(r, ts=r["ts"].isoformat()) for r in new_rows])
+    elif new_rows:
+        # a concurrent mark that lands between the SELECT and here is skipped by the constraint
+        stmt = _insert_ignore(AttendanceRecord.__table__)
+        _write(lambda conn: conn.execute(stmt, new_rows))
+        event_broker.notify()
+    else:
+        db.session.commit()
+
+    results = []
+    for sid in scans:
+        if sid not in known:
+            results.append({"sid": sid, "marked": False, "error": "Student not found"})
+        elif sid in existing:
+            results.append({"sid": sid, "marked": False, "msg": "Already marked"})
+        else:
+            results.append({"sid": sid, "marked": True, "msg": "Present marked"})
+    results += invalid
+    return jsonify({"ok": True, "session_id": session_id, "marked": len(new_rows), "results": results})
+
 @app.route("/api/attendance/session/<int:session_id>")
 def api_attendance_session(session_id):
     ses = AttendanceSession.query.get(session_id)
@@ -732,6 +2226,7 @@ def api_attendance_session(session_id):
 # =========================
 # Labs APIs
 # =========================
+LAB_ACTIONS = ("ENTRY", "EXIT", "TOGGLE")
 
 @app.route("/api/labs/log", methods=["POST"])
 def api_labs_log():
@@ -740,9 +2235,9 @@ def api_labs_log():
     sid = data.get("sid")
     action = data.get("action")
 
-    lab = Lab.query.get(lab_id)
-    s = Student.query.filter_by(sid=sid).first()
-    if not lab or not s:
+    if action not in LAB_ACTIONS:
+        return jsonify({"ok": False, "error": "action must be one of " + ", ".join(LAB_ACTIONS)}), 400
+    if not hot_cache.lab_exists(lab_id) or not hot_cache.student_exists(sid):
         return jsonify({"ok": False, "error": "Invalid lab or student"}), 400
 
     # cooldown key per lab+sid
@@ -750,27 +2245,155 @@ def api_labs_log():
     if not _is_cooled(_lab_cooldowns, key):
         return jsonify({"ok": True, "action": None, "ts": datetime.utcnow().isoformat(), "msg": "Ignored (cooldown)"})
 
-    if action == "TOGGLE":
-        last = LabLog.query.filter(LabLog.lab_id == lab_id, LabLog.student_sid == sid).order_by(LabLog.ts.desc()).first()
-        action = "EXIT" if (last and last.action == "ENTRY") else "ENTRY"
-    log = LabLog(lab_id=lab_id, student_sid=sid, action=action) 
-    db.session.add(log)
-    db.session.commit()
-    return jsonify({"ok": True, "action": action, "ts": log.ts.isoformat()})
+    if scan_buffer is not None:
+        if action == "TOGGLE":
+            presence = db.session.get(LabPresence, (lab_id, sid))
+            action = "EXIT" if (presence and presence.inside) else "ENTRY"
+        now = datetime.utcnow()
+        _enqueue_scans("lab", [{"lab_id": lab_id, "student_sid": sid, "action": action, "ts": now.isoformat()}])
+        if action == "ENTRY":
+            dashboard_stats.bump(lab_entries_today=1)
+        return jsonify({"ok": True, "action": action, "ts": now.isoformat()})
+
+    def log_scan(conn):
+        act = action
+        if act == "TOGGLE":
+            inside = conn.execute(db.select(LabPresence.inside).where(
+                LabPresence.lab_id == lab_id, LabPresence.student_sid == sid)).scalar()
+            act = "EXIT" if inside else "ENTRY"
+        now = datetime.utcnow()
+        log_id = conn.execute(db.insert(LabLog).values(
+            lab_id=lab_id, student_sid=sid, action=act, ts=now)).inserted_primary_key[0]
+        conn.execute(_upsert(
+            LabPresence.__table__,
+            {"lab_id": lab_id, "student_sid": sid, "inside": act == "ENTRY",
+             "last_log_id": log_id, "updated_at": now},
+            keys=["lab_id", "student_sid"], update=["inside", "last_log_id", "updated_at"],
+        ))
+        return act, now
+
+    action, ts = _write(log_scan)
+    event_broker.notify()
+    if action == "ENTRY":
+        dashboard_stats.bump(lab_entries_today=1)
+    return jsonify({"ok": True, "action": action, "ts": ts.isoformat()})
  
 
+@app.route("/api/labs/logs")
+def api_labs_logs():
+    """Like /api/hostel/logs, plus an optional ?lab_id= filter."""
+    query = _log_filters(db.select(LabLog.id, LabLog.lab_id, Lab.code, LabLog.student_sid, LabLog.action, LabLog.ts)
+                         .join(Lab, Lab.id == LabLog.lab_id), LabLog)
+    rows, next_cursor = _keyset_page(query, LabLog)
+    return jsonify({
+        "logs": [
+            {
+                "id": l.id,
+                "lab_id": l.lab_id,
+                "lab": l.code,
+                "sid": l.student_sid,
+                "action": l.action,
+                "ts": l.ts.isoformat()
+            } for l in rows
+        ],
+        "next_cursor": next_cursor,
+    })
+
+@app.route("/api/labs/logs/export")
+def api_labs_logs_export():
+    query = _log_filters(db.select(LabLog.id, LabLog.ts, LabLog.lab_id, Lab.code.label("lab"),
+                                   LabLog.student_sid.label("sid"), LabLog.action)
+                         .join(Lab, Lab.id == LabLog.lab_id), LabLog)
+    return _stream_export(query.order_by(LabLog.ts.asc(), LabLog.id.asc()), "lab_logs")
+
 @app.route("/api/labs/stats/<int:lab_id>")
 def api_labs_stats(lab_id):
-    last_actions = db.session.query(
-        LabLog.student_sid, db.func.max(LabLog.id).label("maxid")
-    ).filter(LabLog.lab_id == lab_id).group_by(LabLog.student_sid).subquery()
+    # index-only count over the students currently inside, independent of log history
+    inside = _lab_occupancy_q(lab_id).count()
+    return jsonify({"ok": True, "inside": inside})
 
-    rows = db.session.query(LabLog).join(
-        last_actions, LabLog.id == last_actions.c.maxid
-    ).all()
+# =========================
+# Log listing / export (hostel + labs)
+# =========================
+LOG_PAGE_DEFAULT = 100
+LOG_PAGE_MAX = 1000
+EXPORT_BATCH = 1000  # rows fetched per round trip while streaming an export
+
+def _parse_ts(value):
+    return datetime.fromisoformat(value) if value else None
+
+def _log_filters(query, model):
+    """Applies ?sid=, ?since=, ?until= (ISO dates/datetimes) and, for labs, ?lab_id=."""
+    args = request.args
+    if args.get("sid"):
+        query = query.where(model.student_sid == args["sid"])
+    if args.get("lab_id") and model is LabLog:
+        query = query.where(LabLog.lab_id == args.get("lab_id", type=int))
+    for name in ("since", "until"):
+        if args.get(name):
+            try:
+                ts = _parse_ts(args[name])
+            except ValueError:
+                raise BadRequest(f"Invalid {name}: expected an ISO date or datetime")
+            query = query.where(model.ts >= ts if name == "since" else model.ts < ts)
+    return query
 
-    inside = sum(1 for r in rows if r.action == "ENTRY")
-    return jsonify({"ok": True, "inside": inside})
+def _keyset_page(query, model):
+    """
+    One page ordered by (ts, id) descending. The cursor is the (ts, id) of the last
+    row served, so the next page is an index range seek from there rather than an
+    OFFSET over everything before it.
+    """
+    limit = max(1, min(request.args.get("limit", LOG_PAGE_DEFAULT, type=int), LOG_PAGE_MAX))
+    cursor = request.args.get("cursor")
+    if cursor:
+        ts, _, last_id = cursor.rpartition("_")
+        try:
+            key = (_parse_ts(ts), int(last_id))
+        except ValueError:
+            raise BadRequest("Invalid cursor")
+        query = query.where(db.tuple_(model.ts, model.id) < key)
+    rows = db.session.execute(query.order_by(model.ts.desc(), model.id.desc()).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1].ts.isoformat()}_{rows[-1].id}"
+    return rows, next_cursor
+
+def _stream_export(query, name):
+    """
+    Streams a query as NDJSON or CSV. Rows are fetched EXPORT_BATCH at a time
+    (yield_per => server-side cursor) and written out as they arrive, so memory
+    stays flat and the download starts immediately.
+    """
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"ok": False, "error": "format must be ndjson or csv"}), 400
+
+    def generate():
+        result = db.session.execute(query.execution_options(yield_per=EXPORT_BATCH))
+        columns = list(result.keys())
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(columns)
+            yield buf.getvalue()
+        for rows in result.partitions():
+            buf = io.StringIO()
+            if fmt == "csv":
+                writer = csv.writer(buf)
+                writer.writerows([v.isoformat() if isinstance(v, datetime) else v for v in r] for r in rows)
+            else:
+                for r in rows:
+                    buf.write(json.dumps({c: v.isoformat() if isinstance(v, datetime) else v
+                                          for c, v in zip(columns, r)}))
+                    buf.write("\n")
+            yield buf.getvalue()
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"{name}_{date.today().isoformat()}.{fmt}"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 # =========================
 # Hostel APIs
@@ -786,15 +2409,21 @@ def hostel_log():
     if not sid or not action:
         return jsonify({"ok": False, "error": "Missing sid or action"})
 
-    log = HostelLog(student_sid=sid, action=action, gate=gate, ts=datetime.utcnow())
-    db.session.add(log)
-    db.session.commit()
+    now = datetime.utcnow()
+    if scan_buffer is not None:
+        _enqueue_scans("hostel", [{"student_sid": sid, "action": action, "gate": gate, "ts": now.isoformat()}])
+    else:
+        _write(lambda conn: conn.execute(db.insert(HostelLog).values(
+            student_sid=sid, action=action, gate=gate, ts=now)))
+        event_broker.notify()
+    if action == "ENTRY":
+        dashboard_stats.bump(hostel_entries_today=1)
     return jsonify({
         "ok": True,
         "sid": sid,
         "action": action,
         "gate": gate,
-        "ts": log.ts.isoformat()
+        "ts": now.isoformat()
     })
 
 @app.route("/api/hostel/recent")
@@ -813,18 +2442,124 @@ def hostel_recent():
 
 @app.route("/api/hostel/logs")
 def hostel_logs():
-    logs = HostelLog.query.order_by(HostelLog.ts.desc()).all()
+    """Newest first, one page at a time: ?limit=&cursor= (next_cursor from the previous page), sid/since/until filters."""
+    query = _log_filters(db.select(HostelLog.id, HostelLog.student_sid, HostelLog.action,
+                                   HostelLog.gate, HostelLog.ts), HostelLog)
+    rows, next_cursor = _keyset_page(query, HostelLog)
     return jsonify({
         "logs": [
             {
+                "id": l.id,
                 "sid": l.student_sid,
                 "action": l.action,
                 "gate": l.gate,
                 "ts": l.ts.isoformat()
-            } for l in logs
-        ]
+            } for l in rows
+        ],
+        "next_cursor": next_cursor,
     })
 
+@app.route("/api/hostel/logs/export")
+def hostel_logs_export():
+    """Whole (filtered) history, oldest first, streamed as ?format=ndjson (default) or csv."""
+    query = _log_filters(db.select(HostelLog.id, HostelLog.ts, HostelLog.student_sid.label("sid"),
+                                   HostelLog.action, HostelLog.gate), HostelLog)
+    return _stream_export(query.order_by(HostelLog.ts.asc(), HostelLog.id.asc()), "hostel_logs")
+
+# =========================
+# Live activity feed (SSE)
+# =========================
+# Pages subscribe to /api/events instead of reloading. One tail thread per worker
+# reads new rows by primary key (so it also sees other workers' commits) and the
+# write endpoints call event_broker.notify() to have their own rows sent at once.
+# On MySQL it also re-reads the last EVENTS_LOOKBACK_IDS ids of each table, since
+# InnoDB can commit a lower auto-increment id after a higher one.
+EVENT_KINDS = ("hostel", "lab", "attendance")
+EVENT_FETCH_MAX = 500  # rows per kind per poll
+
+def _event_head():
+    """Highest id per log table; the cursor a page rendered "now" starts from."""
+    with app.app_context():
+        row = db.session.execute(db.select(
+            db.select(func.coalesce(func.max(HostelLog.id), 0)).scalar_subquery().label("hostel"),
+            db.select(func.coalesce(func.max(LabLog.id), 0)).scalar_subquery().label("lab"),
+            db.select(func.coalesce(func.max(AttendanceRecord.id), 0)).scalar_subquery().label("attendance"),
+        )).one()
+        return dict(row._mapping)
+
+def _event_rows(after):
+    with app.app_context():
+        hostel = db.session.execute(
+            db.select(HostelLog.id, HostelLog.student_sid, HostelLog.action, HostelLog.gate, HostelLog.ts)
+            .where(HostelLog.id > after["hostel"]).order_by(HostelLog.id).limit(EVENT_FETCH_MAX))
+        labs = db.session.execute(
+            db.select(LabLog.id, LabLog.lab_id, Lab.code, Lab.name, LabLog.student_sid, LabLog.action, LabLog.ts)
+            .join(Lab, Lab.id == LabLog.lab_id)
+            .where(LabLog.id > after["lab"]).order_by(LabLog.id).limit(EVENT_FETCH_MAX))
+        marks = db.session.execute(
+            db.select(AttendanceRecord.id, AttendanceRecord.session_id, AttendanceRecord.student_sid,
+                      AttendanceRecord.ts)
+            .where(AttendanceRecord.id > after["attendance"]).order_by(AttendanceRecord.id).limit(EVENT_FETCH_MAX))
+        rows = [("hostel", l.id, {"id": l.id, "sid": l.student_sid, "action": l.action, "gate": l.gate,
+                                  "ts": l.ts.isoformat()}) for l in hostel]
+        rows += [("lab", l.id, {"id": l.id, "lab_id": l.lab_id, "lab": l.code, "lab_name": l.name,
+                                "sid": l.student_sid, "action": l.action, "ts": l.ts.isoformat()}) for l in labs]
+        rows += [("attendance", r.id, {"id": r.id, "session_id": r.session_id, "sid": r.student_sid,
+                                       "ts": r.ts.isoformat()}) for r in marks]
+        return rows
+
+event_broker = EventBroker(EVENT_KINDS, _event_head, _event_rows,
+                           buffer_size=app.config["EVENTS_BUFFER"],
+                           poll_interval=app.config["EVENTS_POLL_SECONDS"],
+                           lookback=min(app.config["EVENTS_LOOKBACK_IDS"], EVENT_FETCH_MAX - 1))
+
+@app.route("/api/events")
+def api_events():
+    """
+    text/event-stream of new hostel / lab / attendance rows (?kinds=hostel,lab to pick).
+    Every event id is a resume cursor: the browser sends it back as Last-Event-ID when
+    it reconnects; ?cursor= (rendered into the page) covers the first connection.
+    """
+    kinds = [k for k in (request.args.get("kinds") or "").split(",") if k in EVENT_KINDS] or EVENT_KINDS
+    cursor = request.headers.get("Last-Event-ID") or request.args.get("cursor")
+    stream = event_broker.subscribe(cursor, kinds, heartbeat=app.config["EVENTS_HEARTBEAT_SECONDS"],
+                                    max_seconds=app.config["EVENTS_MAX_SECONDS"])
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            for item in stream:
+                if item is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                kind, event_id, data = item
+                yield f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            stream.close()  # client gone: release the subscription now, not at GC
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/admin/events")
+def api_events_stats():
+    return jsonify({"ok": True, "events": event_broker.stats()})
+
+# =========================
+# Database profile (Admin)
+# =========================
+
+@app.route("/api/admin/db")
+def api_db_profile():
+    """Active engine profile, the pragmas a SQLite connection really got, and writer queue stats."""
+    info = {"profile": app.config["DB_PROFILE"], "dialect": db.engine.dialect.name,
+            "pool": db.engine.pool.status(),
+            "single_writer": db_writer.stats() if db_writer else None,
+            "write_behind": scan_buffer.stats() if scan_buffer else None}
+    if info["dialect"] == "sqlite":
+        info["pragmas"] = {name: db.session.execute(db.text(f"PRAGMA {name}")).scalar()
+                           for name in ("journal_mode", "busy_timeout", "synchronous", "mmap_size")}
+    return jsonify({"ok": True, "db": info})
+
 # =========================
 # Global Face Recognition Control (Admin)
 # =========================
@@ -854,6 +2589,295 @@ def api_face_toggle():
     app.config["FACE_ENABLED_GLOBAL"] = enabled
     return jsonify({"ok": True, "enabled": enabled})
 
+@app.route("/api/admin/face-pool")
+def api_face_pool_stats():
+    """
+    Queue depth / utilisation of the face-compute worker pool, upload payload stats and
+    how many probe detections the near-duplicate cache saved.
+    """
+    with _upload_stats_lock:
+        uploads = {k: dict(v) for k, v in _upload_stats.items()}
+    return jsonify({"ok": True, "pool": face_pool.stats(), "uploads": uploads,
+                    "probe_dedup": probe_dedup.stats()})
+
+
+# =========================
+# CLI: face embedding store
+# =========================
+
+face_store_cli = AppGroup("face-store", help="Maintain the consolidated face embedding store.")
+
+# {sid}_{uuid hex}_{frame index | enc}.{ext}
+_FACE_FILE_RE = re.compile(r"^(.+_[0-9a-f]{32})_(\d+|enc)\.\w+$")
+
+def _recent_job_prefixes(hours=24):
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return {p for (p,) in db.session.query(FaceEnrollJob.prefix).filter(
+        db.or_(FaceEnrollJob.status.in_(["PENDING", "RUNNING"]), FaceEnrollJob.created_at >= since))}
+
+@face_store_cli.command("migrate")
+def face_store_migrate():
+    """Move encodings referenced by students.face_encoding_path (.npy files) into the store."""
+    store = get_embedding_store()
+    moved = skipped = 0
+    for s in Student.query.filter(Student.face_encoding_path.isnot(None)).all():
+        if is_store_ref(s.face_encoding_path):
+            continue
+        enc = load_encoding(s.face_encoding_path)
+        if enc is None:
+            skipped += 1
+            continue
+        version = s.face_images_prefix or os.path.basename(s.face_encoding_path)[:-len("_enc.npy")]
+        if store.get(version) is None:
+            store.append(s.sid, version, enc)
+        s.face_encoding_path = STORE_REF_PREFIX + version
+        moved += 1
+    db.session.commit()
+    click.echo(f"Migrated {moved} encodings into {store.data_path} ({skipped} unreadable, left as is)")
+
+@face_store_cli.command("compact")
+def face_store_compact():
+    """Rewrite the store keeping only encodings that students (or recent jobs) still reference."""
+    keep = {path[len(STORE_REF_PREFIX):] for (path,) in db.session.query(Student.face_encoding_path)
+            if is_store_ref(path)}
+    keep |= _recent_job_prefixes()
+    before, after = get_embedding_store().compact(keep_versions=keep)
+    click.echo(f"Compacted embedding store: {before} -> {after} rows")
+
+@face_store_cli.command("gc")
+@click.option("--dry-run", is_flag=True, help="Only list what would be deleted.")
+def face_store_gc(dry_run):
+    """Delete images of superseded enrolment prefixes and .npy files the store has replaced."""
+    live_prefixes = {p for (p,) in db.session.query(Student.face_images_prefix) if p}
+    live_prefixes |= _recent_job_prefixes()
+    keep_paths = set()
+    for face_image, enc_path in db.session.query(Student.face_image, Student.face_encoding_path):
+        keep_paths.add(face_image)
+        keep_paths.add(enc_path)
+
+    folder = app.config["FACE_FOLDER"]
+    removed = freed = 0
+    for name in sorted(os.listdir(folder)):
+        m = _FACE_FILE_RE.match(name)
+        path = os.path.join(folder, name)
+        if not m or path in keep_paths:
+            continue
+        if m.group(2) != "enc" and m.group(1) in live_prefixes:
+            continue
+        freed += os.path.getsize(path)
+        removed += 1
+        if dry_run:
+            click.echo(f"would delete {name}")
+        else:
+            os.remove(path)
+    verb = "Would delete" if dry_run else "Deleted"
+    click.echo(f"{verb} {removed} files ({freed / 1e6:.1f} MB)")
+
+app.cli.add_command(face_store_cli)
+
+
+# =========================
+# CLI: labs
+# =========================
+
+labs_cli = AppGroup("labs", help="Lab log maintenance.")
+
+def rebuild_lab_presence():
+    """Recomputes lab_presence from the latest lab_logs row of every (lab, student). Returns rows written."""
+    last = (db.select(func.max(LabLog.id).label("id"))
+            .group_by(LabLog.lab_id, LabLog.student_sid).subquery())
+    latest = (db.select(LabLog.lab_id, LabLog.student_sid,
+                        db.case((LabLog.action == "ENTRY", True), else_=False), LabLog.id, LabLog.ts)
+              .join(last, last.c.id == LabLog.id))
+    db.session.execute(db.delete(LabPresence))
+    db.session.execute(db.insert(LabPresence).from_select(
+        ["lab_id", "student_sid", "inside", "last_log_id", "updated_at"], latest))
+    db.session.commit()
+    return LabPresence.query.count()
+
+@labs_cli.command("rebuild-presence")
+def labs_rebuild_presence():
+    """Rebuild the lab_presence table from the full lab log history."""
+    rows = rebuild_lab_presence()
+    inside = LabPresence.query.filter_by(inside=True).count()
+    click.echo(f"Rebuilt lab presence: {rows} (lab, student) pairs, {inside} currently inside")
+
+app.cli.add_command(labs_cli)
+
+
+# =========================
+# CLI: bulk import
+# =========================
+
+import_cli = AppGroup("import", help="Bulk-load students or books from a CSV file.")
+
+def _import_command(kind):
+    columns = ", ".join(IMPORT_SPECS[kind]["columns"])
+
+    @import_cli.command(kind, help=f"Import {kind} from CSV_FILE (columns: {columns}).")
+    @click.argument("csv_file", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--chunk", default=IMPORT_CHUNK, show_default=True, help="Rows per transaction.")
+    @click.option("--qr-workers", type=int, default=None, help="QR render processes (default: CPU count).")
+    @click.option("--no-qr", is_flag=True, help="Leave QR codes to be rendered on first view.")
+    def command(csv_file, chunk, qr_workers, no_qr):
+        with open(csv_file, encoding="utf-8-sig", newline="") as f:
+            try:
+                r = import_csv(kind, f, chunk_size=chunk, render_qr=not no_qr, qr_workers=qr_workers)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+        for e in r["errors"]:
+            click.echo(f"line {e['line']}: {e['error']}", err=True)
+        if r["error_count"] > len(r["errors"]):
+            click.echo(f"... {r['error_count'] - len(r['errors'])} more errors", err=True)
+        click.echo(f"{r['inserted']}/{r['rows']} {kind} imported, {r['error_count']} rejected, "
+                   f"{r['qr_rendered']} QR codes rendered in {r['seconds']:.1f}s ({r['rows_per_s']:.0f} rows/s)")
+
+for _kind in IMPORT_SPECS:
+    _import_command(_kind)
+
+app.cli.add_command(import_cli)
+
+
+# =========================
+# CLI: QR label sheets
+# =========================
+
+qr_cli = AppGroup("qr", help="QR code rendering.")
+
+@qr_cli.command("sheet")
+@click.argument("kind", type=click.Choice(list(IMPORT_SPECS)))
+@click.option("-o", "--output", required=True, type=click.Path(dir_okay=False),
+              help="out.pdf, or out.png for one PNG per page (out-001.png, ...).")
+@click.option("--match", help="Search terms, matched as on the list page.")
+@click.option("--prefix", help="Only IDs starting with this (e.g. a department code).")
+@click.option("--ids", help="Comma-separated IDs.")
+@click.option("--available/--borrowed", default=None, help="Books only: filter by availability.")
+@click.option("--cols", default=3, show_default=True)
+@click.option("--rows", default=4, show_default=True)
+@click.option("--paper", default="A4", show_default=True, type=click.Choice(["A4", "Letter"]))
+def qr_sheet_command(kind, output, match, prefix, ids, available, cols, rows, paper):
+    """Render a print-ready sheet of QR labels for students or books."""
+    layout = SheetLayout(page=paper, cols=cols, rows=rows, dpi=app.config["QR_SHEET_DPI"])
+    ids = [i.strip() for i in ids.split(",") if i.strip()] if ids else None
+    qry = sheet_query(kind, match=match, prefix=prefix, ids=ids, available=available)
+    pages = render_pages(sheet_cards(kind, qry), app.config["QR_FOLDER"], layout)
+    started = time.perf_counter()
+    count = 0
+    if output.lower().endswith(".png"):
+        stem = output[:-4]
+        for count, page in enumerate(pages, start=1):
+            page.save(f"{stem}-{count:03d}.png", dpi=(layout.dpi, layout.dpi))
+    else:
+        pdf = PdfWriter(layout.dpi)
+        with open(output, "wb") as f:
+            f.write(pdf.begin())
+            for count, page in enumerate(pages, start=1):
+                f.write(pdf.page(page))
+            f.write(pdf.end())
+    if not count:
+        if not output.lower().endswith(".png"):
+            os.remove(output)
+        raise click.ClickException(f"No {kind} match")
+    click.echo(f"{count} page(s) of {layout.per_page} labels written in {time.perf_counter() - started:.1f}s")
+
+app.cli.add_command(qr_cli)
+
+
+# =========================
+# CLI: search index
+# =========================
+
+search_cli = AppGroup("search", help="Full-text search index for books and students.")
+
+@search_cli.command("rebuild")
+@click.argument("kinds", nargs=-1, type=click.Choice(list(SEARCH_SPECS)))
+def search_rebuild(kinds):
+    """Create the index if missing and re-index every row (e.g. after editing rows with raw SQL)."""
+    index = get_search_index()
+    for kind in kinds or SEARCH_SPECS:
+        started = time.perf_counter()
+        conn = db.session.connection()
+        if not index.ensure(conn, kind):
+            index.rebuild(conn, kind)
+        db.session.commit()
+        click.echo(f"{kind}: {index.name} index rebuilt in {time.perf_counter() - started:.2f}s")
+
+@search_cli.command("query")
+@click.argument("kind", type=click.Choice(list(SEARCH_SPECS)))
+@click.argument("q")
+@click.option("--limit", default=10, show_default=True)
+def search_query(kind, q, limit):
+    """Print the ranked matches for Q."""
+    started = time.perf_counter()
+    total, rows = search_page(kind, q, 1, per_page=limit)
+    key, label = ("bid", "title") if kind == "books" else ("sid", "name")
+    for r in rows:
+        click.echo(f"{getattr(r, key):<20} {getattr(r, label)}")
+    click.echo(f"{total} match(es), {(time.perf_counter() - started) * 1000:.1f} ms ({get_search_index().name})")
+
+app.cli.add_command(search_cli)
+
+
+# =========================
+# CLI: query plan checks
+# =========================
+
+def _hot_queries():
+    """(name, table, query) for the lookups scans, borrows and the dashboard run constantly."""
+    today = date.today()
+    start = datetime.combine(today, datetime.min.time())
+    return [
+        ("lab TOGGLE: presence", "lab_presence", LabPresence.query.filter_by(lab_id=1, student_sid="STU0000")),
+        ("lab stats: occupancy", "lab_presence", _lab_occupancy_q(1)),
+        ("return: active borrow", "borrows", _active_borrow_q("BK0000").limit(1)),
+        ("history: borrows of a student", "borrows", _student_borrows_q("STU0000")),
+        ("attendance start: open session", "attendance_sessions", _open_session_q(1, today).limit(1)),
+        ("dashboard: lab entries today", "lab_logs", LabLog.query.filter(
+            LabLog.ts >= start, LabLog.ts < start + timedelta(days=1), LabLog.action == "ENTRY")),
+        ("dashboard: hostel entries today", "hostel_logs", HostelLog.query.filter(
+            HostelLog.ts >= start, HostelLog.ts < start + timedelta(days=1), HostelLog.action == "ENTRY")),
+        ("hostel logs: next keyset page", "hostel_logs", db.select(HostelLog)
+            .where(db.tuple_(HostelLog.ts, HostelLog.id) < (start, 1))
+            .order_by(HostelLog.ts.desc(), HostelLog.id.desc()).limit(LOG_PAGE_DEFAULT + 1)),
+    ]
+
+def _explain(query):
+    """Plan rows for a query: EXPLAIN QUERY PLAN details on SQLite, EXPLAIN rows on MySQL."""
+    bind = db.session.get_bind()
+    compiled = getattr(query, "statement", query).compile(dialect=bind.dialect)
+    params = compiled.construct_params()
+    values = tuple(
+        v.isoformat(" ") if isinstance(v, datetime) else v.isoformat() if isinstance(v, date) else v
+        for v in (params[k] for k in compiled.positiontup)
+    )
+    prefix = "EXPLAIN QUERY PLAN " if bind.dialect.name == "sqlite" else "EXPLAIN "
+    return db.session.connection().exec_driver_sql(prefix + str(compiled), values).mappings().all()
+
+def _full_scans(rows, table, dialect):
+    """Plan steps that read every row of `table` instead of seeking an index."""
+    if dialect == "sqlite":
+        # "SCAN lab_logs" / "SCAN lab_logs USING INDEX ..." walk the whole table or index;
+        # index seeks show up as "SEARCH lab_logs USING INDEX ..."
+        return [r["detail"] for r in rows if re.match(rf"SCAN {table}\b", r["detail"])]
+    return [f"{r['table']}: type={r['type']} key={r['key']}" for r in rows
+            if r["table"] == table and r["type"] == "ALL"]
+
+@app.cli.command("check-query-plans")
+def check_query_plans():
+    """Fails if any hot query falls back to a full table scan."""
+    dialect = db.session.get_bind().dialect.name
+    failed = 0
+    for name, table, query in _hot_queries():
+        rows = _explain(query)
+        scans = _full_scans(rows, table, dialect)
+        status = "FULL SCAN" if scans else "ok"
+        click.echo(f"{status:>9}  {name}")
+        for r in rows:
+            click.echo(f"           {r['detail'] if dialect == 'sqlite' else dict(r)}")
+        failed += bool(scans)
+    if failed:
+        raise click.ClickException(f"{failed} hot queries do a full table scan")
+
 
 # =========================
 # Main
@@ -864,15 +2888,4 @@ if __name__ == "__main__":
     with app.app_context():
         db.create_all()
         seed_demo()
-        # Generate QRs for any missing students/books
-        for s in Student.query.all():
-            fname = f"student_{s.sid}.png"
-            fpath = os.path.join(app.config["QR_FOLDER"], fname)
-            if not os.path.exists(fpath):
-                save_qr(fname, f"STUDENT:{s.sid}")
-        for b in Book.query.all():
-            fname = f"book_{b.bid}.png"
-            fpath = os.path.join(app.config["QR_FOLDER"], fname)
-            if not os.path.exists(fpath):
-                save_qr(fname, f"BOOK:{b.bid}")
     app.run(debug=True, host="0.0.0.0", port=5000)
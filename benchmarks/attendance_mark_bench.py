@@ -0,0 +1,116 @@
+"""
+Queries and latency per /api/attendance/mark call, before and after the hot-path cache.
+
+"before" is the previous handler (session get, student lookup, existence check,
+insert) registered on a side route; "after" is the live endpoint, which answers
+the session/student checks from hot_cache and relies on uq_session_student. Both
+run against the same throwaway SQLite database, each on its own session, for a
+first scan of every student ("new") and a rescan after the cooldown ("repeat").
+
+    python benchmarks/attendance_mark_bench.py --students 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def run(students):
+    workdir = tempfile.mkdtemp(prefix="mark_bench_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bench.db")
+    os.environ["COOLDOWN_BACKEND"] = "sqlite:///" + os.path.join(workdir, "cooldowns.db")
+    sys.path.insert(0, ROOT)
+
+    import app as A
+    from flask import jsonify, request
+    from sqlalchemy import event
+
+    def legacy_mark():
+        data = request.get_json(force=True)
+        session_id = int(data.get("session_id"))
+        sid = data.get("sid")
+        ses = A.AttendanceSession.query.get(session_id)
+        s = A.Student.query.filter_by(sid=sid).first()
+        if not ses or ses.status != "OPEN":
+            return jsonify({"ok": False, "error": "Session closed or missing"}), 400
+        if not s:
+            return jsonify({"ok": False, "error": "Student not found"}), 404
+        if not A._is_cooled(A._attendance_cooldowns, f"{session_id}|{sid}"):
+            return jsonify({"ok": True, "marked": False, "msg": "Ignored (cooldown)"})
+        rec = A.AttendanceRecord.query.filter_by(session_id=session_id, student_sid=sid).first()
+        if not rec:
+            A.db.session.add(A.AttendanceRecord(session_id=session_id, student_sid=sid, present=True))
+            A.db.session.commit()
+            return jsonify({"ok": True, "marked": True, "msg": "Present marked"})
+        return jsonify({"ok": True, "marked": False, "msg": "Already marked"})
+
+    A.app.add_url_rule("/bench/legacy-mark", "bench_legacy_mark", legacy_mark, methods=["POST"])
+    client = A.app.test_client()
+    queries = [0]
+
+    with A.app.app_context():
+        A.db.create_all()
+        A.db.session.add(A.ClassRoom(code="BENCH", name="Bench"))
+        A.db.session.add_all(A.Student(sid=f"B{i:06d}", name=f"Bench {i}") for i in range(students))
+        A.db.session.commit()
+
+        @event.listens_for(A.db.engine, "before_cursor_execute")
+        def _count(*_):
+            queries[0] += 1
+
+    sids = [f"B{i:06d}" for i in range(students)]
+    report = []
+    for label, url in (("before", "/bench/legacy-mark"), ("after", "/api/attendance/mark")):
+        with A.app.app_context():
+            ses = A.AttendanceSession(class_id=1, status="OPEN")
+            A.db.session.add(ses)
+            A.db.session.commit()
+            session_id = ses.id
+        A.hot_cache.clear()
+        for phase in ("new", "repeat"):
+            A._attendance_cooldowns.clear()
+            latencies, marked = [], 0
+            queries[0] = 0
+            started = time.perf_counter()
+            for sid in sids:
+                t0 = time.perf_counter()
+                r = client.post(url, json={"session_id": session_id, "sid": sid})
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+                marked += bool(r.json.get("marked"))
+            elapsed = time.perf_counter() - started
+            report.append({
+                "handler": label,
+                "phase": phase,
+                "marks": len(sids),
+                "marked": marked,
+                "queries_per_mark": queries[0] / len(sids),
+                "marks_per_s": len(sids) / elapsed,
+                "latency_ms_p50": _pct(latencies, 50),
+                "latency_ms_p95": _pct(latencies, 95),
+                "latency_ms_mean": statistics.fmean(latencies),
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--students", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'handler':<8} {'phase':<7} {'marked':>7} {'queries':>8} {'marks/s':>9} {'p50 ms':>7} {'p95 ms':>7}")
+    for r in run(args.students):
+        print(f"{r['handler']:<8} {r['phase']:<7} {r['marked']:>7} {r['queries_per_mark']:>8.2f} "
+              f"{r['marks_per_s']:>9.0f} {r['latency_ms_p50']:>7.2f} {r['latency_ms_p95']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Borrow/return under contention: read-then-write against compare-and-set.
+
+Many kiosk threads fight over a handful of books. Each loop a kiosk picks a
+book and tries to borrow it; when it wins it holds the book for --hold-ms,
+then returns it by sending the same return (with its borrow_id) from two
+kiosks at once, a double tap, so the return path is contended too. Each mode runs in its own process:
+
+    read-then-write   the previous handlers (read book.available, then write
+                      it and insert the Borrow in separate ORM steps),
+                      reproduced here as /bench/legacy/* (no borrow_id)
+    cas               /api/borrow and /api/return (conditional UPDATEs)
+    cas-wal           cas with DB_PROFILE=production (WAL)
+    cas-single-writer cas with the SQLite single writer
+
+Correctness checks, every mode:
+
+    double borrows    a borrow acked while another kiosk still held the book
+                      (a holder clears its claim before sending the return,
+                      so a correct server can never ack in between)
+    double returns    returns acked beyond one per borrow
+    rows              Borrow rows must equal borrows acked, none left
+                      BORROWED, and every book available again
+
+    python benchmarks/borrow_contention_bench.py --threads 16 --books 4 --ops 150
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "read-then-write": {},
+    "cas": {},
+    "cas-wal": {"DB_PROFILE": "production"},
+    "cas-single-writer": {"DB_PROFILE": "production", "SQLITE_SINGLE_WRITER": "1"},
+}
+
+
+def _legacy_routes(A):
+    """The borrow/return handlers as they were before compare-and-set."""
+
+    def borrow():
+        data = A.request.get_json(force=True)
+        s = A.Student.query.filter_by(sid=data.get("sid")).first()
+        b = A.Book.query.filter_by(bid=data.get("bid")).first()
+        if not s or not b:
+            return A.jsonify({"ok": False, "error": "Invalid student or book"}), 400
+        if not b.available:
+            return A.jsonify({"ok": False, "error": "Book already borrowed"}), 409
+        due = datetime.utcnow() + timedelta(days=int(data.get("days", 14)))
+        b.available = False
+        A.db.session.add(A.Borrow(student_sid=s.sid, book_bid=b.bid, due_dt=due, status="BORROWED"))
+        A.db.session.commit()
+        return A.jsonify({"ok": True, "borrow_id": None})
+
+    def give_back():
+        bid = A.request.get_json(force=True).get("bid")
+        b = A.Book.query.filter_by(bid=bid).first()
+        if not b:
+            return A.jsonify({"ok": False, "error": "Book not found"}), 404
+        rec = A._active_borrow_q(bid).first()
+        if not rec:
+            return A.jsonify({"ok": False, "error": "No active borrow for this book"}), 409
+        rec.status = "RETURNED"
+        rec.return_dt = datetime.utcnow()
+        b.available = True
+        A.db.session.commit()
+        return A.jsonify({"ok": True})
+
+    A.app.add_url_rule("/bench/legacy/borrow", "bench_legacy_borrow", borrow, methods=["POST"])
+    A.app.add_url_rule("/bench/legacy/return", "bench_legacy_return", give_back, methods=["POST"])
+
+
+def _child(mode, threads, books, ops, hold, out):
+    workdir = tempfile.mkdtemp(prefix=f"borrow_{mode}_")
+    os.environ.update(MODES[mode])
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bench.db")
+    os.environ["COOLDOWN_BACKEND"] = "memory"
+    sys.path.insert(0, ROOT)
+
+    import app as A
+
+    if mode == "read-then-write":
+        _legacy_routes(A)
+        borrow_url, return_url = "/bench/legacy/borrow", "/bench/legacy/return"
+    else:
+        borrow_url, return_url = "/api/borrow", "/api/return"
+
+    bids = [f"HOT{i:03d}" for i in range(books)]
+    with A.app.app_context():
+        A.db.create_all()
+        A.db.session.add_all(A.Student(sid=f"K{k:03d}", name=f"Kiosk {k}") for k in range(threads))
+        A.db.session.add_all(A.Book(bid=bid, title=f"Hot book {bid}", available=True) for bid in bids)
+        A.db.session.commit()
+
+    lock = threading.Lock()
+    holder = {bid: None for bid in bids}
+    tally = {"borrow_ok": 0, "borrow_409": 0, "return_ok": 0, "return_409": 0, "errors": 0,
+             "double_borrows": 0, "requests": 0}
+    barrier = threading.Barrier(threads + 1)
+
+    def count(key, n=1):
+        with lock:
+            tally[key] += n
+
+    def post(client, url, body):
+        r = client.post(url, json=body)
+        count("requests")
+        if r.status_code == 200:
+            return r.json
+        if r.status_code != 409:
+            count("errors")
+        return None
+
+    def kiosk(k):
+        rnd = random.Random(k)
+        clients = [A.app.test_client(), A.app.test_client()]
+        sid = f"K{k:03d}"
+        barrier.wait()
+        for _ in range(ops):
+            bid = rnd.choice(bids)
+            loan = post(clients[0], borrow_url, {"sid": sid, "bid": bid})
+            if loan is None:
+                count("borrow_409")
+                continue
+            with lock:
+                tally["borrow_ok"] += 1
+                if holder[bid] is not None:
+                    tally["double_borrows"] += 1
+                holder[bid] = sid
+            time.sleep(hold)
+            with lock:
+                if holder[bid] == sid:
+                    holder[bid] = None
+            # double tap: the same return from two kiosks at once, one must win
+            results = []
+            body = {"bid": bid, "borrow_id": loan["borrow_id"]}
+            taps = [threading.Thread(target=lambda c=c: results.append(post(c, return_url, body) is not None))
+                    for c in clients]
+            for t in taps:
+                t.start()
+            for t in taps:
+                t.join()
+            count("return_ok", sum(results))
+            count("return_409", len(results) - sum(results))
+
+    workers = [threading.Thread(target=kiosk, args=(k,)) for k in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    with A.app.app_context():
+        rows = A.Borrow.query.count()
+        open_rows = A.Borrow.query.filter_by(status="BORROWED").count()
+        unavailable = A.Book.query.filter(A.Book.available.is_(False)).count()
+    out.put(dict(tally, mode=mode, seconds=elapsed, rows=rows, open_rows=open_rows, unavailable=unavailable))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16, help="concurrent kiosks")
+    parser.add_argument("--books", type=int, default=4, help="books they fight over")
+    parser.add_argument("--ops", type=int, default=150, help="borrow attempts per kiosk")
+    parser.add_argument("--hold-ms", type=float, default=2.0, help="time a kiosk holds a book before returning it")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated subset of: " + ", ".join(MODES))
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{args.threads} kiosks x {args.ops} borrow attempts on {args.books} books\n")
+    print(f"{'mode':<18} {'req/s':>7} {'borrows':>8} {'409s':>6} {'errors':>6} "
+          f"{'double borrows':>15} {'double returns':>15}  rows ok")
+    for mode in args.modes.split(","):
+        out = ctx.Queue()
+        p = ctx.Process(target=_child, args=(mode, args.threads, args.books, args.ops, args.hold_ms / 1000.0, out))
+        p.start()
+        r = out.get()
+        p.join()
+        rows_ok = r["rows"] == r["borrow_ok"] and r["open_rows"] == 0 and r["unavailable"] == 0
+        print(f"{mode:<18} {r['requests'] / r['seconds']:>7.0f} {r['borrow_ok']:>8} "
+              f"{r['borrow_409'] + r['return_409']:>6} {r['errors']:>6} {r['double_borrows']:>15} "
+              f"{r['return_ok'] - r['borrow_ok']:>15}  {'yes' if rows_ok else 'NO'}"
+              f"{'' if rows_ok else ' (rows %(rows)d, open %(open_rows)d, unavailable %(unavailable)d)' % r}")
+
+
+if __name__ == "__main__":
+    main()
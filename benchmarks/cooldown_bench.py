@@ -0,0 +1,120 @@
+"""
+Throughput, latency, eviction and cross-process correctness of the cooldown stores.
+
+Several processes (standing in for gunicorn workers) call hit() on random
+(session, sid) keys as fast as they can; the report shows the sustained rate
+against --target scans/s. Two extra checks:
+
+    shared   every process hits the same fresh key at once; exactly one may pass
+             (the memory backend fails this by design: one pass per process)
+    evict    after a burst of keys expires, the store is back to (nearly) empty
+
+    python benchmarks/cooldown_bench.py --processes 4 --seconds 3 --target 200
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cooldown import make_cooldown
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def _load_worker(url, ttl, seconds, keyspace, seed, out):
+    store = make_cooldown(url, ttl).scope("attendance")
+    rng = random.Random(seed)
+    latencies, passed = [], 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        key = f"{rng.randrange(20)}|STU{rng.randrange(keyspace):06d}"
+        t0 = time.perf_counter()
+        passed += store.hit(key)
+        latencies.append(time.perf_counter() - t0)
+    out.put((len(latencies), passed, latencies[::max(1, len(latencies) // 2000)]))
+
+
+def _shared_worker(url, ttl, key, barrier, out):
+    store = make_cooldown(url, ttl)
+    barrier.wait()
+    out.put(store.hit(key))
+
+
+def bench(url, processes, seconds, keyspace, ttl):
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_load_worker, args=(url, ttl, seconds, keyspace, i, out)) for i in range(processes)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    ops = sum(r[0] for r in results)
+    latencies = [x for r in results for x in r[2]]
+
+    barrier = ctx.Barrier(processes)
+    key = f"shared|{time.time()}"
+    procs = [ctx.Process(target=_shared_worker, args=(url, ttl, key, barrier, out)) for _ in range(processes)]
+    for p in procs:
+        p.start()
+    shared_passes = sum(bool(out.get()) for _ in procs)
+    for p in procs:
+        p.join()
+
+    store = make_cooldown(url, 0.2)
+    store.clear()
+    for i in range(20000):
+        store.hit(f"evict|{i}")
+    time.sleep(0.3)
+    store.hit("evict|trigger")
+    return {
+        "backend": url,
+        "ops_per_s": ops / seconds,
+        "passed": sum(r[1] for r in results),
+        "latency_us_p50": _pct(latencies, 50) * 1e6,
+        "latency_us_p99": _pct(latencies, 99) * 1e6,
+        "shared_key_passes": shared_passes,
+        "entries_after_expiry": len(store),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--keyspace", type=int, default=3000, help="distinct sids per session")
+    parser.add_argument("--ttl", type=float, default=30.0)
+    parser.add_argument("--target", type=float, default=200.0, help="scans/s the deployment must sustain")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="cooldown_bench_")
+    backends = ["memory", "sqlite:///" + os.path.join(workdir, "cooldowns.db")]
+    if os.path.isdir("/dev/shm"):
+        backends.append("sqlite:///" + os.path.join("/dev/shm", f"cooldown_bench_{os.getpid()}.db"))
+
+    print(f"{args.processes} processes, {args.seconds:.0f}s each, target {args.target:.0f} scans/s\n")
+    print(f"{'backend':<52} {'ops/s':>9} {'p50 us':>8} {'p99 us':>8} {'shared':>7} {'evict':>6}  target")
+    for url in backends:
+        r = bench(url, args.processes, args.seconds, args.keyspace, args.ttl)
+        ok = "ok" if r["ops_per_s"] >= args.target else "TOO SLOW"
+        print(f"{url[-52:]:<52} {r['ops_per_s']:>9.0f} {r['latency_us_p50']:>8.1f} {r['latency_us_p99']:>8.1f} "
+              f"{r['shared_key_passes']:>3}/{args.processes:<3} {r['entries_after_expiry']:>6}  {ok}")
+    for url in backends:
+        if url.startswith("sqlite:////dev/shm/"):
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(url[len("sqlite:///"):] + suffix)
+                except OSError:
+                    pass
+
+
+if __name__ == "__main__":
+    main()
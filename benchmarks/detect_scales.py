@@ -0,0 +1,125 @@
+"""
+Latency vs. match distance for the probe preprocessing settings.
+
+Runs detection + encoding on every enrolled frame in face_data/ at several
+FACE_DETECT_MAX_DIM values and reports, per setting, how long a frame takes, how
+often a face is still found and how far the encoding lands from the student's
+stored reference encoding. Pick the smallest setting whose distances stay well
+under FACE_MATCH_TOLERANCE.
+
+    python benchmarks/detect_scales.py --scales 0,960,640,480,320 --grayscale
+
+Needs the real face_recognition / dlib install.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import face_compute
+from embedding_store import EmbeddingStore
+
+
+def _frames(face_dir, prefix):
+    return sorted(p for p in glob.glob(os.path.join(face_dir, prefix + "_*")) if not p.endswith("_enc.npy"))
+
+
+def _frames_with_reference(face_dir):
+    """
+    Yields (sid, reference_encoding, [frame paths]) for each student's current
+    encoding in the embedding store (face_data/embeddings.*), plus any legacy
+    <prefix>_enc.npy not migrated into the store yet.
+    """
+    sids, versions, matrix = EmbeddingStore(face_dir).latest()
+    for sid, version, ref in zip(sids, versions, matrix):
+        frames = _frames(face_dir, version)
+        if frames:
+            yield sid, ref, frames
+    seen = set(versions)
+    for enc_path in sorted(glob.glob(os.path.join(face_dir, "*_enc.npy"))):
+        prefix = os.path.basename(enc_path)[:-len("_enc.npy")]
+        frames = _frames(face_dir, prefix)
+        if frames and prefix not in seen:
+            yield prefix.split("_")[0], np.load(enc_path), frames
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def run(face_dir, scales, grayscale, repeat, limit):
+    samples = list(_frames_with_reference(face_dir))[:limit or None]
+    images = []
+    for _, ref, frames in samples:
+        for p in frames:
+            try:
+                images.append((ref, face_compute.load_image(p)))
+            except Exception:
+                continue  # truncated / non-image upload
+    if not images:
+        raise SystemExit(f"No enrolled frames with encodings found in {face_dir}")
+
+    report = []
+    for max_dim in scales:
+        latencies, distances, found = [], [], 0
+        for ref, img in images:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                locs, encs = face_compute.locate_and_encode(img, max_dim=max_dim, grayscale=grayscale)
+                latencies.append((time.perf_counter() - start) * 1000.0)
+            if len(encs):
+                found += 1
+                distances.append(float(np.linalg.norm(ref - encs[0])))
+        report.append({
+            "max_dim": max_dim,
+            "grayscale": grayscale,
+            "frames": len(images),
+            "detected": found,
+            "latency_ms_p50": _pct(latencies, 50),
+            "latency_ms_p95": _pct(latencies, 95),
+            "distance_mean": statistics.fmean(distances) if distances else None,
+            "distance_max": max(distances) if distances else None,
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--face-dir", default="face_data")
+    parser.add_argument("--scales", default="0,960,640,480,320", help="comma separated max_dim values; 0 = full size")
+    parser.add_argument("--grayscale", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per frame")
+    parser.add_argument("--limit", type=int, default=0, help="only use the first N enrolments")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if face_compute.face_recognition is None:
+        raise SystemExit("face_recognition is not installed")
+
+    scales = [int(s) for s in args.scales.split(",")]
+    report = run(args.face_dir, scales, args.grayscale, args.repeat, args.limit)
+
+    print(f"{'max_dim':>8} {'found':>9} {'p50 ms':>8} {'p95 ms':>8} {'dist avg':>9} {'dist max':>9}")
+    for r in report:
+        dist_avg = f"{r['distance_mean']:.4f}" if r["distance_mean"] is not None else "-"
+        dist_max = f"{r['distance_max']:.4f}" if r["distance_max"] is not None else "-"
+        print(f"{r['max_dim'] or 'full':>8} {r['detected']:>4}/{r['frames']:<4} "
+              f"{r['latency_ms_p50']:>8.1f} {r['latency_ms_p95']:>8.1f} {dist_avg:>9} {dist_max:>9}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Face pipeline benchmark: enrolment and verification, per stage.
+
+Drives save_face_images_and_encoding, compare_face_encoding, POST /api/face/enroll
+and POST /api/face/verify against a throwaway SQLite database and face folder,
+with synthetic per-student images (a smooth random pattern per identity, plus
+sensor noise per frame, JPEG encoded like a kiosk upload).
+
+For every case it reports throughput and p50/p95/p99 of the whole operation and
+of each stage:
+
+    decode   image bytes -> RGB array (decode_image / load_image)
+    detect   face_locations
+    encode   face_encodings
+    compare  distance to the reference encoding
+    db       time inside SQL statements
+
+By default the deterministic stand-in encoder (standin_face.py) is used; pass
+--backend face_recognition to measure the real dlib models. Stage timings for
+detect/encode are only visible with --pool-workers 0 (the default), since the
+pool's worker processes are not instrumented.
+
+    python benchmarks/face_bench.py --students 20 --iterations 50 --json bench.json
+    python benchmarks/face_bench.py --baseline bench.json     # compare against an earlier run
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+STAGES = ("decode", "detect", "encode", "compare", "db")
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def _summary(values):
+    return {
+        "mean": statistics.fmean(values) if values else None,
+        "p50": _pct(values, 50),
+        "p95": _pct(values, 95),
+        "p99": _pct(values, 99),
+    }
+
+
+class StageTimer:
+    """Accumulates time per stage for the operation currently being measured."""
+
+    def __init__(self):
+        self.current = defaultdict(float)
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.current[stage] += (time.perf_counter() - start) * 1000.0
+        return timed
+
+    def take(self):
+        taken, self.current = self.current, defaultdict(float)
+        return taken
+
+
+@contextmanager
+def _patched(obj, name, value):
+    old = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, old)
+
+
+def _identity_pattern(np, seed, shape):
+    from PIL import Image
+    rng = np.random.RandomState(seed)
+    coarse = (rng.rand(6, 8, 3) * 255).astype(np.uint8)
+    return np.asarray(Image.fromarray(coarse).resize((shape[1], shape[0]), Image.BICUBIC), dtype=np.float32)
+
+
+def _frame_jpeg(np, pattern, rng):
+    from PIL import Image
+    noisy = pattern * rng.uniform(0.95, 1.05) + rng.normal(0, 4, pattern.shape)
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def _dataurl(b):
+    return "data:image/jpeg;base64," + base64.b64encode(b).decode()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="face_bench_")
+    # must be in place before app (and its face pool) is imported
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bench.db")
+    os.environ["COOLDOWN_BACKEND"] = "sqlite:///" + os.path.join(workdir, "cooldowns.db")
+    os.environ["FACE_BACKEND"] = args.backend
+    os.environ["FACE_POOL_WORKERS"] = str(args.pool_workers)
+    os.environ["PYTHONPATH"] = os.pathsep.join(p for p in (HERE, ROOT, os.environ.get("PYTHONPATH")) if p)
+    sys.path[:0] = [HERE, ROOT]
+
+    import numpy as np
+    import app as A
+    from sqlalchemy import event
+
+    if A.face_recognition is None:
+        raise SystemExit(f"Face backend {args.backend!r} could not be imported")
+
+    A.app.config.update(FACE_FOLDER=os.path.join(workdir, "face"), FACE_ENROLL_ASYNC=False,
+                        TESTING=True)
+    if not args.dedup:
+        A.probe_dedup.window = 0
+    backend = A.face_recognition
+    timer = StageTimer()
+    client = A.app.test_client()
+
+    with A.app.app_context():
+        A.db.create_all()
+        A.db.session.add_all(A.Student(sid=f"BENCH{i:05d}", name=f"Bench {i}") for i in range(args.students))
+        A.db.session.commit()
+
+        @event.listens_for(A.db.engine, "before_cursor_execute")
+        def _sql_start(conn, cursor, statement, parameters, context, executemany):
+            conn.info["bench_start"] = time.perf_counter()
+
+        @event.listens_for(A.db.engine, "after_cursor_execute")
+        def _sql_end(conn, cursor, statement, parameters, context, executemany):
+            timer.current["db"] += (time.perf_counter() - conn.info.pop("bench_start")) * 1000.0
+
+    shape = (args.height, args.width)
+    rng = np.random.RandomState(7)
+    sids = [f"BENCH{i:05d}" for i in range(args.students)]
+    patterns = {sid: _identity_pattern(np, i, shape) for i, sid in enumerate(sids)}
+
+    def frames(sid, n):
+        return [_frame_jpeg(np, patterns[sid], rng) for _ in range(n)]
+
+    cases = {}
+
+    def measure(name, ops):
+        """ops: list of zero-argument callables returning True on success."""
+        latencies, stages, ok = [], defaultdict(list), 0
+        timer.take()
+        started = time.perf_counter()
+        for op in ops:
+            t0 = time.perf_counter()
+            ok += bool(op())
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            taken = timer.take()
+            for stage in STAGES:
+                stages[stage].append(taken.get(stage, 0.0))
+        elapsed = time.perf_counter() - started
+        cases[name] = {
+            "ops": len(ops),
+            "succeeded": ok,
+            "seconds": elapsed,
+            "throughput_per_s": len(ops) / elapsed if elapsed else None,
+            "latency_ms": _summary(latencies),
+            "stages_ms": {stage: _summary(v) for stage, v in stages.items()},
+        }
+
+    with _patched(A, "decode_image", timer.wrap("decode", A.decode_image)), \
+            _patched(A, "load_image", timer.wrap("decode", A.load_image)), \
+            _patched(backend, "face_locations", timer.wrap("detect", backend.face_locations)), \
+            _patched(backend, "face_encodings", timer.wrap("encode", backend.face_encodings)), \
+            _patched(np.linalg, "norm", timer.wrap("compare", np.linalg.norm)):
+
+        with A.app.app_context():
+            def direct_enroll(sid):
+                urls = [_dataurl(b) for b in frames(sid, args.frames)]
+
+                def op():
+                    ok, _msg, enc_path, prefix = A.save_face_images_and_encoding(sid, urls)
+                    if ok and enc_path:
+                        s = A.Student.query.filter_by(sid=sid).first()
+                        A._apply_face_enrollment(s, prefix, enc_path)
+                        A.db.session.commit()
+                    return bool(enc_path)
+                return op
+            measure("save_face_images_and_encoding", [direct_enroll(sid) for sid in sids])
+
+            enc_paths = dict(A.db.session.query(A.Student.sid, A.Student.face_encoding_path))
+
+            def direct_compare(sid):
+                probe = _dataurl(frames(sid, 1)[0])
+                return lambda: A.compare_face_encoding(enc_paths[sid], probe,
+                                                       A.app.config["FACE_MATCH_TOLERANCE"])[0]
+            measure("compare_face_encoding",
+                    [direct_compare(sids[i % len(sids)]) for i in range(args.iterations)])
+
+        def api_enroll(sid):
+            payload = {"sid": sid, "frames": [_dataurl(b) for b in frames(sid, args.frames)]}
+            return lambda: client.post("/api/face/enroll", json=payload).status_code == 200
+        measure("api_face_enroll", [api_enroll(sid) for sid in sids])
+
+        def api_verify(sid):
+            payload = {"sid": sid, "image": _dataurl(frames(sid, 1)[0])}
+            return lambda: client.post("/api/face/verify", json=payload).status_code == 200
+        measure("api_face_verify", [api_verify(sids[i % len(sids)]) for i in range(args.iterations)])
+
+    A.face_pool.shutdown()
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "backend": args.backend,
+            "pool_workers": args.pool_workers,
+            "students": args.students,
+            "frames_per_enrolment": args.frames,
+            "iterations": args.iterations,
+            "image": f"{args.width}x{args.height}",
+            "detect_max_dim": A.app.config["FACE_DETECT_MAX_DIM"],
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "workdir": workdir,
+        },
+        "cases": cases,
+    }
+
+
+def _fmt(v):
+    return "-" if v is None else f"{v:.1f}"
+
+
+def print_report(report, baseline=None):
+    print(f"backend={report['meta']['backend']} commit={report['meta']['commit']} "
+          f"pool_workers={report['meta']['pool_workers']}")
+    for name, case in report["cases"].items():
+        lat = case["latency_ms"]
+        line = (f"\n{name}: {case['succeeded']}/{case['ops']} ok, {case['throughput_per_s']:.1f} ops/s, "
+                f"p50 {_fmt(lat['p50'])} / p95 {_fmt(lat['p95'])} / p99 {_fmt(lat['p99'])} ms")
+        old = (baseline or {}).get("cases", {}).get(name)
+        if old and old["latency_ms"]["p50"]:
+            line += f"  (p50 {100.0 * (lat['p50'] / old['latency_ms']['p50'] - 1):+.0f}% vs baseline)"
+        print(line)
+        for stage in STAGES:
+            st = case["stages_ms"].get(stage)
+            if st and st["p99"]:
+                print(f"  {stage:<8} p50 {_fmt(st['p50']):>7}  p95 {_fmt(st['p95']):>7}  p99 {_fmt(st['p99']):>7} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", default="standin_face", help="module implementing the face_recognition API")
+    parser.add_argument("--pool-workers", type=int, default=0, help="face pool processes; 0 runs jobs inline")
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=5, help="frames per enrolment")
+    parser.add_argument("--iterations", type=int, default=100, help="verifications / comparisons to run")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--dedup", action="store_true", help="leave near-duplicate probe reuse enabled")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="earlier --json report to compare p50 latencies against")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report = run(args)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
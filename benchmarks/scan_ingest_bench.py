@@ -0,0 +1,135 @@
+"""
+Scan ingestion throughput: per-row commits against the write-behind buffer.
+
+Several threads (standing in for gate / lab / classroom kiosks) post scans to
+/api/hostel/log, /api/labs/log and /api/attendance/mark as fast as they can,
+each scan for a fresh student so no cooldown or "already marked" short-cut
+applies. Each mode runs in its own process, since the database profile and
+the write path are fixed when app is imported:
+
+    per-row        DB_PROFILE=development, one commit per scan (the default)
+    per-row-wal    DB_PROFILE=production (WAL, synchronous=NORMAL)
+    single-writer  production + SQLITE_SINGLE_WRITER
+    write-behind   production + SCAN_WRITE_BEHIND, journal fsync per ack (grouped)
+    wb-nofsync     write-behind with SCAN_JOURNAL_FSYNC=0
+
+After the timed run the write-behind modes are flushed and every mode's row
+count is checked against the scans acked.
+
+    python benchmarks/scan_ingest_bench.py --threads 8 --scans 600
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "per-row": {},
+    "per-row-wal": {"DB_PROFILE": "production"},
+    "single-writer": {"DB_PROFILE": "production", "SQLITE_SINGLE_WRITER": "1"},
+    "write-behind": {"DB_PROFILE": "production", "SCAN_WRITE_BEHIND": "1"},
+    "wb-nofsync": {"DB_PROFILE": "production", "SCAN_WRITE_BEHIND": "1", "SCAN_JOURNAL_FSYNC": "0"},
+}
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def _child(mode, threads, scans, out):
+    workdir = tempfile.mkdtemp(prefix=f"ingest_{mode}_")
+    os.environ.update(MODES[mode])
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bench.db")
+    os.environ["COOLDOWN_BACKEND"] = "memory"
+    os.environ["SCAN_JOURNAL_DIR"] = os.path.join(workdir, "journal")
+    sys.path.insert(0, ROOT)
+
+    import app as A
+
+    with A.app.app_context():
+        A.db.create_all()
+        A.db.session.add(A.ClassRoom(code="BENCH", name="Bench"))
+        A.db.session.add(A.Lab(code="BENCH-LAB", name="Bench Lab"))
+        A.db.session.add_all(A.Student(sid=f"B{i:06d}", name=f"Bench {i}") for i in range(threads * scans))
+        A.db.session.commit()
+    client = A.app.test_client()
+    session_id = client.post("/api/attendance/start", json={"class_id": 1}).json["session_id"]
+
+    latencies = [[] for _ in range(threads)]
+    errors = [0] * threads
+    barrier = threading.Barrier(threads + 1)
+
+    def kiosk(k):
+        c = A.app.test_client()
+        barrier.wait()
+        for i in range(scans):
+            sid = f"B{k * scans + i:06d}"
+            which = i % 3
+            t0 = time.perf_counter()
+            if which == 0:
+                r = c.post("/api/hostel/log", json={"sid": sid, "action": "ENTRY", "gate": "Bench"})
+            elif which == 1:
+                r = c.post("/api/labs/log", json={"lab_id": 1, "sid": sid, "action": "ENTRY"})
+            else:
+                r = c.post("/api/attendance/mark", json={"session_id": session_id, "sid": sid})
+            latencies[k].append(time.perf_counter() - t0)
+            errors[k] += r.status_code != 200
+
+    workers = [threading.Thread(target=kiosk, args=(k,)) for k in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    if A.scan_buffer is not None:
+        A.scan_buffer.flush()
+    with A.app.app_context():
+        rows = A.HostelLog.query.count() + A.LabLog.query.count() + A.AttendanceRecord.query.count()
+    flat = [x for lat in latencies for x in lat]
+    out.put({
+        "mode": mode,
+        "scans": len(flat),
+        "errors": sum(errors),
+        "scans_per_s": len(flat) / elapsed,
+        "latency_ms_p50": _pct(flat, 50) * 1000.0,
+        "latency_ms_p99": _pct(flat, 99) * 1000.0,
+        "rows": rows,
+        "write_behind": A.scan_buffer.stats() if A.scan_buffer is not None else None,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8, help="concurrent kiosks")
+    parser.add_argument("--scans", type=int, default=600, help="scans per kiosk")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated subset of: " + ", ".join(MODES))
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{args.threads} kiosks x {args.scans} scans\n")
+    print(f"{'mode':<14} {'scans/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'rows':>7}  fsyncs")
+    base = None
+    for mode in args.modes.split(","):
+        out = ctx.Queue()
+        p = ctx.Process(target=_child, args=(mode, args.threads, args.scans, out))
+        p.start()
+        r = out.get()
+        p.join()
+        base = base or r["scans_per_s"]
+        wb = r["write_behind"]
+        print(f"{mode:<14} {r['scans_per_s']:>9.0f} {r['latency_ms_p50']:>8.2f} {r['latency_ms_p99']:>8.2f} "
+              f"{r['errors']:>7} {r['rows']:>7}  {wb['fsyncs'] if wb else '-':>6}"
+              f"   x{r['scans_per_s'] / base:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Book search at 100k rows: ILIKE scan against the indexed search backends.
+
+Builds a SQLite database of --books generated titles/authors (and the FTS5
+index over them), then runs a type-ahead style workload: every prefix of a
+set of real-looking queries ("cle", "clea", ... "clean code"), as the scan
+page's search box sends them (from 3 characters on). Modes:
+
+    ilike     the old /books filter: ILIKE '%q%' on title/author/bid, every
+              match loaded (.all(), no limit)
+    fts5      search.Fts5Index, one ranked page of 50
+    trigram   search.TrigramIndex (in-process fallback), one ranked page of 50
+
+    python benchmarks/search_bench.py --books 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("clean code design patterns introduction algorithms data structures operating systems "
+         "computer networks database concepts machine learning deep neural python java programming "
+         "compilers theory discrete mathematics linear algebra probability statistics distributed "
+         "artificial intelligence software engineering architecture security cryptography graphics "
+         "signals embedded digital logic microprocessors physics chemistry economics management").split()
+NAMES = ("martin gamma cormen knuth tanenbaum silberschatz kurose russell norvig bishop goodfellow "
+         "sedgewick aho ullman hopcroft strang ross sommerville stallings kernighan ritchie").split()
+QUERIES = ("clean code", "neural networks", "knuth", "operating systems", "bk04217", "distributed secur",
+           "python", "linear algebra strang", "xylophone")
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the query prefixes")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="search_bench_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bench.db")
+    os.environ["COOLDOWN_BACKEND"] = "memory"
+    sys.path.insert(0, ROOT)
+
+    import app as A
+    from search import Fts5Index, TrigramIndex
+
+    rnd = random.Random(42)
+    with A.app.app_context():
+        A.db.create_all()
+        started = time.perf_counter()
+        rows = [{"bid": f"BK{i:05d}",
+                 "title": " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 5))).title(),
+                 "author": f"{rnd.choice(NAMES).title()} & {rnd.choice(NAMES).title()}",
+                 "available": True}
+                for i in range(args.books)]
+        for i in range(0, len(rows), 5000):
+            A.db.session.execute(A.db.insert(A.Book), rows[i:i + 5000])
+        A.db.session.commit()
+        print(f"{args.books} books inserted in {time.perf_counter() - started:.1f}s")
+
+        fts = Fts5Index(A.SEARCH_SPECS)
+        started = time.perf_counter()
+        fts.ensure(A.db.session.connection(), "books")
+        A.db.session.commit()
+        print(f"fts5 index built in {time.perf_counter() - started:.1f}s")
+
+        # trigger overhead: 2000 more rows with the FTS triggers in place
+        extra = [dict(r, bid="X" + r["bid"]) for r in rows[:2000]]
+        started = time.perf_counter()
+        A.db.session.execute(A.db.insert(A.Book), extra)
+        A.db.session.commit()
+        print(f"2000 inserts with sync triggers: {time.perf_counter() - started:.2f}s")
+
+        trigram = TrigramIndex(A.SEARCH_SPECS)
+        started = time.perf_counter()
+        trigram.search(A.db.session.connection(), "books", "warmup", 1)
+        print(f"trigram index loaded in {time.perf_counter() - started:.1f}s\n")
+
+        def ilike(q):
+            like = f"%{q}%"
+            found = A.Book.query.filter(A.db.or_(A.Book.title.ilike(like), A.Book.author.ilike(like),
+                                                 A.Book.bid.ilike(like))).order_by(A.Book.created_at.desc()).all()
+            return len(found)
+
+        def indexed(index):
+            def run(q):   # one ranked page, rows loaded, as search_page() does
+                total, ids = index.search(A.db.session.connection(), "books", q, A.SEARCH_PAGE_SIZE)
+                if ids:
+                    A.Book.query.filter(A.Book.id.in_(ids)).all()
+                return total
+            return run
+
+        prefixes = [q[:n] for q in QUERIES for n in range(3, len(q) + 1)]
+        modes = {"ilike": ilike, "fts5": indexed(fts), "trigram": indexed(trigram)}
+        print(f"{len(prefixes)} type-ahead queries x {args.rounds} rounds\n")
+        print(f"{'mode':<9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'q/s':>8}")
+        base = None
+        for name, fn in modes.items():
+            times = []
+            for _ in range(args.rounds):
+                for q in prefixes:
+                    A.db.session.expunge_all()
+                    t0 = time.perf_counter()
+                    fn(q)
+                    times.append(time.perf_counter() - t0)
+            qps = len(times) / sum(times)
+            base = base or qps
+            print(f"{name:<9} {_pct(times, 50) * 1000:>8.2f} {_pct(times, 95) * 1000:>8.2f} "
+                  f"{max(times) * 1000:>8.2f} {qps:>8.0f}   x{qps / base:.0f}")
+
+        print("\nfts5 top 5:")
+        for q in ("clean code", "knuth"):
+            total, ids = fts.search(A.db.session.connection(), "books", q, 5)
+            titles = [A.db.session.get(A.Book, i).title for i in ids]
+            print(f"  {q!r}: {total} matches, {titles}")
+
+
+if __name__ == "__main__":
+    main()
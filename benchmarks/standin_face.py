@@ -0,0 +1,61 @@
+"""
+Deterministic stand-in for the parts of face_recognition the app uses
+(face_locations / face_encodings), for benchmarking without dlib.
+
+Select it with FACE_BACKEND=standin_face (with benchmarks/ on PYTHONPATH); the
+app and the face pool workers then import this module instead of the real one.
+
+Costs are burnt on the CPU rather than slept, so pool sizing and contention
+behave like the real detector:
+
+    FACE_STANDIN_DETECT_MS   detection time for a 640x480 image, scaled by pixel count (default 120)
+    FACE_STANDIN_ENCODE_MS   encoding time per face (default 15)
+
+Encodings are a fixed random projection of a 16x16 grey thumbnail of the face
+box, scaled to unit-ish length like dlib's. Noisy frames of the same synthetic
+identity land well inside the 0.5 match tolerance; different identities land
+around 0.85 apart. Images with almost no contrast have "no face".
+"""
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+DETECT_MS = float(os.getenv("FACE_STANDIN_DETECT_MS", "120"))
+ENCODE_MS = float(os.getenv("FACE_STANDIN_ENCODE_MS", "15"))
+
+_THUMB = 16
+_PROJECTION = np.random.RandomState(1234).standard_normal((128, _THUMB * _THUMB)) / _THUMB
+_SCALE = 0.6
+
+
+def _burn(ms):
+    end = time.perf_counter() + ms / 1000.0
+    x = 0
+    while time.perf_counter() < end:
+        x += 1
+    return x
+
+
+def face_locations(img, number_of_times_to_upsample=1, model="hog"):
+    """One centred (top, right, bottom, left) box, or [] for a featureless frame."""
+    h, w = img.shape[:2]
+    _burn(DETECT_MS * (h * w) / (640 * 480.0))
+    if float(np.std(img)) < 2.0:
+        return []
+    return [(h // 6, w - w // 6, h - h // 6, w // 6)]
+
+
+def face_encodings(face_image, known_face_locations=None, num_jitters=1, model="small"):
+    h, w = face_image.shape[:2]
+    encodings = []
+    for top, right, bottom, left in known_face_locations or [(0, w, h, 0)]:
+        _burn(ENCODE_MS)
+        crop = face_image[top:bottom, left:right]
+        thumb = np.asarray(Image.fromarray(crop).convert("L").resize((_THUMB, _THUMB), Image.BOX),
+                           dtype=np.float64).reshape(-1)
+        thumb = (thumb - thumb.mean()) / (thumb.std() + 1e-6)
+        enc = _PROJECTION @ thumb
+        encodings.append(enc / (np.linalg.norm(enc) + 1e-12) * _SCALE)
+    return encodings
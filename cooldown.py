@@ -0,0 +1,134 @@
+"""
+Scan debounce ("cooldown") stores.
+
+A key may pass once per `ttl` seconds: hit(key) returns True and arms the key, or
+False while it is still cooling. Two backends with the same interface:
+
+    MemoryCooldown   per process; a dict plus an expiry min-heap, so expired keys
+                     are dropped as time passes instead of accumulating forever
+    SQLiteCooldown   a small SQLite table shared by every process on the host
+                     (gunicorn workers); check-and-arm is one atomic upsert
+
+make_cooldown("memory" | "sqlite:///path/to/file.db", ttl) picks one. Callers
+usually take a named scope(), which prefixes keys and can be cleared on its own.
+"""
+import heapq
+import os
+import sqlite3
+import threading
+import time
+
+
+class CooldownScope:
+    """Keys of one feature (attendance, lab, hostel) inside a shared store."""
+
+    def __init__(self, store, name):
+        self.store = store
+        self.prefix = name + "|"
+
+    def hit(self, key):
+        return self.store.hit(self.prefix + key)
+
+    def clear(self):
+        self.store.clear(self.prefix)
+
+
+class MemoryCooldown:
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._expiry = {}   # key => expires_at (monotonic)
+        self._heap = []     # (expires_at, key), earliest first
+
+    def scope(self, name):
+        return CooldownScope(self, name)
+
+    def hit(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._evict(now)
+            if key in self._expiry:
+                return False
+            expires = now + self.ttl
+            self._expiry[key] = expires
+            heapq.heappush(self._heap, (expires, key))
+            return True
+
+    def _evict(self, now):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires, key = heapq.heappop(heap)
+            if self._expiry.get(key) == expires:
+                del self._expiry[key]
+
+    def clear(self, prefix=""):
+        with self._lock:
+            self._expiry = {k: v for k, v in self._expiry.items() if not k.startswith(prefix)}
+            self._heap = [(v, k) for k, v in self._expiry.items()]
+            heapq.heapify(self._heap)
+
+    def __len__(self):
+        with self._lock:
+            self._evict(time.monotonic())
+            return len(self._expiry)
+
+
+class SQLiteCooldown:
+    """
+    Cross-process store. The file only holds short-lived debounce state, so it runs
+    with WAL and synchronous=OFF; put it on tmpfs (/dev/shm) to keep it off disk.
+    Expired rows are purged at most once per ttl.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._next_purge = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS cooldowns (key TEXT PRIMARY KEY, expires REAL NOT NULL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def scope(self, name):
+        return CooldownScope(self, name)
+
+    def hit(self, key, now=None):
+        now = time.time() if now is None else now
+        conn = self._conn()
+        # inserts a new key, or re-arms one whose cooldown has run out; a key still
+        # cooling matches neither branch, so rowcount is 0
+        cur = conn.execute(
+            "INSERT INTO cooldowns (key, expires) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET expires = excluded.expires WHERE cooldowns.expires <= ?",
+            (key, now + self.ttl, now),
+        )
+        if now >= self._next_purge:
+            self._next_purge = now + self.ttl
+            conn.execute("DELETE FROM cooldowns WHERE expires <= ?", (now,))
+        return cur.rowcount == 1
+
+    def clear(self, prefix=""):
+        self._conn().execute("DELETE FROM cooldowns WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def __len__(self):
+        """Rows held, including expired ones not purged yet."""
+        return self._conn().execute("SELECT COUNT(*) FROM cooldowns").fetchone()[0]
+
+
+def make_cooldown(url, ttl):
+    """url: "memory" or "sqlite:///<path>" (an absolute path has four slashes)."""
+    if url == "memory":
+        return MemoryCooldown(ttl)
+    if url.startswith("sqlite:///"):
+        return SQLiteCooldown(url[len("sqlite:///"):], ttl)
+    raise ValueError(f"Unknown cooldown backend: {url}")
@@ -0,0 +1,105 @@
+"""
+Single-writer queue for SQLite.
+
+SQLite allows one writer at a time; with many request threads inserting scans,
+each one takes the write lock, commits (a sync), and the rest wait on
+busy_timeout or fail with "database is locked". SingleWriter funnels those
+writes through one connection on one thread instead: submit(fn) queues
+fn(conn), and the thread runs everything queued so far in a single transaction,
+so a burst of scans costs one commit rather than one each.
+
+A job that raises rolls back the batch it was in; the other jobs of that batch
+are then re-run one transaction each, so only the failing one sees the error.
+Jobs must therefore be safe to run again after a rollback (plain INSERT /
+upsert statements are).
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class SingleWriter:
+
+    def __init__(self, connect, context=None, max_batch=200):
+        """
+        connect()   a new SQLAlchemy Connection
+        context()   optional context manager held around the thread (an app context)
+        """
+        self.max_batch = max_batch
+        self._connect = connect
+        self._context = context
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {"jobs": 0, "batches": 0, "failed": 0, "max_batch_seen": 0}
+
+    def submit(self, fn):
+        """Queues fn(conn); the returned Future resolves to its result once committed."""
+        fut = Future()
+        self._queue.put((fn, fut))
+        self._ensure_running()
+        return fut
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        if self._context is not None:
+            with self._context():
+                self._loop()
+        else:
+            self._loop()
+
+    def _loop(self):
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batch = [(fn, fut) for fn, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception as e:
+                    for _fn, fut in batch:
+                        fut.set_exception(e)
+                    continue
+            try:
+                results = self._commit(conn, batch)
+            except Exception:
+                # something in the batch failed: retry each job on its own
+                results = [self._commit_one(conn, fn) for fn, _fut in batch]
+                if conn.invalidated:
+                    conn.close()
+                    conn = None
+            for (_fn, fut), (ok, value) in zip(batch, results):
+                if ok:
+                    fut.set_result(value)
+                else:
+                    self._stats["failed"] += 1
+                    fut.set_exception(value)
+            self._stats["jobs"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["max_batch_seen"] = max(self._stats["max_batch_seen"], len(batch))
+
+    def _commit(self, conn, batch):
+        with conn.begin():
+            return [(True, fn(conn)) for fn, _fut in batch]
+
+    def _commit_one(self, conn, fn):
+        try:
+            with conn.begin():
+                return True, fn(conn)
+        except Exception as e:
+            return False, e
+
+    def stats(self):
+        return dict(self._stats, queued=self._queue.qsize())
@@ -0,0 +1,184 @@
+"""
+Append-only, memory-mapped store for face encodings.
+
+All encodings live in two files instead of one .npy per enrolment:
+
+    embeddings.f32   raw float32 rows, `dim` values each, appended in order
+    embeddings.idx   one "row<TAB>sid<TAB>version" line per row
+
+`version` is the enrolment prefix ({sid}_{uuid}), so a student's current encoding
+is addressed as "store:<version>" in Student.face_encoding_path. Every process maps
+the data file read-only (np.memmap), so gunicorn workers share one copy through the
+page cache and pick up other workers' appends with a cheap stat. Writers and
+compaction serialise on an flock'd lock file.
+"""
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+STORE_REF_PREFIX = "store:"
+
+
+def is_store_ref(enc_path):
+    return bool(enc_path) and enc_path.startswith(STORE_REF_PREFIX)
+
+
+def store_ref(version):
+    return STORE_REF_PREFIX + version
+
+
+class EmbeddingStore:
+
+    def __init__(self, folder, dim=128):
+        self.folder = folder
+        self.dim = dim
+        self.data_path = os.path.join(folder, "embeddings.f32")
+        self.index_path = os.path.join(folder, "embeddings.idx")
+        self.lock_path = os.path.join(folder, "embeddings.lock")
+        self._lock = threading.Lock()
+        self._index_stat = None     # (inode, size) of the index we last read
+        self._matrix = None
+        self._sids = []
+        self._versions = []
+        self._row_by_version = {}
+        self._row_by_sid = {}       # latest row per sid
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        os.makedirs(self.folder, exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ---------- reading ----------
+
+    def _read_index(self):
+        """(sids, versions, stat) straight from disk; caller holds the file lock."""
+        sids, versions = [], []
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return sids, versions, None
+        with open(self.index_path) as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 3:
+                    sids.append(parts[1])
+                    versions.append(parts[2])
+        return sids, versions, st
+
+    def refresh(self):
+        """Re-reads the index and remaps the data file if another process changed them."""
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            st = None
+        key = (st.st_ino, st.st_size) if st else None
+        if key == self._index_stat and self._matrix is not None:
+            return
+        if st is None:
+            # nothing written yet: no need to create the folder or lock file just to read
+            sids, versions = [], []
+            matrix = np.zeros((0, self.dim), dtype=np.float32)
+        else:
+            with self._file_lock(exclusive=False):
+                sids, versions, st = self._read_index()
+                n = len(sids)
+                matrix = (np.memmap(self.data_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+                          if n else np.zeros((0, self.dim), dtype=np.float32))
+        with self._lock:
+            self._matrix = matrix
+            self._sids = sids
+            self._versions = versions
+            self._row_by_version = {v: i for i, v in enumerate(versions)}
+            self._row_by_sid = {sid: i for i, sid in enumerate(sids)}
+            self._index_stat = (st.st_ino, st.st_size) if st else None
+
+    def __len__(self):
+        self.refresh()
+        return len(self._sids)
+
+    @property
+    def stamp(self):
+        """(inode, size) of the index as last read; changes with every append or compaction."""
+        return self._index_stat
+
+    def get(self, version):
+        """Encoding saved under an enrolment version, or None."""
+        self.refresh()
+        with self._lock:
+            row = self._row_by_version.get(version)
+            return None if row is None else np.array(self._matrix[row])
+
+    def latest(self):
+        """(sids, versions, matrix) with the most recent row of every sid; matrix rows are copied once."""
+        self.refresh()
+        with self._lock:
+            rows = sorted(self._row_by_sid.values())
+            return ([self._sids[r] for r in rows], [self._versions[r] for r in rows],
+                    np.ascontiguousarray(self._matrix[rows], dtype=np.float32))
+
+    # ---------- writing ----------
+
+    def append(self, sid, version, encoding):
+        """Appends one encoding and returns its store ref ("store:<version>")."""
+        vec = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        with self._file_lock(exclusive=True):
+            n = 0
+            if os.path.exists(self.index_path):
+                with open(self.index_path) as f:
+                    n = sum(1 for _ in f)
+            with open(self.data_path, "r+b" if os.path.exists(self.data_path) else "wb") as f:
+                # rows past the index belong to an interrupted append; overwrite them
+                f.seek(n * self.dim * 4)
+                f.write(vec.tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, "a") as f:
+                f.write(f"{n}\t{sid}\t{version}\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return store_ref(version)
+
+    def compact(self, keep_versions=None):
+        """
+        Rewrites the store keeping only `keep_versions` (default: the latest row of
+        each sid). Returns (rows_before, rows_after).
+        """
+        with self._file_lock(exclusive=True):
+            # read under the exclusive lock so no append can slip in before the swap
+            all_sids, all_versions, _ = self._read_index()
+            before = len(all_versions)
+            if keep_versions is None:
+                rows = sorted({sid: i for i, sid in enumerate(all_sids)}.values())
+            else:
+                keep = set(keep_versions)
+                rows = sorted({v: i for i, v in enumerate(all_versions) if v in keep}.values())
+            data = (np.fromfile(self.data_path, dtype=np.float32, count=before * self.dim)
+                    .reshape(before, self.dim)[rows] if before else np.zeros((0, self.dim), np.float32))
+
+            tmp_data, tmp_index = self.data_path + ".tmp", self.index_path + ".tmp"
+            with open(tmp_data, "wb") as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(tmp_index, "w") as f:
+                for i, r in enumerate(rows):
+                    f.write(f"{i}\t{all_sids[r]}\t{all_versions[r]}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            # readers take the shared lock to read both files, so this pair swap is atomic to them
+            os.replace(tmp_data, self.data_path)
+            os.replace(tmp_index, self.index_path)
+        self.refresh()
+        return before, len(rows)
@@ -0,0 +1,210 @@
+"""
+In-process fan-out of newly committed log rows to streaming (SSE) subscribers.
+
+One tail thread per process asks fetch(after) for rows with ids above the last
+ones it has seen (a few primary-key range queries per poll, however many pages
+are open) and appends them to a small ring buffer. notify() after a local commit
+wakes it at once; rows committed by other workers arrive within poll_interval.
+The thread only runs while someone is subscribed.
+
+Ids are assumed to become visible roughly in order. Where they can commit out of
+order (MySQL/InnoDB auto-increment: a transaction holding id 41 may commit after
+the one holding 42), `lookback` makes every poll read that many ids below the
+highest seen again; rows not sent yet are appended, however low their id, and
+the rest are dropped as duplicates. A row committed further behind than that is
+still missed. On SQLite writers are serialised, so 0 is exact there.
+
+Each subscriber keeps a cursor: the last row id it has been sent per kind, as
+dot-separated ids in `kinds` order ("812.95.4410"). Reconnecting with that cursor
+(SSE Last-Event-ID) replays the buffered rows past it; once those have been
+pushed out of the buffer the subscriber gets a single "reset" instead and should
+reload its view. A connected subscriber is sent late rows as they arrive; a row
+that turned up late while it was disconnected is below its cursor and is not
+replayed.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+
+Event = namedtuple("Event", "seq kind row_id data")
+
+
+class EventBroker:
+
+    def __init__(self, kinds, head, fetch, buffer_size=500, poll_interval=1.0, idle_seconds=30.0,
+                 lookback=0):
+        """
+        kinds            ordered kind names; fixes the cursor layout
+        head()           {kind: highest row id committed so far}
+        fetch(after)     [(kind, row_id, data), ...] for rows with id > after[kind],
+                         ascending per kind; must return more than `lookback` rows
+                         per kind for the tail to advance
+        lookback         ids below the highest seen to read again on every poll
+        """
+        self.kinds = tuple(kinds)
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        self.idle_seconds = idle_seconds
+        self.lookback = lookback
+        self._head = head
+        self._fetch = fetch
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._buffer = deque()
+        self._seq = 0
+        self._last = None    # {kind: highest row id read}
+        self._floor = None   # {kind: highest row id already dropped from the buffer}
+        self._start = None   # {kind: lowest id the lookback may read again}
+        self._seen = None    # {kind: ids read within the lookback window}
+        self._subscribers = 0
+        self._thread = None
+        self._errors = 0
+
+    def parse_cursor(self, cursor):
+        try:
+            ids = [int(x) for x in cursor.split(".")]
+        except (AttributeError, ValueError):
+            return None
+        return dict(zip(self.kinds, ids)) if len(ids) == len(self.kinds) else None
+
+    def format_cursor(self, after):
+        return ".".join(str(after[k]) for k in self.kinds)
+
+    def notify(self):
+        """Something was just committed here; poll now instead of at the next tick."""
+        self._wake.set()
+
+    def _ensure_running(self, start=None):
+        # called with self._cond held. Starting at the first subscriber's cursor
+        # (when the gap fits the buffer) lets a page rendered just before resume
+        # without a reset.
+        if self._thread is None:
+            head = self._head()
+            if start and all(0 <= head[k] - start[k] <= self.buffer_size for k in self.kinds):
+                head = start
+            self._last = dict(head)
+            self._floor = dict(head)
+            self._start = dict(head)
+            self._seen = {k: set() for k in self.kinds}
+            self._buffer.clear()
+            self._thread = threading.Thread(target=self._run, name="event-feed", daemon=True)
+            self._thread.start()
+
+    def _prime(self):
+        # rows already committed below the starting ids count as read; a later one in
+        # the window is a late commit. Until this succeeds the lookback stops at the start.
+        low = {k: self._start[k] - self.lookback for k in self.kinds}
+        rows = self._fetch(low)
+        with self._cond:
+            for kind, row_id, _data in rows:
+                if row_id <= self._start[kind]:
+                    self._seen[kind].add(row_id)
+            self._start = low
+
+    def _run(self):
+        idle_since = None
+        primed = not self.lookback
+        while True:
+            self._wake.clear()
+            try:
+                if not primed:
+                    self._prime()
+                    primed = True
+                rows = self._fetch({k: max(self._start[k], self._last[k] - self.lookback)
+                                    for k in self.kinds})
+            except Exception:
+                self._errors += 1
+                rows = []
+            with self._cond:
+                added = 0
+                for kind, row_id, data in rows:
+                    if row_id in self._seen[kind]:
+                        continue
+                    self._append(kind, row_id, data)
+                    added += 1
+                if self.lookback:
+                    for kind, seen in self._seen.items():
+                        low = self._last[kind] - self.lookback
+                        seen.difference_update([i for i in seen if i <= low])
+                if added:
+                    self._cond.notify_all()
+                if self._subscribers:
+                    idle_since = None
+                elif idle_since is None:
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since >= self.idle_seconds:
+                    self._thread = None
+                    return
+            self._wake.wait(self.poll_interval)
+
+    def _append(self, kind, row_id, data):
+        self._last[kind] = max(self._last[kind], row_id)
+        if self.lookback:
+            self._seen[kind].add(row_id)
+        self._seq += 1
+        while len(self._buffer) >= self.buffer_size:
+            old = self._buffer.popleft()
+            self._floor[old.kind] = max(self._floor[old.kind], old.row_id)
+        self._buffer.append(Event(self._seq, kind, row_id, data))
+
+    def subscribe(self, cursor=None, kinds=None, heartbeat=15.0, max_seconds=300.0):
+        """
+        Generator of (kind, cursor, data) for every new row of the wanted kinds,
+        None after `heartbeat` quiet seconds, and ("reset", cursor, {}) as the last
+        item when the stream cannot continue from `cursor`. Ends after max_seconds
+        (SSE clients reconnect on their own, resuming from the last cursor).
+        """
+        wanted = set(kinds or self.kinds)
+        after = self.parse_cursor(cursor) if cursor else None
+        with self._cond:
+            self._ensure_running(after)
+            self._subscribers += 1
+            if after is None:
+                after = dict(self._last)
+            # resumable only if nothing past the cursor has left the buffer yet
+            resumable = all(after[k] >= self._floor[k] for k in wanted)
+            pos = self._buffer[0].seq - 1 if self._buffer else self._seq
+            joined = self._seq
+            reset = ("reset", self.format_cursor(self._last), {})
+        try:
+            if not resumable:
+                yield reset
+                return
+            deadline = time.monotonic() + max_seconds
+            while True:
+                with self._cond:
+                    # unread events dropped from the buffer: this subscriber fell behind
+                    behind = bool(self._buffer) and self._buffer[0].seq > pos + 1
+                    new = [] if behind else [e for e in self._buffer if e.seq > pos]
+                    pos = self._seq
+                    reset = ("reset", self.format_cursor(self._last), {})
+                if behind:
+                    yield reset
+                    return
+                for e in new:
+                    # the cursor only screens the replay; anything appended since joining
+                    # is new to this subscriber, even a late row below the cursor
+                    if e.kind in wanted and (e.seq > joined or e.row_id > after[e.kind]):
+                        after[e.kind] = max(after[e.kind], e.row_id)
+                        yield e.kind, self.format_cursor(after), e.data
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                with self._cond:
+                    woke = self._cond.wait_for(lambda: self._seq > pos, timeout=min(heartbeat, remaining))
+                if not woke and time.monotonic() < deadline:
+                    yield None
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": self._thread is not None,
+                "subscribers": self._subscribers,
+                "buffered": len(self._buffer),
+                "buffer_size": self.buffer_size,
+                "last": dict(self._last) if self._last else None,
+                "fetch_errors": self._errors,
+            }
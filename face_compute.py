@@ -0,0 +1,272 @@
+"""
+Face detection / encoding off the web worker.
+
+dlib's HOG detector and the 128-d encoder are CPU bound and hold a request thread
+for hundreds of ms. Jobs here run in a small process pool instead. The pool only
+accepts a bounded number of in-flight jobs; past that, callers get FaceBusy
+straight away rather than piling up behind a backlog.
+"""
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+from io import BytesIO
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    face_recognition = importlib.import_module(os.getenv("FACE_BACKEND", "face_recognition"))
+except Exception:
+    face_recognition = None
+
+
+class FaceBusy(Exception):
+    """Raised when the pool already has its maximum number of jobs in flight."""
+
+
+class FaceTimeout(Exception):
+    """Raised when a job does not finish within its timeout."""
+
+
+# =========================
+# Decoding / preprocessing
+# =========================
+
+def decode_image(data):
+    """Decodes encoded image bytes (PNG/JPEG/...) once into an RGB uint8 array."""
+    with Image.open(BytesIO(data)) as im:
+        return np.asarray(im.convert("RGB"))
+
+
+def load_image(path):
+    with open(path, "rb") as f:
+        return decode_image(f.read())
+
+
+def prepare_for_detection(img, max_dim=0, grayscale=False, roi=None):
+    """
+    Builds the (usually much smaller) image the HOG detector runs on.
+
+    roi:       optional (x0, y0, x1, y1) crop as fractions of width/height
+    max_dim:   longest side after downscaling; 0 disables
+    grayscale: detect on luminance only (HOG ignores colour anyway)
+
+    Returns (detect_img, scale, (top, left)) so boxes can be mapped back with map_box.
+    """
+    top = left = 0
+    if roi:
+        h, w = img.shape[:2]
+        x0, y0, x1, y1 = roi
+        top, left = int(y0 * h), int(x0 * w)
+        img = img[top:int(y1 * h), left:int(x1 * w)]
+
+    h, w = img.shape[:2]
+    scale = 1.0
+    if max_dim and max(h, w) > max_dim:
+        scale = max_dim / float(max(h, w))
+    if scale == 1.0 and not grayscale:
+        return img, scale, (top, left)
+
+    pil = Image.fromarray(img)
+    if grayscale:
+        pil = pil.convert("L")
+    if scale != 1.0:
+        pil = pil.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BILINEAR)
+    return np.asarray(pil), scale, (top, left)
+
+
+def average_hash(img, size=8):
+    """
+    64-bit perceptual (average) hash of a decoded image: downsample to size x size
+    grey levels and set one bit per pixel brighter than the mean. Near-identical
+    frames land within a few bits of each other (see hamming).
+    """
+    small = np.asarray(Image.fromarray(img).convert("L").resize((size, size), Image.BOX), dtype=np.float32)
+    return int.from_bytes(np.packbits(small > small.mean()).tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def map_box(box, scale, offset, shape):
+    """Maps a (top, right, bottom, left) box from the detection image back onto the original."""
+    top, left = offset
+    h, w = shape[:2]
+    t, r, b, l = (int(round(v / scale)) for v in box)
+    return (
+        min(max(t + top, 0), h - 1),
+        min(max(r + left, 0), w - 1),
+        min(max(b + top, 0), h - 1),
+        min(max(l + left, 0), w - 1),
+    )
+
+
+# =========================
+# Worker-side functions (must stay picklable / module level)
+# =========================
+
+def locate_and_encode(img, model="hog", max_dim=0, grayscale=False, roi=None):
+    """
+    Returns (locations, encodings) for every face found in a decoded RGB image.
+    Detection runs on the preprocessed image; encodings are always computed on the
+    full-resolution original, with locations given in original coordinates.
+    """
+    det, scale, offset = prepare_for_detection(img, max_dim=max_dim, grayscale=grayscale, roi=roi)
+    locs = face_recognition.face_locations(det, model=model)
+    if not locs:
+        return [], []
+    if det is not img:
+        locs = [map_box(box, scale, offset, img.shape) for box in locs]
+    return locs, face_recognition.face_encodings(img, known_face_locations=locs)
+
+
+def locate_and_encode_many(imgs, **opts):
+    """Batch form of locate_and_encode, run as a single job."""
+    return [locate_and_encode(img, **opts) for img in imgs]
+
+
+def _timed(fn, args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+# =========================
+# Pool
+# =========================
+
+class FacePool:
+    """
+    workers=0 runs jobs inline in the calling thread (same bookkeeping, no processes),
+    which is what you want for tests or single-process debugging.
+    """
+
+    def __init__(self, workers=2, max_queue=8, timeout=10.0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + max_queue)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._started = time.monotonic()
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._busy_seconds = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: a forked child would inherit the web worker's DB connections
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def submit(self, fn, *args, wait=0):
+        """
+        Queues fn(*args) and returns a Future of its result. Raises FaceBusy when the
+        pool is full; wait > 0 first waits up to that many seconds for a free slot.
+        """
+        acquired = self._slots.acquire(timeout=wait) if wait else self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self._rejected += 1
+            raise FaceBusy("Face service busy, please try again")
+        with self._lock:
+            self._in_flight += 1
+            self._submitted += 1
+
+        if self.workers <= 0:
+            inner = Future()
+            try:
+                inner.set_result(_timed(fn, args))
+            except Exception as e:
+                inner.set_exception(e)
+        else:
+            try:
+                try:
+                    inner = self._get_executor().submit(_timed, fn, args)
+                except BrokenProcessPool:
+                    # a worker died (OOM, segfault in dlib); start a fresh pool once
+                    self._reset_executor()
+                    inner = self._get_executor().submit(_timed, fn, args)
+            except Exception:
+                self._finish(None)
+                raise
+
+        outer = Future()
+
+        def _done(f):
+            try:
+                result, seconds = f.result()
+            except BaseException as e:
+                self._finish(None)
+                outer.set_exception(e)
+            else:
+                self._finish(seconds)
+                outer.set_result(result)
+
+        inner.add_done_callback(_done)
+        return outer
+
+    def _finish(self, seconds):
+        with self._lock:
+            self._in_flight -= 1
+            if seconds is None:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._busy_seconds += seconds
+        self._slots.release()
+
+    def run(self, fn, *args, timeout=None, wait=0):
+        """Submits and waits. Raises FaceBusy, FaceTimeout, or whatever the job raised."""
+        future = self.submit(fn, *args, wait=wait)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._timeouts += 1
+            raise FaceTimeout("Face processing timed out")
+
+    def stats(self):
+        with self._lock:
+            workers = max(self.workers, 1)
+            running = min(self._in_flight, workers)
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "running": running,
+                "queue_depth": self._in_flight - running,
+                "utilisation": running / workers,
+                "busy_ratio": self._busy_seconds / (elapsed * workers),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+            }
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self._reset_executor()
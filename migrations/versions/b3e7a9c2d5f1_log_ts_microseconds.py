@@ -0,0 +1,30 @@
+"""log ts microseconds
+
+Revision ID: b3e7a9c2d5f1
+Revises: f2c8a1d4b7e3
+Create Date: 2026-10-18 18:02:37.514208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e7a9c2d5f1'
+down_revision = 'f2c8a1d4b7e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # rows written through server_default were stored by SQLite as "YYYY-MM-DD HH:MM:SS",
+    # which sorts before the same second bound as "...SS.000000" by the keyset cursor;
+    # pad them to the format SQLAlchemy writes (ts is now always set in Python)
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for table in ("lab_logs", "hostel_logs"):
+        op.execute(f"UPDATE {table} SET ts = ts || '.000000' WHERE length(ts) = 19")
+
+
+def downgrade():
+    pass
@@ -0,0 +1,62 @@
+"""add search index
+
+Revision ID: f2c8a1d4b7e3
+Revises: e4b9c1d7f2a6
+Create Date: 2026-10-18 18:02:44.913270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8a1d4b7e3'
+down_revision = 'e4b9c1d7f2a6'
+branch_labels = None
+depends_on = None
+
+# same tables / triggers as search.Fts5Index.ddl() (SQLite) and MysqlFulltext.ensure() (MySQL)
+SEARCH_COLUMNS = {
+    'books': ('title', 'author', 'bid'),
+    'students': ('name', 'sid'),
+}
+SEARCH_RANK = {
+    'books': 'bm25(10.0, 4.0, 20.0)',
+    'students': 'bm25(10.0, 20.0)',
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table, columns in SEARCH_COLUMNS.items():
+        cols = ', '.join(columns)
+        if dialect == 'sqlite':
+            fts = f'{table}_fts'
+            new = ', '.join(f'new.{c}' for c in columns)
+            old = ', '.join(f'old.{c}' for c in columns)
+            op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', "
+                       f"content_rowid='id', tokenize='trigram')")
+            op.execute(f"INSERT INTO {fts}({fts}, rank) VALUES ('rank', '{SEARCH_RANK[table]}')")
+            op.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                       f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END")
+            op.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                       f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END")
+            op.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+                       f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                       f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END")
+            op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        elif dialect in ('mysql', 'mariadb'):
+            op.create_index(f'ft_{table}', table, list(columns), unique=False, mysql_prefix='FULLTEXT')
+        # other databases: search.TrigramIndex, in process
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in SEARCH_COLUMNS:
+        if dialect == 'sqlite':
+            fts = f'{table}_fts'
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+            op.execute(f'DROP TABLE IF EXISTS {fts}')
+        elif dialect in ('mysql', 'mariadb'):
+            op.drop_index(f'ft_{table}', table_name=table)
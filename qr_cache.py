@@ -0,0 +1,90 @@
+"""
+QR rendering and the content-addressed PNG cache.
+
+A code is cached under <folder>/cache/<hh>/<sha256>.png, where the hash covers
+the payload and the render settings, so a cached PNG never goes stale and the
+hash doubles as a strong ETag. Nothing here imports the Flask app, so
+render_many() can fan out to worker processes cheaply.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import qrcode
+from PIL import Image
+
+QR_RENDER = {"error_correction": qrcode.constants.ERROR_CORRECT_M, "box_size": 10, "border": 4}
+
+
+def qr_key(payload):
+    settings = ",".join(f"{k}={v}" for k, v in sorted(QR_RENDER.items()))
+    return hashlib.sha256(f"{settings}|{payload}".encode()).hexdigest()
+
+
+def cache_path(folder, key):
+    return os.path.join(folder, "cache", key[:2], key + ".png")
+
+
+def render_png(payload):
+    qr = qrcode.QRCode(**QR_RENDER)
+    qr.add_data(payload)
+    buf = io.BytesIO()
+    qr.make_image().save(buf)
+    return buf.getvalue()
+
+
+def ensure(folder, payload, key=None):
+    """Path of the cached PNG for payload, rendering it first if it is not cached yet."""
+    path = cache_path(folder, key or qr_key(payload))
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(render_png(payload))
+        os.replace(tmp, path)  # concurrent renders of the same code write identical bytes
+    return path
+
+
+def modules(folder, payload):
+    """
+    The code as a grayscale image with one pixel per module (quiet zone included),
+    for compositing at any scale. Read back from the cached PNG when there is one;
+    otherwise the matrix is computed and no PNG is encoded.
+    """
+    path = cache_path(folder, qr_key(payload))
+    try:
+        with Image.open(path) as im:
+            return im.convert("L").reduce(QR_RENDER["box_size"])
+    except OSError:
+        qr = qrcode.QRCode(**QR_RENDER)
+        qr.add_data(payload)
+        matrix = qr.get_matrix()
+        return Image.frombytes("L", (len(matrix), len(matrix)),
+                               bytes(0 if dark else 255 for row in matrix for dark in row))
+
+
+def _ensure_chunk(folder, payloads):
+    for payload in payloads:
+        ensure(folder, payload)
+    return len(payloads)
+
+
+def render_many(folder, payloads, workers=None, chunk=64):
+    """
+    Renders every payload not cached yet, over `workers` processes (default: CPU
+    count; 0 or 1 renders inline). Returns how many were rendered.
+    """
+    todo = [p for p in payloads if not os.path.exists(cache_path(folder, qr_key(p)))]
+    if not todo:
+        return 0
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(todo) <= chunk:
+        return _ensure_chunk(folder, todo)
+    # spawn: safe from a threaded server process; the children only import this module
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        parts = [todo[i:i + chunk] for i in range(0, len(todo), chunk)]
+        return sum(pool.map(_ensure_chunk, [folder] * len(parts), parts))
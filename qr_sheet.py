@@ -0,0 +1,165 @@
+"""
+Printable QR label sheets.
+
+render_pages(cards, ...) lays cards out on a grid, one Pillow canvas per page:
+each code comes from qr_cache.modules() (one pixel per module, read from the
+PNG cache) and is scaled up with NEAREST straight onto the page, with its
+caption drawn underneath. Pages are yielded as soon as they are full, and
+PdfWriter turns them into a PDF one page at a time, so a sheet of any length
+is produced (and can be streamed) holding a single page in memory.
+
+Nothing here imports the Flask app.
+"""
+import zlib
+
+from PIL import Image, ImageDraw, ImageFont
+
+import qr_cache
+
+PAGE_SIZES_MM = {"A4": (210, 297), "Letter": (215.9, 279.4)}
+
+
+class SheetLayout:
+
+    def __init__(self, page="A4", cols=3, rows=4, dpi=300, margin_mm=10, gap_mm=4):
+        if page not in PAGE_SIZES_MM:
+            raise ValueError(f"unknown page size {page!r} (one of {', '.join(PAGE_SIZES_MM)})")
+        if not (1 <= cols <= 12 and 1 <= rows <= 16):
+            raise ValueError("cols must be 1-12 and rows 1-16")
+        px = dpi / 25.4
+        w_mm, h_mm = PAGE_SIZES_MM[page]
+        self.dpi = dpi
+        self.cols, self.rows = cols, rows
+        self.per_page = cols * rows
+        self.size = (round(w_mm * px), round(h_mm * px))
+        self.margin = round(margin_mm * px)
+        self.gap = round(gap_mm * px)
+        self.cell = ((self.size[0] - 2 * self.margin - (cols - 1) * self.gap) // cols,
+                     (self.size[1] - 2 * self.margin - (rows - 1) * self.gap) // rows)
+        # caption: two lines under the code, sized to the cell
+        self.font_px = max(10, min(self.cell[0] // 14, self.cell[1] // 12))
+        self.caption_h = int(self.font_px * 2.6)
+        self.font = _font(self.font_px)
+
+    def origin(self, slot):
+        r, c = divmod(slot, self.cols)
+        return (self.margin + c * (self.cell[0] + self.gap),
+                self.margin + r * (self.cell[1] + self.gap))
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except (TypeError, OSError, ImportError):   # Pillow < 10.1 or no FreeType: fixed bitmap font
+        return ImageFont.load_default()
+
+
+def _fit(draw, text, font, width):
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def render_pages(cards, folder, layout):
+    """
+    cards: iterable of (payload, caption_line_1, caption_line_2). Yields one
+    grayscale page image per layout.per_page cards (the last one partly filled).
+    """
+    page = draw = None
+    slot = 0
+    cell_w, cell_h = layout.cell
+    for payload, line1, line2 in cards:
+        if page is None:
+            page = Image.new("L", layout.size, 255)
+            draw = ImageDraw.Draw(page)
+        x, y = layout.origin(slot)
+        draw.rectangle([x, y, x + cell_w - 1, y + cell_h - 1], outline=200)   # cut guide
+
+        mods = qr_cache.modules(folder, payload)
+        scale = max(1, min(cell_w - 2, cell_h - layout.caption_h - 2) // mods.width)
+        side = mods.width * scale
+        code = mods.resize((side, side), Image.NEAREST)
+        page.paste(code, (x + (cell_w - side) // 2, y + 1))
+
+        text_y = y + 1 + side + layout.font_px // 4
+        for line in (line1, line2):
+            if line:
+                line = _fit(draw, str(line), layout.font, cell_w - 8)
+                draw.text((x + cell_w // 2, text_y), line, fill=0, font=layout.font, anchor="ma")
+            text_y += int(layout.font_px * 1.25)
+
+        slot += 1
+        if slot == layout.per_page:
+            yield page
+            page, slot = None, 0
+    if page is not None:
+        yield page
+
+
+class PdfWriter:
+    """
+    Minimal streaming PDF: begin() and each page() return the bytes to send
+    next, end() returns the page tree, catalog and xref. Each page is one
+    Flate-compressed grayscale image filling it, so nothing is kept between
+    pages except object offsets.
+    """
+
+    def __init__(self, dpi):
+        self.dpi = dpi
+        self._offset = 0
+        self._offsets = {}     # object number => byte offset
+        self._pages = []
+        self._next = 3         # 1: catalog, 2: page tree (both written last)
+
+    def _obj(self, num, body, stream=None):
+        head = f"{num} 0 obj\n".encode() + body
+        if stream is not None:
+            head += b"\nstream\n" + stream + b"\nendstream"
+        data = head + b"\nendobj\n"
+        self._offsets[num] = self._offset
+        self._offset += len(data)
+        return data
+
+    def begin(self):
+        data = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self._offset += len(data)
+        return data
+
+    def page(self, image):
+        w, h = image.size
+        pt_w, pt_h = w * 72.0 / self.dpi, h * 72.0 / self.dpi
+        im, content, page = self._next, self._next + 1, self._next + 2
+        self._next += 3
+        self._pages.append(page)
+        pixels = zlib.compress(image.tobytes(), 1)   # level 1: half the time of 6 on mostly-white pages
+        ops = f"q {pt_w:.2f} 0 0 {pt_h:.2f} 0 0 cm /Im Do Q".encode()
+        return b"".join([
+            self._obj(im, (f"<< /Type /XObject /Subtype /Image /Width {w} /Height {h} "
+                           f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode "
+                           f"/Length {len(pixels)} >>").encode(), pixels),
+            self._obj(content, f"<< /Length {len(ops)} >>".encode(), ops),
+            self._obj(page, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {pt_w:.2f} {pt_h:.2f}] "
+                             f"/Resources << /XObject << /Im {im} 0 R >> >> /Contents {content} 0 R >>").encode()),
+        ])
+
+    def end(self):
+        kids = " ".join(f"{p} 0 R" for p in self._pages)
+        data = self._obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>".encode())
+        data += self._obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref_at = self._offset
+        count = self._next
+        xref = [f"xref\n0 {count}\n", "0000000000 65535 f \n"]
+        xref += [f"{self._offsets[n]:010d} 00000 n \n" for n in range(1, count)]
+        xref.append(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n")
+        return data + "".join(xref).encode()
+
+
+def pdf_stream(pages, dpi):
+    """Yields a PDF's bytes page by page; pages is any iterable of page images."""
+    pdf = PdfWriter(dpi)
+    yield pdf.begin()
+    for page in pages:
+        yield pdf.page(page)
+    yield pdf.end()
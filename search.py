@@ -0,0 +1,284 @@
+"""
+Indexed, ranked search over books and students.
+
+One interface, three backends, picked by make_search_index():
+
+    Fts5Index       SQLite: an external-content FTS5 table per kind using the
+                    trigram tokenizer, so a term matches anywhere inside a
+                    field (what ILIKE '%q%' did) but from the index. Results
+                    are ranked by bm25 with per-column weights. Triggers on
+                    the base table keep the index in sync, whatever writes
+                    the rows (ORM, Core executemany, raw SQL).
+    MysqlFulltext   MySQL/MariaDB: a FULLTEXT index; BOOLEAN MODE word-prefix
+                    matches ranked by MATCH() relevance. InnoDB maintains it.
+    TrigramIndex    anything else: an in-process trigram => ids map, loaded on
+                    first use and topped up before each search with the rows
+                    whose id is above the last one seen (rows are never edited
+                    in place by the app; call reset() if they are).
+
+ensure(conn, kind) creates a missing index (True if it did; commit then), and
+search(conn, kind, q, limit, offset) returns (total, [id, ...]), best first,
+with an exact key match (sid/bid) always on top; the caller loads the rows.
+Terms are ANDed. Trigram indexes cannot look up terms shorter than three
+characters, so those only filter the matches of longer terms (or, if the query
+has nothing longer, are matched by scanning).
+"""
+import re
+import threading
+from collections import defaultdict
+
+from sqlalchemy import text
+
+
+class SearchSpec:
+
+    def __init__(self, table, key, columns, weights):
+        """columns: searched fields (the key among them), weights: bm25 weight per column."""
+        self.table = table
+        self.key = key
+        self.columns = tuple(columns)
+        self.weights = tuple(weights)
+        self.fts = f"{table}_fts"
+
+
+def terms(q):
+    return [t for t in (q or "").lower().split() if t.strip('"')]
+
+
+def _like(term):
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _short_filter(spec, short, alias):
+    """SQL AND-ing LIKE filters for terms too short for a trigram index, plus its params."""
+    clauses, params = [], {}
+    for i, t in enumerate(short):
+        params[f"s{i}"] = _like(t)
+        clauses.append("(" + " OR ".join(f"lower({alias}.{c}) LIKE :s{i} ESCAPE '\\'" for c in spec.columns) + ")")
+    return clauses, params
+
+
+class Fts5Index:
+    name = "fts5"
+
+    def __init__(self, specs):
+        self.specs = specs
+        self._ready = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def supported(conn):
+        version = conn.exec_driver_sql("SELECT sqlite_version()").scalar()
+        has_fts5 = conn.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar()
+        # trigram tokenizer: 3.34+
+        return bool(has_fts5) and tuple(int(p) for p in version.split(".")[:2]) >= (3, 34)
+
+    @staticmethod
+    def ddl(spec):
+        cols = ", ".join(spec.columns)
+        new = ", ".join(f"new.{c}" for c in spec.columns)
+        old = ", ".join(f"old.{c}" for c in spec.columns)
+        t, f = spec.table, spec.fts
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {f} USING fts5({cols}, content='{t}', content_rowid='id', "
+            f"tokenize='trigram')",
+            # column weights as the table's rank, so ORDER BY rank can use FTS5's top-N path
+            f"INSERT INTO {f}({f}, rank) VALUES ('rank', 'bm25({', '.join(str(w) for w in spec.weights)})')",
+            f"CREATE TRIGGER IF NOT EXISTS {f}_ai AFTER INSERT ON {t} BEGIN "
+            f"INSERT INTO {f}(rowid, {cols}) VALUES (new.id, {new}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {f}_ad AFTER DELETE ON {t} BEGIN "
+            f"INSERT INTO {f}({f}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {f}_au AFTER UPDATE OF {cols} ON {t} BEGIN "
+            f"INSERT INTO {f}({f}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+            f"INSERT INTO {f}(rowid, {cols}) VALUES (new.id, {new}); END",
+        ]
+
+    def ensure(self, conn, kind):
+        """Creates the FTS table and triggers if missing (then indexes existing rows); True if it did."""
+        if kind in self._ready:
+            return False
+        with self._lock:
+            if kind in self._ready:
+                return False
+            spec = self.specs[kind]
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (spec.fts,)).first()
+            if not exists:
+                for stmt in self.ddl(spec):
+                    conn.exec_driver_sql(stmt)
+                self.rebuild(conn, kind)
+            self._ready.add(kind)
+            return not exists
+
+    def rebuild(self, conn, kind):
+        f = self.specs[kind].fts
+        conn.exec_driver_sql(f"INSERT INTO {f}({f}) VALUES ('rebuild')")
+
+    def search(self, conn, kind, q, limit, offset=0):
+        spec = self.specs[kind]
+        words = terms(q)
+        if not words:
+            return 0, []
+        long_ = [t for t in words if len(t) >= 3]
+        short = [t for t in words if len(t) < 3]
+        where, params = _short_filter(spec, short, "b")
+        if long_:
+            params["match"] = " ".join('"' + t.replace('"', '""') + '"' for t in long_)
+            where.insert(0, f"{spec.fts} MATCH :match")
+            source = f"{spec.fts} JOIN {spec.table} b ON b.id = {spec.fts}.rowid" if short else spec.fts
+            id_col, order = f"{spec.fts}.rowid", f"{spec.fts}.rank"
+        else:
+            source, id_col, order = f"{spec.table} b", "b.id", "b.id"
+        cond = " AND ".join(where)
+        total = conn.execute(text(f"SELECT count(*) FROM {source} WHERE {cond}"), params).scalar()
+        if not total or offset >= total:
+            return total, []
+
+        # an exact ID (always among the matches: it contains every term) goes first
+        exact = None
+        if len(words) == 1:
+            raw = q.strip()
+            exact = conn.execute(text(f"SELECT id FROM {spec.table} WHERE {spec.key} IN (:raw, :upper)"),
+                                 {"raw": raw, "upper": raw.upper()}).scalar()
+        head = [exact][offset:offset + limit] if exact is not None else []
+        if exact is not None:
+            cond += f" AND {id_col} != :exact"
+            params["exact"] = exact
+            offset = max(0, offset - 1)
+        params.update(limit=limit - len(head), offset=offset)
+        ids = conn.execute(text(
+            f"SELECT {id_col} FROM {source} WHERE {cond} ORDER BY {order} LIMIT :limit OFFSET :offset"),
+            params).scalars().all() if params["limit"] else []
+        return total, head + ids
+
+
+class MysqlFulltext:
+    name = "mysql"
+
+    def __init__(self, specs):
+        self.specs = specs
+        self._ready = set()
+        self._lock = threading.Lock()
+
+    def ensure(self, conn, kind):
+        if kind in self._ready:
+            return False
+        with self._lock:
+            if kind in self._ready:
+                return False
+            spec = self.specs[kind]
+            index = f"ft_{spec.table}"
+            exists = conn.execute(text(
+                "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                "AND table_name = :t AND index_name = :i LIMIT 1"), {"t": spec.table, "i": index}).first()
+            if not exists:
+                conn.exec_driver_sql(f"ALTER TABLE {spec.table} ADD FULLTEXT INDEX {index} ({', '.join(spec.columns)})")
+            self._ready.add(kind)
+            return not exists
+
+    def rebuild(self, conn, kind):
+        conn.exec_driver_sql(f"OPTIMIZE TABLE {self.specs[kind].table}")
+
+    def search(self, conn, kind, q, limit, offset=0):
+        spec = self.specs[kind]
+        words = [w for w in (re.sub(r"[^\w]", "", t) for t in terms(q)) if w]
+        if not words:
+            return 0, []
+        match = f"MATCH({', '.join(spec.columns)}) AGAINST (:q IN BOOLEAN MODE)"
+        params = {"q": " ".join(f"+{w}*" for w in words), "exact": " ".join(words), "limit": limit, "offset": offset}
+        total = conn.execute(text(f"SELECT count(*) FROM {spec.table} WHERE {match}"), params).scalar()
+        if not total or offset >= total:
+            return total, []
+        ids = conn.execute(text(
+            f"SELECT id FROM {spec.table} WHERE {match} "
+            f"ORDER BY {spec.key} = :exact DESC, {match} DESC LIMIT :limit OFFSET :offset"), params).scalars().all()
+        return total, ids
+
+
+class TrigramIndex:
+    name = "trigram"
+
+    def __init__(self, specs):
+        self.specs = specs
+        self._lock = threading.Lock()
+        self._kinds = {}
+
+    def ensure(self, conn, kind):
+        return False
+
+    def reset(self, kind=None):
+        with self._lock:
+            if kind is None:
+                self._kinds.clear()
+            else:
+                self._kinds.pop(kind, None)
+
+    def rebuild(self, conn, kind):
+        self.reset(kind)
+
+    @staticmethod
+    def _grams(s):
+        return {s[i:i + 3] for i in range(len(s) - 2)}
+
+    def _refresh(self, conn, kind):
+        spec = self.specs[kind]
+        state = self._kinds.setdefault(kind, {"last_id": 0, "docs": {}, "post": defaultdict(set)})
+        rows = conn.execute(text(
+            f"SELECT id, {', '.join(spec.columns)} FROM {spec.table} WHERE id > :last ORDER BY id"),
+            {"last": state["last_id"]}).all()
+        for row in rows:
+            fields = tuple((v or "").lower() for v in row[1:])
+            state["docs"][row[0]] = fields
+            for field in fields:
+                for g in self._grams(field):
+                    state["post"][g].add(row[0])
+        if rows:
+            state["last_id"] = rows[-1][0]
+        return state
+
+    def search(self, conn, kind, q, limit, offset=0):
+        spec = self.specs[kind]
+        words = terms(q)
+        if not words:
+            return 0, []
+        with self._lock:
+            state = self._refresh(conn, kind)
+            grams = set().union(*(self._grams(t) for t in words))
+            if grams:
+                lists = sorted((state["post"].get(g, set()) for g in grams), key=len)
+                candidates = lists[0].intersection(*lists[1:])
+            else:
+                candidates = state["docs"].keys()
+            key_at = spec.columns.index(spec.key)
+            exact = " ".join(words)
+            scored = []
+            for doc_id in candidates:
+                fields = state["docs"][doc_id]
+                score = 0.0
+                for t in words:
+                    hit = [w * (2 if f.startswith(t) else 1) for f, w in zip(fields, spec.weights) if t in f]
+                    if not hit:
+                        break
+                    score += max(hit)
+                else:
+                    scored.append((fields[key_at] != exact, -score, doc_id))
+        scored.sort()
+        return len(scored), [doc_id for _exact, _score, doc_id in scored[offset:offset + limit]]
+
+
+BACKENDS = {"fts5": Fts5Index, "mysql": MysqlFulltext, "trigram": TrigramIndex}
+
+
+def make_search_index(conn, specs, backend="auto"):
+    """backend: "auto" (FTS5 on SQLite, FULLTEXT on MySQL, else in-process trigrams) or one of BACKENDS."""
+    if backend == "auto":
+        dialect = conn.dialect.name
+        if dialect == "sqlite" and Fts5Index.supported(conn):
+            backend = "fts5"
+        elif dialect in ("mysql", "mariadb"):
+            backend = "mysql"
+        else:
+            backend = "trigram"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown search backend: {backend}")
+    return BACKENDS[backend](specs)
@@ -15,6 +15,27 @@ async function fetchJson(url, opts) {
   catch { return { ok: r.ok, status: r.status, data: {} }; }
 }
 
+// Opt-in compressed face uploads: localStorage.setItem("faceUpload", "jpeg")  (or "webp").
+// Sends the frame as a multipart blob instead of a base64 PNG data URL.
+const FACE_UPLOAD = localStorage.getItem("faceUpload");
+
+function canvasBlob(canvas) {
+  return new Promise(resolve => canvas.toBlob(resolve, `image/${FACE_UPLOAD}`, 0.85));
+}
+
+async function postFaceVerify(canvas, sid) {
+  if (FACE_UPLOAD === "jpeg" || FACE_UPLOAD === "webp") {
+    const form = new FormData();
+    form.append("sid", sid);
+    form.append("image", await canvasBlob(canvas), `probe.${FACE_UPLOAD}`);
+    return fetchJson("/api/face/verify", { method: "POST", body: form });
+  }
+  return fetchJson("/api/face/verify", {
+    method: "POST", headers: {"Content-Type":"application/json"},
+    body: JSON.stringify({ sid, image: canvas.toDataURL("image/png") })
+  });
+}
+
 async function startSession() {
   const class_id = Number(document.getElementById("class_id").value);
   const res = await fetchJson("/api/attendance/start", {
@@ -34,6 +55,7 @@ async function startSession() {
 
 async function stopSession() {
   if (!sessionId) return;
+  await flushMarks();
   const res = await fetchJson("/api/attendance/stop", {
     method: "POST", headers: {"Content-Type":"application/json"},
     body: JSON.stringify({ session_id: sessionId })
@@ -83,12 +105,8 @@ async function startFaceVerify() {
   canvas.height = video.videoHeight;
   const ctx = canvas.getContext("2d");
   ctx.drawImage(video, 0, 0);
-  const imgData = canvas.toDataURL("image/png");
 
-  const res = await fetchJson("/api/face/verify", {
-    method: "POST", headers: {"Content-Type":"application/json"},
-    body: JSON.stringify({ sid: currentSid, image: imgData })
-  });
+  const res = await postFaceVerify(canvas, currentSid);
 
   const msg = document.getElementById("faceVerifyMsg");
   if (res.ok && res.data.ok) {
@@ -119,16 +137,42 @@ async function stopFaceWithPassword() {
   }
 }
 
-async function markPresent(sid) {
+// Scans are buffered and sent together once a second (/api/attendance/mark-batch),
+// so a class emptying through the door costs a few requests instead of one per student.
+const MARK_FLUSH_MS = 1000;
+let markQueue = [];
+let markTimer = null;
+
+function markPresent(sid) {
   if (!sessionId) { alert("Start a session first"); return; }
-  const res = await fetchJson("/api/attendance/mark", {
-    method: "POST", headers: {"Content-Type":"application/json"},
-    body: JSON.stringify({ session_id: sessionId, sid })
-  });
+  markQueue.push({ sid, ts: Date.now() });
+  document.getElementById("markStatus").textContent = `Queued ${sid} (${markQueue.length} pending)`;
+  if (!markTimer) markTimer = setTimeout(flushMarks, MARK_FLUSH_MS);
+}
+
+async function flushMarks() {
+  clearTimeout(markTimer);
+  markTimer = null;
+  if (!markQueue.length || !sessionId) return;
+  const items = markQueue;
+  markQueue = [];
   const m = document.getElementById("markStatus");
+  let res;
+  try {
+    res = await fetchJson("/api/attendance/mark-batch", {
+      method: "POST", headers: {"Content-Type":"application/json"},
+      body: JSON.stringify({ session_id: sessionId, items })
+    });
+  } catch (e) {
+    res = { ok: false, status: 0, data: {} };
+  }
   if (res.ok && res.data.ok) {
-    m.textContent = res.data.msg || "Marked";
-    refreshList();
+    m.textContent = res.data.results.map(r => `${r.sid ?? "#" + r.index}: ${r.error || r.msg}`).join(" · ");
+  } else if (res.status === 0 || res.status >= 500) {
+    // network / server trouble: keep the scans and try again on the next tick
+    markQueue = items.concat(markQueue);
+    m.textContent = `Offline, ${markQueue.length} scans pending`;
+    if (!markTimer) markTimer = setTimeout(flushMarks, MARK_FLUSH_MS);
   } else {
     m.textContent = res.data.error || "Failed";
   }
@@ -140,11 +184,35 @@ function manualMark() {
   markPresent(sid);
 }
 
+let present = new Map();  // sid => ts, for the open session
+
+function renderPresent() {
+  const list = [...present].map(([sid, ts]) => `${sid} @ ${new Date(ts).toLocaleTimeString()}`);
+  document.getElementById("presentList").textContent = list.length ? list.join(", ") : "—";
+}
+
 async function refreshList() {
   if (!sessionId) return;
   const r = await fetchJson(`/api/attendance/session/${sessionId}`);
   if (r.ok && r.data.ok) {
-    const list = r.data.session.records.map(x => `${x.sid} @ ${new Date(x.ts).toLocaleTimeString()}`);
-    document.getElementById("presentList").textContent = list.length ? list.join(", ") : "—";
+    present = new Map(r.data.session.records.map(x => [x.sid, x.ts]));
+    renderPresent();
   }
 }
+
+// Live feed: marks from this and every other scanner of the session arrive over
+// /api/events (server-sent events) instead of re-fetching the whole list.
+function openFeed() {
+  const feed = new EventSource(`/api/events?kinds=attendance&cursor=${encodeURIComponent(EVENT_CURSOR)}`);
+  feed.addEventListener("attendance", (e) => {
+    const r = JSON.parse(e.data);
+    if (r.session_id !== sessionId || present.has(r.sid)) return;
+    present.set(r.sid, r.ts);
+    renderPresent();
+  });
+  // away too long to catch up from the feed: reload the list once
+  feed.addEventListener("reset", () => refreshList());
+  return feed;
+}
+
+document.addEventListener("DOMContentLoaded", openFeed);
@@ -21,6 +21,27 @@ async function fetchJson(url, opts) {
   catch { return { ok: r.ok, status: r.status, data: {} }; }
 }
 
+// Opt-in compressed face uploads: localStorage.setItem("faceUpload", "jpeg")  (or "webp").
+// Sends the frame as a multipart blob instead of a base64 PNG data URL.
+const FACE_UPLOAD = localStorage.getItem("faceUpload");
+
+function canvasBlob(canvas) {
+  return new Promise(resolve => canvas.toBlob(resolve, `image/${FACE_UPLOAD}`, 0.85));
+}
+
+async function postFaceVerify(canvas, sid) {
+  if (FACE_UPLOAD === "jpeg" || FACE_UPLOAD === "webp") {
+    const form = new FormData();
+    form.append("sid", sid);
+    form.append("image", await canvasBlob(canvas), `probe.${FACE_UPLOAD}`);
+    return fetchJson("/api/face/verify", { method: "POST", body: form });
+  }
+  return fetchJson("/api/face/verify", {
+    method: "POST", headers: {"Content-Type":"application/json"},
+    body: JSON.stringify({ sid, image: canvas.toDataURL("image/png") })
+  });
+}
+
 async function logLabFinal(sid) {
   const lab_id = Number(document.getElementById("lab_id").value);
   const res = await fetchJson("/api/labs/log", {
@@ -74,12 +95,8 @@ async function startFaceVerify() {
   canvas.height = video.videoHeight;
   const ctx = canvas.getContext("2d");
   ctx.drawImage(video, 0, 0);
-  const imgData = canvas.toDataURL("image/png");
 
-  const res = await fetchJson("/api/face/verify", {
-    method: "POST", headers: {"Content-Type":"application/json"},
-    body: JSON.stringify({ sid: currentSid, image: imgData })
-  });
+  const res = await postFaceVerify(canvas, currentSid);
 
   const msg = document.getElementById("faceVerifyMsg");
   if (res.ok && res.data.ok) {
@@ -127,8 +144,42 @@ async function refreshInside() {
   }
 }
 
+// Live feed: rows logged at any gate/lab arrive over /api/events (server-sent events)
+// instead of reloading the page. The browser reconnects by itself and resumes from
+// the last event id; "reset" means it was away too long to catch up.
+function openFeed(kinds, handlers) {
+  const feed = new EventSource(`/api/events?kinds=${kinds}&cursor=${encodeURIComponent(EVENT_CURSOR)}`);
+  for (const [kind, fn] of Object.entries(handlers)) {
+    feed.addEventListener(kind, (e) => fn(JSON.parse(e.data)));
+  }
+  feed.addEventListener("reset", () => location.reload());
+  return feed;
+}
+
+function prependRow(tbodyId, cells, maxRows) {
+  const tbody = document.getElementById(tbodyId);
+  const tr = document.createElement("tr");
+  for (const c of cells) {
+    const td = document.createElement("td");
+    td.textContent = c;
+    tr.appendChild(td);
+  }
+  tbody.insertBefore(tr, tbody.firstChild);
+  while (tbody.rows.length > maxRows) tbody.deleteRow(-1);
+}
+
+function fmtTs(iso) {
+  return iso.slice(0, 16).replace("T", " ");  // same as the server-rendered rows
+}
+
 document.addEventListener("DOMContentLoaded", () => {
   setMode("TOGGLE");
   ensureScanner();
   refreshInside();
+  openFeed("lab", {
+    lab: (l) => {
+      prependRow("labLogs", [fmtTs(l.ts), l.lab_name, l.sid, l.action], 50);
+      if (l.lab_id === Number(document.getElementById("lab_id").value)) refreshInside();
+    },
+  });
 });
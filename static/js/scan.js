@@ -99,6 +99,41 @@ async function returnNow() {
   refreshActions();
 }
 
+// Type-ahead for the manual box: ranked students and books as QR payloads
+let suggestTimer = null;
+let suggestSeq = 0;
+
+async function suggest(q) {
+  const list = document.getElementById("manualSuggest");
+  if (!list) return;
+  const seq = ++suggestSeq;
+  if (q.length < 3 || q.includes(":")) {
+    list.innerHTML = "";
+    return;
+  }
+  const qs = `q=${encodeURIComponent(q)}&limit=5`;
+  const [students, books] = await Promise.all([
+    fetchJson(`/api/search/students?${qs}`),
+    fetchJson(`/api/search/books?${qs}`)
+  ]);
+  if (seq !== suggestSeq) return;  // a newer keystroke already asked
+  const options = [];
+  for (const s of (students.data.results || [])) {
+    options.push({ value: `STUDENT:${s.sid}`, label: `${s.name} (${s.sid})` });
+  }
+  for (const b of (books.data.results || [])) {
+    options.push({ value: `BOOK:${b.bid}`, label: `${b.title} (${b.bid})${b.available ? "" : " — borrowed"}` });
+  }
+  list.innerHTML = "";
+  for (const o of options) {
+    const opt = document.createElement("option");
+    opt.value = o.value;
+    opt.label = o.label;
+    opt.textContent = o.label;
+    list.appendChild(opt);
+  }
+}
+
 async function startScanner() {
   const html5QrcodeScanner = new Html5QrcodeScanner(
     "reader",
@@ -117,4 +152,11 @@ document.addEventListener("DOMContentLoaded", () => {
   const returnBtn = document.getElementById("returnBtn");
   if (borrowBtn) borrowBtn.addEventListener("click", borrowNow);
   if (returnBtn) returnBtn.addEventListener("click", returnNow);
+  const manual = document.getElementById("manual");
+  if (manual) {
+    manual.addEventListener("input", () => {
+      clearTimeout(suggestTimer);
+      suggestTimer = setTimeout(() => suggest(manual.value.trim()), 150);
+    });
+  }
 });
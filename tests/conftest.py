@@ -0,0 +1,42 @@
+import os
+import tempfile
+
+import pytest
+
+# one file-backed SQLite database for the whole run, set before the app is imported
+_tmp = tempfile.mkdtemp(prefix="app_tests_")
+DB_PATH = os.path.join(_tmp, "test.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+os.environ["COOLDOWN_BACKEND"] = "memory"
+
+import app as A  # noqa: E402
+
+MIGRATIONS = os.path.join(os.path.dirname(A.__file__), "migrations")
+
+
+def _reset(build):
+    with A.app.app_context():
+        A.db.session.remove()
+        A.db.engine.dispose()
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
+        build()
+        A.seed_demo()
+        A.hot_cache.clear()
+        A.dashboard_stats.invalidate()
+        A._search_index = None   # remembers which index tables it created
+
+
+@pytest.fixture
+def client():
+    """Seeded demo data on a schema built by create_all()."""
+    _reset(A.db.create_all)
+    return A.app.test_client()
+
+
+@pytest.fixture
+def migrated():
+    """Seeded demo data on a schema built by running every migration."""
+    from flask_migrate import upgrade
+    _reset(lambda: upgrade(directory=MIGRATIONS))
+    return A.app.test_client()
@@ -0,0 +1,83 @@
+import random
+import threading
+import time
+
+import app as A
+
+KIOSKS = 8
+ATTEMPTS = 30
+BOOKS = ["BK0001", "BK0002", "BK0003"]
+
+
+def test_borrow_and_return_under_contention(client):
+    lock = threading.Lock()
+    holder = dict.fromkeys(BOOKS)
+    double_borrows, unexpected, returns_acked, kept = [], [], [], {}
+    barrier = threading.Barrier(KIOSKS)
+
+    def post(c, url, body):
+        r = c.post(url, json=body)
+        if r.status_code not in (200, 409):
+            with lock:
+                unexpected.append((url, r.status_code, r.get_data(as_text=True)))
+        return r.json if r.status_code == 200 else None
+
+    def kiosk(k):
+        rnd = random.Random(k)
+        clients = [A.app.test_client(), A.app.test_client()]
+        sid = ("STU1001", "STU1002", "STU1003")[k % 3]
+        barrier.wait()
+        for attempt in range(ATTEMPTS):
+            bid = rnd.choice(BOOKS)
+            loan = post(clients[0], "/api/borrow", {"sid": sid, "bid": bid})
+            if loan is None:
+                continue
+            with lock:
+                if holder[bid] is not None:
+                    double_borrows.append((bid, holder[bid], k))
+                holder[bid] = k
+            if attempt == ATTEMPTS - 1 and k % 2:
+                with lock:
+                    kept[bid] = loan["borrow_id"]   # left out on loan, for the end-state check
+                continue
+            time.sleep(0.001)
+            with lock:
+                holder[bid] = None
+            # odd attempts: the same return tapped twice at once, which only borrow_id makes safe
+            # (a late tap without it would close whatever loan is open by then); even: bid only
+            body = {"bid": bid, "borrow_id": loan["borrow_id"]} if attempt % 2 else {"bid": bid}
+            acked = []
+            taps = [threading.Thread(target=lambda c=c: acked.append(post(c, "/api/return", body) is not None))
+                    for c in (clients if attempt % 2 else clients[:1])]
+            for t in taps:
+                t.start()
+            for t in taps:
+                t.join()
+            with lock:
+                returns_acked.append((loan["borrow_id"], sum(acked)))
+
+    workers = [threading.Thread(target=kiosk, args=(k,)) for k in range(KIOSKS)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    assert unexpected == []
+    assert double_borrows == []
+    assert returns_acked, "no borrow ever succeeded"
+    # every loan handed back was closed by exactly one acked return
+    assert [n for _id, n in returns_acked if n != 1] == []
+
+    with A.app.app_context():
+        loans = {b.id: b for b in A.Borrow.query.all()}
+        assert sorted(loans) == sorted([i for i, _n in returns_acked] + list(kept.values()))
+        for borrow_id, _n in returns_acked:
+            assert loans[borrow_id].status == "RETURNED"
+        # ... and each acked return closed exactly one loan
+        assert sum(b.status == "RETURNED" for b in loans.values()) == len(returns_acked)
+        for book in A.Book.query.filter(A.Book.bid.in_(BOOKS)):
+            open_loans = [b.id for b in loans.values() if b.book_bid == book.bid and b.status == "BORROWED"]
+            if book.available:
+                assert open_loans == []
+            else:
+                assert open_loans == [kept[book.bid]]
@@ -0,0 +1,45 @@
+import threading
+
+from event_feed import EventBroker
+
+
+class Table:
+    """Rows by id, only the committed ones visible, like an auto-increment table."""
+
+    def __init__(self):
+        self.rows = {}
+        self.lock = threading.Lock()
+
+    def commit(self, row_id):
+        with self.lock:
+            self.rows[row_id] = {"id": row_id}
+
+    def head(self):
+        with self.lock:
+            return {"log": max(self.rows, default=0)}
+
+    def fetch(self, after):
+        with self.lock:
+            return [("log", i, self.rows[i]) for i in sorted(self.rows) if i > after["log"]]
+
+
+def test_rows_committed_out_of_id_order_are_sent_once():
+    table = Table()
+    table.commit(1)
+    broker = EventBroker(("log",), table.head, table.fetch, poll_interval=0.01, lookback=10)
+    stream = broker.subscribe(heartbeat=0.05, max_seconds=5)
+    assert next(stream) is None  # subscribed at id 1
+    sent = []
+    # 3 commits before 2, as InnoDB allows; 2 must still arrive, and nothing twice
+    for row_id in (3, 2, 4):
+        table.commit(row_id)
+        broker.notify()
+        item = next(stream)
+        while item is None:
+            item = next(stream)
+        sent.append(item)
+    assert next(stream) is None
+    stream.close()
+
+    assert [data["id"] for _kind, _cursor, data in sent] == [3, 2, 4]
+    assert sent[-1][1] == "4"
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import app as A
+
+
+def _page_all(client, limit, **params):
+    seen, cursor, pages = [], None, 0
+    while True:
+        args = dict(params, limit=limit, **({"cursor": cursor} if cursor else {}))
+        body = client.get("/api/labs/logs", query_string=args).json
+        seen += [log["id"] for log in body["logs"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if not cursor:
+            return seen, pages
+        assert pages < 100, "cursor does not advance"
+
+
+def test_pages_through_rows_in_the_same_second(client):
+    same_second = datetime(2026, 10, 18, 9, 30, 0)
+    with A.app.app_context():
+        A.db.session.execute(A.db.insert(A.LabLog), [
+            {"lab_id": 1, "student_sid": "STU1001", "action": "ENTRY", "ts": same_second} for _ in range(30)])
+        A.db.session.commit()
+
+    ids, pages = _page_all(client, 10)
+    assert len(ids) == 30 and len(set(ids)) == 30
+    assert ids == sorted(ids, reverse=True)
+    assert pages == 3
+
+
+def test_pages_through_scans_logged_back_to_back(client):
+    for sid in ("STU1001", "STU1002", "STU1003") * 8:
+        A._lab_cooldowns.clear()
+        assert client.post("/api/labs/log", json={"lab_id": 1, "sid": sid, "action": "TOGGLE"}).json["ok"]
+
+    ids, _ = _page_all(client, 5, lab_id=1)
+    assert len(ids) == 24 and len(set(ids)) == 24
+
+
+def test_malformed_since_is_a_400(client):
+    r = client.get("/api/labs/logs", query_string={"since": "yesterday"})
+    assert r.status_code == 400
+    assert r.json["ok"] is False
@@ -0,0 +1,18 @@
+import app as A
+
+
+def _sheet_ids(kind, **filters):
+    with A.app.app_context():
+        return [row[0] for row in A.db.session.execute(A.sheet_query(kind, **filters))]
+
+
+def test_sheet_match_uses_the_list_page_search(client):
+    # every term has to match, in any field and any order, as on /books?q=
+    assert _sheet_ids("books", match="martin clean") == ["BK0001"]
+    assert _sheet_ids("books", match="clean patterns") == []
+    assert _sheet_ids("students", match="gupta") == ["STU1003"]
+
+
+def test_sheet_match_covers_more_than_one_search_page(client, monkeypatch):
+    monkeypatch.setattr(A, "SHEET_BATCH", 1)
+    assert _sheet_ids("books", match="BK000") == ["BK0001", "BK0002", "BK0003"]
@@ -0,0 +1,14 @@
+import pytest
+
+import app as A
+
+with A.app.app_context():
+    HOT_QUERIES = [name for name, _table, _query in A._hot_queries()]
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_an_index(migrated, name):
+    with A.app.app_context():
+        table, query = next((t, q) for n, t, q in A._hot_queries() if n == name)
+        plan = A._explain(query)
+        assert A._full_scans(plan, table, "sqlite") == [], [r["detail"] for r in plan]
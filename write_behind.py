@@ -0,0 +1,277 @@
+"""
+Write-behind ingestion for scan rows, with group commit.
+
+enqueue(kind, row) appends the row to an append-only journal file, fsyncs it
+(concurrent callers share one fsync) and returns; the caller can ack the scan
+right away. A background thread applies what queued up every flush_ms, or as
+soon as flush_rows are waiting, in one transaction with one executemany per
+kind, instead of one commit per scan.
+
+Journal segments are "<pid>-<n>.log" files of JSON lines in `directory`. The
+flusher rotates to a new segment, applies the closed one's rows and deletes it.
+Every segment is flock()ed by the process writing it, so when a worker starts
+it can tell segments left behind by a dead process (the lock is free) and
+replays them before anything else. apply() is called with replay=True then,
+since some of those rows may already have been committed before the crash.
+
+If a batch fails with one of reject_errors (a row the database will never
+accept), its rows are retried one at a time and the ones that fail on their
+own are appended to rejected.jsonl in `directory` instead of being queued
+again; any other error (database down, locked) keeps the whole batch queued.
+"""
+import atexit
+import itertools
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # no flock: replay whatever is there at startup (single process)
+    fcntl = None
+
+
+class Backlogged(Exception):
+    """More rows are waiting than max_pending; the database is not keeping up."""
+
+
+class WriteBehindBuffer:
+
+    def __init__(self, directory, apply, flush_ms=50, flush_rows=500, fsync=True,
+                 max_pending=50000, context=None, reject_errors=(KeyError, TypeError, ValueError)):
+        """
+        apply(rows, replay)   writes [(kind, row), ...] in one transaction; raising
+                              keeps the rows queued (and journaled) for the next flush
+        context()             optional context manager apply() runs in (an app context)
+        reject_errors         exceptions that mean a row itself is bad: it is set
+                              aside in rejected.jsonl rather than retried
+        """
+        self.directory = directory
+        self.flush_interval = flush_ms / 1000.0
+        self.flush_rows = flush_rows
+        self.fsync = fsync
+        self.max_pending = max_pending
+        self._apply = apply
+        self._context = context
+        self.reject_errors = tuple(reject_errors)
+        self.rejected_path = os.path.join(directory, "rejected.jsonl")
+        self._lock = threading.Lock()        # pending + current segment
+        self._sync_lock = threading.Lock()   # one fsync at a time, covering every line written so far
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = []
+        self._written = 0
+        self._synced = 0
+        self._closed = []      # (path, fd) rotated out, not applied yet
+        self._seq = itertools.count()
+        self._fd = None
+        self._thread = None
+        self._stats = {"enqueued": 0, "flushes": 0, "flushed_rows": 0, "replayed_rows": 0,
+                       "flush_errors": 0, "rejected_rows": 0, "fsyncs": 0, "max_flush_rows": 0, "last_error": None}
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.close)
+
+    # -- journal ---------------------------------------------------------------
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"{os.getpid()}-{next(self._seq)}.log")
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if self.fsync:
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)   # the new file's directory entry, once per segment
+            finally:
+                os.close(dir_fd)
+        return path, fd
+
+    def _drop_segment(self, path, fd):
+        os.remove(path)
+        os.close(fd)
+
+    def enqueue(self, kind, row):
+        """Journals one row; returns once it is on disk (with fsync=True)."""
+        self.enqueue_many(kind, [row])
+
+    def enqueue_many(self, kind, rows):
+        """Journals several rows of one kind with a single write (and fsync)."""
+        data = b"".join((json.dumps({"k": kind, "r": row}, separators=(",", ":"), default=str) + "\n").encode()
+                        for row in rows)
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise Backlogged(f"{len(self._pending)} scans waiting to be written")
+            if self._fd is None:
+                self._path, self._fd = self._open_segment()
+            os.write(self._fd, data)
+            self._pending.extend((kind, row) for row in rows)
+            self._written += 1
+            mine, fd = self._written, self._fd
+            self._stats["enqueued"] += len(rows)
+            full = len(self._pending) >= self.flush_rows
+        self._ensure_running()
+        if full:
+            self._wake.set()
+        if self.fsync:
+            self._sync(mine, fd)
+
+    def _sync(self, mine, fd):
+        # group commit: whoever gets the lock fsyncs for every line written so far;
+        # the callers queued behind it usually find their line already covered
+        with self._sync_lock:
+            if self._synced >= mine:
+                return
+            with self._lock:
+                target = self._written
+                fds = [fd] + [f for _p, f in self._closed if f != fd]
+            for f in fds:
+                try:
+                    os.fsync(f)
+                except OSError:
+                    pass  # segment already applied and closed by the flusher
+            self._synced = target
+            self._stats["fsyncs"] += 1
+
+    # -- flushing --------------------------------------------------------------
+
+    def _ensure_running(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="scan-write-behind", daemon=True)
+                    self._thread.start()
+
+    def start(self):
+        """Replays orphaned segments now instead of at the first scan."""
+        self._ensure_running()
+
+    def _run(self):
+        self.replay()
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _in_context(self, fn):
+        with self._flush_lock:
+            if self._context is None:
+                return fn()
+            with self._context():
+                return fn()
+
+    def flush(self):
+        """Applies everything queued so far. Returns the number of rows written."""
+        return self._in_context(self._flush)
+
+    def _flush(self):
+        with self._lock:
+            if self._fd is not None:
+                self._closed.append((self._path, self._fd))
+                self._fd = None
+            rows, self._pending = self._pending, []
+            closed = list(self._closed)
+        if not rows:
+            return 0
+        left = self._apply_rows(rows, replay=False)
+        if left:
+            with self._lock:
+                self._pending[:0] = left   # retried on the next tick, still journaled
+            return len(rows) - len(left)
+        with self._lock:
+            self._closed = [c for c in self._closed if c not in closed]
+        with self._sync_lock:  # not while an enqueuer is fsyncing these fds
+            for path, fd in closed:
+                self._drop_segment(path, fd)
+        self._stats["flushes"] += 1
+        self._stats["flushed_rows"] += len(rows)
+        self._stats["max_flush_rows"] = max(self._stats["max_flush_rows"], len(rows))
+        return len(rows)
+
+    def _error(self, e):
+        self._stats["flush_errors"] += 1
+        self._stats["last_error"] = repr(e)
+
+    def _apply_rows(self, rows, replay):
+        """
+        Applies rows in one batch or, if a bad row breaks it, one at a time,
+        setting aside the rows that fail on their own. Returns the rows still to
+        retry (from the first one that failed for some other reason on).
+        """
+        try:
+            self._apply(rows, replay=replay)
+            return []
+        except self.reject_errors as e:
+            self._error(e)
+            if len(rows) == 1:
+                self._reject(rows, e)
+                return []
+        except Exception as e:
+            self._error(e)
+            return rows
+        for i, row in enumerate(rows):
+            try:
+                self._apply([row], replay=replay)
+            except self.reject_errors as e:
+                self._error(e)
+                self._reject([row], e)
+            except Exception as e:
+                self._error(e)
+                return rows[i:]
+        return []
+
+    def _reject(self, rows, error):
+        data = b"".join((json.dumps({"k": kind, "r": row, "error": repr(error)}, separators=(",", ":"),
+                                    default=str) + "\n").encode() for kind, row in rows)
+        with open(self.rejected_path, "ab") as f:
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._stats["rejected_rows"] += len(rows)
+
+    def replay(self):
+        """Applies and removes segments whose writer process is gone."""
+        return self._in_context(self._replay)
+
+    def _replay(self):
+        replayed = 0
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".log"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)   # a live process owns it
+                continue
+            with os.fdopen(os.dup(fd), "rb") as f:
+                rows = []
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break   # torn last line: never acked, since it was not fully written
+                    rows.append((entry["k"], entry["r"]))
+            if rows and self._apply_rows(rows, replay=True):
+                os.close(fd)
+                continue
+            self._drop_segment(path, fd)
+            replayed += len(rows)
+        self._stats["replayed_rows"] += replayed
+        return replayed
+
+    def close(self):
+        """Final flush at interpreter exit; whatever fails stays journaled for replay."""
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending), unapplied_segments=len(self._closed))